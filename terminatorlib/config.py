@@ -76,7 +76,8 @@ from copy import copy
 from configobj import ConfigObj, flatten_errors
 from validate import Validator
 from .borg import Borg
-from .util import dbg, err, DEBUG, get_system_config_dir, get_config_dir, dict_diff
+from .util import dbg, err, DEBUG, get_system_config_dir, get_config_dir, dict_diff, \
+        summarise_layout
 
 from gi.repository import Gio
 
@@ -91,6 +92,7 @@ DEFAULTS = {
             'extra_styling'         : True,
             'tab_position'          : 'top',
             'broadcast_default'     : 'group',
+            'broadcast_mode'        : 'keys',
             'close_button_on_tab'   : True,
             'hide_tabbar'           : False,
             'scroll_tabbar'         : False,
@@ -120,11 +122,23 @@ DEFAULTS = {
             'title_font'            : 'Sans 9',
             'putty_paste_style'     : False,
             'putty_paste_style_source_clipboard': False,
+            'paste_chunk_size'      : 4096,
+            'paste_chunk_interval'  : 10,
+            'drop_tempfile_threshold': 0,
+            'macro_timing'          : False,
+            'scroll_speed'          : 1.0,
+            'kinetic_scrolling'     : True,
             'smart_copy'            : True,
             'clear_select_on_copy'  : False,
             'line_height'           : 1.0,
             'case_sensitive'        : True,
             'invert_search'         : False,
+            'save_session'          : False,
+            'session_save_interval' : 60,
+            'pty_backend'           : False,
+            'pty_backend_buffer_size': 1048576,
+            'balance_focus_weight'  : 1.0,
+            'latency_stats'         : False,
         },
         'keybindings': {
             'zoom_in'          : '<Control>plus',
@@ -151,6 +165,11 @@ DEFAULTS = {
             'paste'            : '<Shift><Control>v',
             'toggle_scrollbar' : '<Shift><Control>s',
             'search'           : '<Shift><Control>f',
+            'prev_prompt'      : '',
+            'next_prompt'      : '',
+            'copy_last_output' : '',
+            'toggle_macro_recording': '',
+            'play_last_macro'  : '',
             'page_up'          : '',
             'page_down'        : '',
             'page_up_half'     : '',
@@ -358,17 +377,25 @@ class Config(object):
         """Delete a layout"""
         if layout in self.base.layouts:
             del(self.base.layouts[layout])
+            self.base.invalidate_layout_summary(layout)
 
     def rename_layout(self, layout, newname):
         """Rename a layout"""
         if layout in self.base.layouts:
             self.base.layouts[newname] = self.base.layouts[layout]
             del(self.base.layouts[layout])
+            self.base.invalidate_layout_summary(layout)
+            self.base.invalidate_layout_summary(newname)
 
     def list_layouts(self):
         """List all configured layouts"""
         return(list(self.base.layouts.keys()))
 
+    def layout_summary(self, layout):
+        """Return the window, tab and terminal counts and the profiles of
+        a layout"""
+        return(self.base.get_layout_summary(layout))
+
     def connect_gsetting_callbacks(self):
         """Get system settings and create callbacks for changes"""
         dbg("GSetting connects for system changes")
@@ -496,6 +523,7 @@ class ConfigBase(Borg):
     keybindings = None
     plugins = None
     layouts = None
+    layout_summaries = None
     command_line_options = None
 
     def __init__(self):
@@ -530,6 +558,8 @@ class ConfigBase(Borg):
             self.layouts = {}
             for layout in DEFAULTS['layouts']:
                 self.layouts[layout] = copy(DEFAULTS['layouts'][layout])
+        if self.layout_summaries is None:
+            self.layout_summaries = {}
 
     def defaults_to_configspec(self):
         """Convert our tree of default values into a ConfigObj validation
@@ -668,6 +698,8 @@ class ConfigBase(Borg):
                     if layout == 'default' and \
                        parser[section_name][layout] == {}:
                            continue
+                    if section.get(layout) != parser[section_name][layout]:
+                        self.invalidate_layout_summary(layout)
                     section[layout] = parser[section_name][layout]
             elif section_name == 'keybindings':
                 if section_name not in parser:
@@ -696,6 +728,7 @@ class ConfigBase(Borg):
     def save(self):
         """Save the config to a file"""
         dbg('ConfigBase::save: saving config')
+        self.invalidate_layout_summary()
         parser = ConfigObj(encoding='utf-8')
         parser.indent_type = '  '
 
@@ -705,6 +738,7 @@ class ConfigBase(Borg):
             parser[section_name] = dict_diff(DEFAULTS[section_name], section)
 
         from .configjson import JSON_PROFILE_NAME, JSON_LAYOUT_NAME
+        from .session import SESSION_LAYOUT_NAME
 
         parser['profiles'] = {}
         for profile in self.profiles:
@@ -716,7 +750,7 @@ class ConfigBase(Borg):
 
         parser['layouts'] = {}
         for layout in self.layouts:
-            if layout == JSON_LAYOUT_NAME:
+            if layout in [JSON_LAYOUT_NAME, SESSION_LAYOUT_NAME]:
                 continue
             dbg('ConfigBase::save: Processing layout: %s' % layout)
             parser['layouts'][layout] = self.layouts[layout]
@@ -820,6 +854,7 @@ class ConfigBase(Borg):
         if name in self.layouts:
             return(False)
         self.layouts[name] = layout
+        self.invalidate_layout_summary(name)
         return(True)
 
     def replace_layout(self, name, layout):
@@ -827,6 +862,7 @@ class ConfigBase(Borg):
         if not name in self.layouts:
             return(False)
         self.layouts[name] = layout
+        self.invalidate_layout_summary(name)
         return(True)
 
     def get_layout(self, layout):
@@ -839,4 +875,22 @@ class ConfigBase(Borg):
     def set_layout(self, layout, tree):
         """Set a layout"""
         self.layouts[layout] = tree
+        self.invalidate_layout_summary(layout)
+
+    def get_layout_summary(self, layout):
+        """Return a cached summary of a layout, or None if it does not
+        exist"""
+        if layout not in self.layouts:
+            return(None)
+        if layout not in self.layout_summaries:
+            self.layout_summaries[layout] = summarise_layout(
+                    self.layouts[layout])
+        return(self.layout_summaries[layout])
+
+    def invalidate_layout_summary(self, layout=None):
+        """Forget the summary of a layout, or of all layouts"""
+        if layout is None:
+            self.layout_summaries.clear()
+        else:
+            self.layout_summaries.pop(layout, None)
 
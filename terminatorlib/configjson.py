@@ -167,7 +167,7 @@ class ConfigJson(object):
         if 'layout' in configjson:
             layout = self.get_layout(configjson['layout'])
             if layout:
-                config.base.layouts[JSON_LAYOUT_NAME] = layout
+                config.layout_set_config(JSON_LAYOUT_NAME, layout)
                 return JSON_LAYOUT_NAME
         
         return None
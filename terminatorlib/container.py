@@ -7,6 +7,7 @@ from gi.repository import Gtk
 
 from .factory import Factory
 from .config import Config
+from . import util
 from .util import dbg, err
 from .translation import _
 from .signalman import Signalman
@@ -21,6 +22,8 @@ class Container(object):
     config = None
     signals = None
     signalman = None
+    layout_fragment = None
+    layout_volatile = False
 
     def __init__(self):
         """Class initialiser"""
@@ -247,16 +250,20 @@ the tab will also close all terminals within it.')
 
     def describe_layout(self, count, parent, global_layout, child_order):
         """Describe our current layout"""
+        fragment = self.get_layout_fragment()
+        return(util.emit_layout_fragment(fragment, count, parent,
+                                         global_layout, child_order))
+
+    def describe_layout_entry(self):
+        """Describe ourselves, without our children, parent or order"""
         layout = {}
         maker = Factory()
         mytype = maker.type(self)
         if not mytype:
             err('unable to detemine own type. %s' % self)
-            return({})
+            return(None)
 
         layout['type'] = mytype
-        layout['parent'] = parent
-        layout['order'] = child_order
 
         if hasattr(self, 'get_position'):
             position = self.get_position()
@@ -299,19 +306,60 @@ the tab will also close all terminals within it.')
                 layout['last_active_window'] = True
             else:
                 layout['last_active_window'] = False
+            if self.get_property('term_zoomed'):
+                layout['zoomed'] = self.zoom_data['widget'].uuid
+                layout['zoom_font_scale'] = self.zoom_data['font_scale']
 
-        name = 'child%d' % count
-        count = count + 1
+        return(layout)
 
-        global_layout[name] = layout
+    def get_layout_fragment(self):
+        """Return the layout fragment describing us and our descendants, for
+        util.emit_layout_fragment(). It is cached until invalidate_layout()
+        is called. Containers that describe state which changes without
+        telling us (window geometry, focus, the current tab) are never cached
+        themselves, but still reuse the cached fragments of their children."""
+        if self.layout_fragment is not None:
+            return(self.layout_fragment)
 
+        entry = self.describe_layout_entry()
+        if entry is None:
+            return([])
+
+        fragment = [('child', entry, None, None)]
         child_order = 0
-        for child in self.get_children():
-            if hasattr(child, 'describe_layout'):
-                count = child.describe_layout(count, name, global_layout, child_order)
+        for child in self.get_layout_children():
+            if hasattr(child, 'get_layout_fragment'):
+                childfragment = child.get_layout_fragment()
+                if childfragment:
+                    prefix, childentry = childfragment[0][0:2]
+                    fragment.append((prefix, childentry, -len(fragment),
+                                     child_order))
+                    fragment.extend(childfragment[1:])
             child_order = child_order + 1
 
-        return(count)
+        if not self.layout_volatile:
+            self.layout_fragment = fragment
+        return(fragment)
+
+    def invalidate_layout(self):
+        """Our layout description has changed, so drop the cached fragment
+        for us and everything above us"""
+        self.layout_fragment = None
+        parent = self.get_parent()
+        if hasattr(parent, 'invalidate_layout'):
+            parent.invalidate_layout()
+
+    def invalidate_tree(self, container=None):
+        """Our children, or those of container below us, have changed, so
+        the Window above us needs to update its tree model"""
+        parent = self.get_parent()
+        if hasattr(parent, 'invalidate_tree'):
+            parent.invalidate_tree(container or self)
+
+    def get_layout_children(self):
+        """Return the children that describe_layout() should descend into.
+        This differs from get_children() while a terminal is zoomed"""
+        return(self.get_children())
 
     def create_layout(self, layout):
         """Apply settings for our layout"""
@@ -33,8 +33,13 @@ class Factory(Borg):
              'Container': 'container',
              'Window': 'window'}
     types_keys = list(types.keys())
+    # A Paned turns from one of these into the other when it is rotated, so
+    # they are told apart by orientation rather than by class
+    paned_types = ['HPaned', 'VPaned']
     instance_types = {}
     instance_types_keys = []
+    classes = None
+    product_types = None
 
     def __init__(self):
         """Class initialiser"""
@@ -42,44 +47,70 @@ class Factory(Borg):
         self.prepare_attributes()
 
     def prepare_attributes(self):
-        """Required by the borg, but a no-op here"""
-        pass
+        """Set up the caches of resolved classes"""
+        if self.classes is None:
+            self.classes = {}
+        if self.product_types is None:
+            self.product_types = {}
+
+    def get_class(self, classtype):
+        """Return the class for one of our type names, importing its module
+        the first time it is asked for"""
+        try:
+            return(self.classes[classtype])
+        except KeyError:
+            pass
+        # Swap order of imports, otherwise we throw ImportError almost
+        # every time
+        try:
+            type_key = 'terminatorlib.%s' % self.types[classtype]
+            if type_key not in self.instance_types_keys:
+                self.instance_types[type_key] = __import__(type_key, None, None, [''])
+                self.instance_types_keys.append(type_key)
+            module = self.instance_types[type_key]
+        except ImportError:
+            type_key = self.types[classtype]
+            if type_key not in self.instance_types_keys:
+                self.instance_types[type_key] = __import__(type_key, None, None, [''])
+                self.instance_types_keys.append(type_key)
+            module = self.instance_types[type_key]
+        self.classes[classtype] = getattr(module, classtype)
+        return(self.classes[classtype])
 
     def isinstance(self, product, classtype):
         """Check if a given product is a particular type of object"""
+        if classtype in self.paned_types:
+            return(self.isinstance(product, 'Paned') and
+                   product.get_paned_type() == classtype)
+        try:
+            return(isinstance(product, self.classes[classtype]))
+        except KeyError:
+            pass
         if classtype in self.types_keys:
-            # This is now very ugly, but now it's fast :-)
-            # Someone with real Python skills should fix this to be less insane.
-            # Optimisations:
-            # - swap order of imports, otherwise we throw ImportError
-            #   almost every time
-            # - cache everything we can
-            try:
-                type_key = 'terminatorlib.%s' % self.types[classtype]
-                if type_key not in self.instance_types_keys:
-                    self.instance_types[type_key] = __import__(type_key, None, None, [''])
-                    self.instance_types_keys.append(type_key)
-                module = self.instance_types[type_key]
-            except ImportError:
-                type_key = self.types[classtype]
-                if type_key not in self.instance_types_keys:
-                    self.instance_types[type_key] = __import__(type_key, None, None, [''])
-                    self.instance_types_keys.append(type_key)
-                module = self.instance_types[type_key]
-            return(isinstance(product, getattr(module, classtype)))
+            return(isinstance(product, self.get_class(classtype)))
         else:
             err('Factory::isinstance: unknown class type: %s' % classtype)
             return(False)
 
     def type(self, product):
         """Determine the type of an object we've previously created"""
+        if self.isinstance(product, 'Paned'):
+            return(product.get_paned_type())
+        cls = product.__class__
+        try:
+            return(self.product_types[cls])
+        except KeyError:
+            pass
+        result = None
         for atype in self.types:
             # Skip over generic types
-            if atype in ['Container', 'Paned']:
+            if atype in ['Container', 'Paned'] + self.paned_types:
                 continue
             if self.isinstance(product, atype):
-                return(atype)
-        return(None)
+                result = atype
+                break
+        self.product_types[cls] = result
+        return(result)
 
     def make(self, product, **kwargs):
         """Make the requested product"""
@@ -92,6 +123,8 @@ class Factory(Borg):
         dbg('Factory::make: created a %s' % product)
         output = func(**kwargs)
         inject_uuid(output)
+        from .terminator import Terminator
+        Terminator().register_uuid(output)
         return(output)
 
     def make_window(self, **kwargs):
@@ -2,7 +2,9 @@
 # GPL v2 only
 """ipc.py - DBus server and API calls"""
 
+import os
 import sys
+import time
 import hashlib
 from gi.repository import Gdk
 import dbus.service
@@ -12,7 +14,18 @@ from .borg import Borg
 from .terminator import Terminator
 from .config import Config
 from .factory import Factory
-from .util import dbg, err, enumerate_descendants
+from .session import SessionStore
+from .paste import Paste
+from .macros import Macros
+from .latency import LatencyMonitor, format_stats
+from .util import dbg, err
+
+# How much of stdin remotinator sends in each call
+SEND_READ_SIZE = 65536
+# How many sends may wait to be written before callers are told to back off
+MAX_SENDS = 64
+# How long remotinator waits, in seconds, before trying a send again
+SEND_RETRY_DELAY = 0.05
 
 CONFIG = Config()
 if not CONFIG['dbus']:
@@ -31,11 +44,16 @@ try:
 except:
     BUS_NAME = BUS_BASE
 
+class SendQueueFull(DBusException):
+    """Too much sent text is still waiting to be written, try again"""
+    _dbus_error_name = '%s.SendQueueFull' % BUS_BASE
+
 class DBusService(Borg, dbus.service.Object):
     """DBus Server class. This is implemented as a Borg"""
     bus_name = None
     bus_path = None
     terminator = None
+    sends = None
 
     def __init__(self):
         """Class initialiser"""
@@ -65,6 +83,8 @@ class DBusService(Borg, dbus.service.Object):
             self.bus_path = BUS_PATH
         if not self.terminator:
             self.terminator = Terminator()
+        if self.sends is None:
+            self.sends = []
 
     @dbus.service.method(BUS_NAME, in_signature='a{ss}')
     def new_window_cmdline(self, options=dbus.Dictionary()):
@@ -73,7 +93,10 @@ class DBusService(Borg, dbus.service.Object):
         oldopts = self.terminator.config.options_get()
         oldopts.__dict__ = options
         self.terminator.config.options_set(oldopts)
-        self.terminator.create_layout(oldopts.layout)
+        layout = oldopts.layout
+        if options.get('restore_session') == 'True':
+            layout = SessionStore().load() or layout
+        self.terminator.create_layout(layout)
         self.terminator.layout_done()
 
     @dbus.service.method(BUS_NAME, in_signature='a{ss}')
@@ -167,35 +190,28 @@ class DBusService(Borg, dbus.service.Object):
     @dbus.service.method(BUS_NAME)
     def get_tab(self, uuid=None):
         """Return the UUID of the parent tab of a given terminal"""
-        maker = Factory()
-        terminal = self.terminator.find_terminal_by_uuid(uuid)
-        window = terminal.get_toplevel()
-        root_widget = window.get_children()[0]
-        if maker.isinstance(root_widget, 'Notebook'):
-            #return root_widget.uuid.urn
-            for tab_child in root_widget.get_children():
-                terms = [tab_child]
-                if not maker.isinstance(terms[0], "Terminal"):
-                    terms = enumerate_descendants(tab_child)[1]
-                if terminal in terms:
-                    # FIXME: There are no uuid's assigned to the the notebook, or the actual tabs!
-                    # This would fail: return root_widget.uuid.urn
-                    return ""
+        label = self.find_tab_label(uuid)
+        if label:
+            return label.uuid.urn
 
     @dbus.service.method(BUS_NAME)
     def get_tab_title(self, uuid=None):
         """Return the title of a parent tab of a given terminal"""
+        label = self.find_tab_label(uuid)
+        if label:
+            return label.get_label()
+
+    def find_tab_label(self, uuid):
+        """Return the label of the tab containing a given terminal, or None
+        if its window has no tabs"""
         maker = Factory()
         terminal = self.terminator.find_terminal_by_uuid(uuid)
         window = terminal.get_toplevel()
         root_widget = window.get_children()[0]
-        if maker.isinstance(root_widget, "Notebook"):
-            for tab_child in root_widget.get_children():
-                terms = [tab_child]
-                if not maker.isinstance(terms[0], "Terminal"):
-                    terms = enumerate_descendants(tab_child)[1]
-                if terminal in terms:
-                    return root_widget.get_tab_label(tab_child).get_label()
+        if maker.isinstance(root_widget, 'Notebook'):
+            return root_widget.get_tab_label(
+                    root_widget.find_tab_root(terminal))
+        return None
 
     @dbus.service.method(BUS_NAME)
     def switch_profile(self, uuid=None, options=dbus.Dictionary()):
@@ -204,6 +220,107 @@ class DBusService(Borg, dbus.service.Object):
         profile_name = options.get('profile')
         terminal.force_set_profile(False, profile_name)
 
+    @dbus.service.method(BUS_NAME)
+    def launch_layout(self, layout):
+        """Open the windows of a named layout"""
+        dbg('dbus method called: launch_layout %s' % layout)
+        config = self.terminator.config
+        if layout not in config.list_layouts():
+            # It may have been saved by another instance since we started
+            config.base.reload()
+        self.terminator.launch_layout(layout)
+
+    @dbus.service.method(BUS_NAME, out_signature='a{sa{sd}}')
+    def get_latency_stats(self, uuid=''):
+        """Return keystroke latency percentiles in milliseconds for each
+        stage, for one terminal or for all of them"""
+        stats = LatencyMonitor().get_stats(uuid)
+        if stats is None:
+            return dbus.Dictionary({}, signature='sa{sd}')
+        return stats
+
+    @dbus.service.method(BUS_NAME, in_signature='sa{ss}', out_signature='i')
+    def send_text(self, text, options=dbus.Dictionary()):
+        """Send text to the terminals chosen by options, as if typed"""
+        return self.send(text.encode('utf-8', 'surrogateescape'), options)
+
+    @dbus.service.method(BUS_NAME, in_signature='aya{ss}', out_signature='i',
+                         byte_arrays=True)
+    def send_bytes(self, data, options=dbus.Dictionary()):
+        """Send bytes to the terminals chosen by options, as if typed"""
+        return self.send(bytes(data), options)
+
+    def find_targets(self, options):
+        """Return the terminals chosen by options: all of them if 'all' is
+        set, the members of 'group', or the terminal 'uuid'. Raises
+        DBusException if there are none"""
+        if options.get('all') == 'True':
+            return list(self.terminator.terminals)
+        elif options.get('group'):
+            members = self.terminator.group_members.get(options['group'], ())
+            terminals = [term for term in self.terminator.terminals
+                         if term in members]
+            if not terminals:
+                raise DBusException('No terminals in group %s' %
+                                    options['group'])
+            return terminals
+        elif options.get('uuid'):
+            terminal = self.terminator.find_terminal_by_uuid(options['uuid'])
+            if not terminal:
+                raise DBusException('Terminal with supplied UUID not found')
+            return [terminal]
+        raise DBusException('No UUID, group or all specified')
+
+    def send(self, data, options):
+        """Queue data for every terminal chosen by options, see
+        find_targets(). Returns how many terminals it will be sent to.
+        Raises SendQueueFull if MAX_SENDS are already waiting"""
+        terminals = self.find_targets(options)
+        if len(self.sends) >= MAX_SENDS:
+            dbg('send queue full, asking the caller to retry')
+            raise SendQueueFull('Too much text is waiting to be sent')
+
+        dbg('dbus method called: send %d bytes to %d terminals' %
+            (len(data), len(terminals)))
+        if data:
+            paste = Paste(data, terminals,
+                          self.terminator.config['paste_chunk_size'],
+                          self.terminator.config['paste_chunk_interval'])
+            paste.connect('finished', self.on_send_finished)
+            self.sends.append(paste)
+            if len(self.sends) == 1:
+                paste.start()
+        return len(terminals)
+
+    def on_send_finished(self, paste):
+        """Start the next send once the last one is written out, so that
+        consecutive calls reach each terminal in the order they were made"""
+        self.sends.remove(paste)
+        if self.sends:
+            self.sends[0].start()
+
+    @dbus.service.method(BUS_NAME)
+    def list_macros(self):
+        """Return the names of all the macros"""
+        return dbus.Array(Macros().list_macros(), signature='s')
+
+    @dbus.service.method(BUS_NAME, in_signature='sa{ss}', out_signature='i')
+    def play_macro(self, name, options=dbus.Dictionary()):
+        """Type a macro into the terminals chosen by options, see
+        find_targets(), with its recorded delays if 'paced' is set"""
+        dbg('dbus method called: play_macro %s' % name)
+        macros = Macros()
+        if not macros.get_macro(name):
+            raise DBusException('No macro called %s' % name)
+        terminals = self.find_targets(options)
+        return macros.play(name, terminals, options.get('paced') == 'True')
+
+    @dbus.service.method(BUS_NAME)
+    def get_macro_playing(self):
+        """Return the terminals a macro is still being typed into"""
+        return dbus.Array([term.uuid.urn for term in Macros().get_playing()],
+                          signature='s')
+
 def with_proxy(func):
     """Decorator function to connect to the session dbus bus"""
     dbg('dbus client call: %s' % func.__name__)
@@ -284,3 +401,79 @@ def switch_profile(session, uuid, options):
     """Call the dbus method to return the title of a tab"""
     session.switch_profile(uuid, options)
 
+@with_proxy
+def launch_layout(session, options):
+    """Call the dbus method to open the windows of a layout"""
+    session.launch_layout(options.get('layout', 'default'))
+
+@with_proxy
+def get_latency_stats(session, options):
+    """Call the dbus method to print keystroke latency percentiles"""
+    stats = session.get_latency_stats(options.get('uuid', ''))
+    if not stats:
+        print('no samples')
+        return
+    print(format_stats(stats))
+
+def get_targets(options):
+    """Pick the options that choose terminals for send and play_macro,
+    defaulting to the terminal we are running in"""
+    targets = {}
+    for key in ['uuid', 'group']:
+        if options.get(key):
+            targets[key] = options[key]
+    if options.get('all'):
+        targets['all'] = 'True'
+    if not targets:
+        targets['uuid'] = os.environ.get('TERMINATOR_UUID', '')
+    return(targets)
+
+@with_proxy
+def send(session, options):
+    """Call the dbus method to send text, or everything on stdin, to a
+    terminal, a group or all terminals"""
+    targets = get_targets(options)
+
+    try:
+        if options.get('text') is not None:
+            session.send_text(options['text'], targets)
+            return
+        stdin = sys.stdin.buffer
+        while True:
+            data = stdin.read1(SEND_READ_SIZE)
+            if not data:
+                break
+            while True:
+                try:
+                    session.send_bytes(dbus.ByteArray(data), targets)
+                    break
+                except DBusException as ex:
+                    if ex.get_dbus_name() != SendQueueFull._dbus_error_name:
+                        raise
+                    time.sleep(SEND_RETRY_DELAY)
+    except DBusException as ex:
+        sys.exit(ex.get_dbus_message())
+
+@with_proxy
+def list_macros(session, options):
+    """Call the dbus method to list the macros"""
+    print('\n'.join(session.list_macros()))
+
+@with_proxy
+def play_macro(session, options):
+    """Call the dbus method to play a macro into a terminal, a group or all
+    terminals"""
+    if not options.get('macro'):
+        sys.exit('No macro specified')
+    targets = get_targets(options)
+    if options.get('paced'):
+        targets['paced'] = 'True'
+    try:
+        session.play_macro(options['macro'], targets)
+    except DBusException as ex:
+        sys.exit(ex.get_dbus_message())
+
+@with_proxy
+def get_macro_playing(session, options):
+    """Call the dbus method to list the terminals still playing a macro"""
+    print('\n'.join(session.get_macro_playing()))
@@ -29,6 +29,10 @@ class KeymapError(Exception):
     """Custom exception for errors in keybinding configurations"""
 
 MODIFIER = re.compile('<([^<]+)>')
+# Keyboards have few enough keys and modifier combinations that this is
+# only reached if something is wrong, but do not grow without bound
+DISPATCH_SIZE = 4096
+
 class Keybindings:
     """Class to handle loading and lookup of Terminator keybindings"""
 
@@ -47,11 +51,21 @@ class Keybindings:
     keys = None
     _masks = None
     _lookup = None
+    _dispatch = None
+    keys_changed_id = None
 
     def __init__(self):
         self.keymap = Gdk.Keymap.get_default()
+        self.keys_changed_id = self.keymap.connect('keys-changed',
+                                                   self.on_keys_changed)
         self.configure({})
 
+    def destroy(self):
+        """Stop listening to the keymap, which outlives us"""
+        if self.keys_changed_id is not None:
+            self.keymap.disconnect(self.keys_changed_id)
+            self.keys_changed_id = None
+
     def configure(self, bindings):
         """Accept new bindings and reconfigure with them"""
         self.keys = bindings
@@ -60,6 +74,7 @@ class Keybindings:
     def reload(self):
         """Parse bindings and mangle into an appropriate form"""
         self._lookup = {}
+        self._dispatch = {}
         self._masks = 0
         for action, bindings in list(self.keys.items()):
             if not isinstance(bindings, tuple):
@@ -113,8 +128,27 @@ class Keybindings:
         except KeyError:
             raise KeymapError("Unhandled modifier '<%s>'" % modifier)
 
+    def on_keys_changed(self, keymap):
+        """The keyboard layout changed, so the keys we have already
+        translated may now mean something else"""
+        self._dispatch = {}
+
     def lookup(self, event):
-        """Translate a keyboard event into a mapped key"""
+        """Translate a keyboard event into a mapped key. The answer for each
+        physical key and modifier state is remembered, so that only the
+        first press of a key has to go through the keymap"""
+        key = (event.hardware_keycode, int(event.get_state()), event.group)
+        try:
+            return self._dispatch[key]
+        except KeyError:
+            pass
+        if len(self._dispatch) > DISPATCH_SIZE:
+            self._dispatch = {}
+        self._dispatch[key] = self.translate(event)
+        return self._dispatch[key]
+
+    def translate(self, event):
+        """Translate a keyboard event into a mapped key, using the keymap"""
         try:
             _found, keyval, _egp, _lvl, consumed = self.keymap.translate_keyboard_state(
                                               event.hardware_keycode, 
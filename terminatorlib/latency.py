@@ -0,0 +1,162 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""latency.py - Measure how long keystrokes take to reach the screen
+
+This is off unless the latency_stats option is set. Then every key press in
+a terminal starts a sample, and the time from the key press to each of these
+stages is recorded the first time the stage is reached:
+
+    broadcast   the key has been passed on to the terminals broadcast to
+    commit      VTE has sent the resulting bytes to the child
+    contents    VTE's contents have changed, usually with the child's echo
+    draw        VTE has started drawing those contents
+
+The most recent samples of each stage are kept for every terminal and for
+the whole application, and summarised as percentiles in milliseconds.
+
+>>> stats = RollingStats(4)
+>>> for sample in [0.001, 0.002, 0.003, 0.004, 0.010]:
+...     stats.add(sample)
+>>> sorted(stats.summary().items())
+[('count', 4.0), ('max', 10.0), ('p50', 3.0), ('p90', 10.0), ('p99', 10.0)]
+"""
+
+import math
+import time
+from collections import deque
+
+from .borg import Borg
+from .config import Config
+from .util import dbg
+
+STAGES = ['broadcast', 'commit', 'contents', 'draw']
+PERCENTILES = [50, 90, 99]
+WINDOW = 1000
+
+def format_stats(stats):
+    """Lay the summary of each stage out as a table"""
+    lines = ['%-10s %8s %8s %8s %8s %8s' % ('stage', 'count', 'p50', 'p90',
+                                            'p99', 'max')]
+    for stage in STAGES:
+        summary = stats.get(stage, {})
+        if not summary.get('count'):
+            lines.append('%-10s %8d' % (stage, 0))
+            continue
+        lines.append('%-10s %8d %8.2f %8.2f %8.2f %8.2f' % (stage,
+                     summary['count'], summary['p50'], summary['p90'],
+                     summary['p99'], summary['max']))
+    return('\n'.join(lines))
+
+class RollingStats(object):
+    """The most recent samples of one measurement, in seconds"""
+
+    samples = None
+
+    def __init__(self, size=WINDOW):
+        """Class initialiser"""
+        self.samples = deque(maxlen=size)
+
+    def add(self, sample):
+        """Record a sample, forgetting the oldest if we are full"""
+        self.samples.append(sample)
+
+    def summary(self):
+        """Return the sample count and nearest-rank percentiles, in ms"""
+        ordered = sorted(self.samples)
+        result = {'count': float(len(ordered))}
+        if not ordered:
+            return(result)
+        for percentile in PERCENTILES:
+            rank = int(math.ceil(percentile / 100.0 * len(ordered))) - 1
+            result['p%d' % percentile] = ordered[max(rank, 0)] * 1000.0
+        result['max'] = ordered[-1] * 1000.0
+        return(result)
+
+class LatencyMonitor(Borg):
+    """Collect keystroke latency samples. This is implemented as a Borg"""
+
+    enabled = None
+    pending = None
+    terminals = None
+    overall = None
+
+    def __init__(self):
+        """Class initialiser"""
+        Borg.__init__(self, self.__class__.__name__)
+        self.prepare_attributes()
+
+    def prepare_attributes(self):
+        """Initialise anything that isn't already"""
+        if self.enabled is None:
+            self.enabled = Config()['latency_stats']
+        if self.pending is None:
+            self.pending = {}
+        if self.terminals is None:
+            self.terminals = {}
+        if self.overall is None:
+            self.overall = dict([(stage, RollingStats()) for stage in STAGES])
+
+    def reconfigure(self):
+        """Pick up a change to the latency_stats option"""
+        self.enabled = Config()['latency_stats']
+        if not self.enabled:
+            self.pending = {}
+
+    def key_pressed(self, terminal):
+        """A key was pressed in terminal, start a new sample"""
+        if self.enabled:
+            self.pending[terminal] = (time.monotonic(), set())
+
+    def reached(self, terminal, stage):
+        """The key last pressed in terminal has reached stage. Each stage
+        counts once per key, and the screen only counts once the contents
+        it shows have changed"""
+        sample = self.pending.get(terminal)
+        if not sample:
+            return
+        start, seen = sample
+        if stage in seen:
+            return
+        if stage == 'draw':
+            if 'contents' not in seen:
+                return
+            del(self.pending[terminal])
+        seen.add(stage)
+
+        elapsed = time.monotonic() - start
+        self.overall[stage].add(elapsed)
+        urn = terminal.uuid.urn
+        if urn not in self.terminals:
+            self.terminals[urn] = dict([(name, RollingStats())
+                                        for name in STAGES])
+        self.terminals[urn][stage].add(elapsed)
+
+    def forget(self, terminal):
+        """Drop everything we know about a terminal that has closed"""
+        self.pending.pop(terminal, None)
+        if terminal.uuid:
+            self.terminals.pop(terminal.uuid.urn, None)
+
+    def get_stats(self, urn=None):
+        """Return the summary of each stage, for one terminal or for all of
+        them. Returns None for a terminal we have no samples for"""
+        if urn:
+            stages = self.terminals.get(urn)
+            if stages is None:
+                return(None)
+        else:
+            stages = self.overall
+        return(dict([(stage, stages[stage].summary()) for stage in STAGES]))
+
+    def reset(self):
+        """Throw away all samples"""
+        dbg('LatencyMonitor::reset: dropping all samples')
+        self.pending = {}
+        self.terminals = {}
+        self.overall = dict([(stage, RollingStats()) for stage in STAGES])
+
+    def report(self):
+        """Return a table of the percentiles for the whole application"""
+        return(format_stats(self.get_stats()))
+
+# vim: set expandtab ts=4 sw=4:
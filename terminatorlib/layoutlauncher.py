@@ -7,7 +7,7 @@ import os
 from gi.repository import Gtk
 from gi.repository import GObject
 
-from .util import dbg, err, spawn_new_terminator
+from .util import dbg, err
 from . import config
 from .translation import _
 from .terminator import Terminator
@@ -54,7 +54,7 @@ class LayoutLauncher:
             icon = self.window.render_icon(Gtk.STOCK_DIALOG_INFO, Gtk.IconSize.BUTTON)
             self.window.set_icon(icon)
 
-        self.window.set_size_request(250, 300)
+        self.window.set_size_request(350, 300)
         self.builder.connect_signals(self)
         self.window.connect('destroy', self.on_destroy_event)
         self.window.show_all()
@@ -74,10 +74,28 @@ class LayoutLauncher:
         self.layouttreestore.clear()
         layouts = self.config.list_layouts()
         for layout in sorted(layouts, key=str.lower):
+            row = [layout] + self.describe_layout(layout)
             if layout != "default":
-                self.layouttreestore.append([layout])
+                self.layouttreestore.append(row)
             else:
-                self.layouttreestore.prepend([layout])
+                self.layouttreestore.prepend(row)
+
+    def describe_layout(self, layout):
+        """Return the summary and profile list shown for a layout"""
+        summary = self.config.layout_summary(layout)
+        if not summary:
+            return(['', ''])
+        parts = []
+        if summary['windows'] > 1:
+            parts.append(_('%d windows') % summary['windows'])
+        if summary['tabs'] > summary['windows']:
+            parts.append(_('%d tabs') % summary['tabs'])
+        if summary['terminals'] == 1:
+            parts.append(_('1 terminal'))
+        else:
+            parts.append(_('%d terminals') % summary['terminals'])
+        profiles = _('Profiles: %s') % ', '.join(summary['profiles'])
+        return([', '.join(parts), profiles])
 
     def on_launchbutton_clicked(self, widget):
         """Handle button click"""
@@ -98,7 +116,26 @@ class LayoutLauncher:
             (listmodel, rowiter) = selection.get_selected()
         layout = listmodel.get_value(rowiter, 0)
         dbg('Clicked for %s' % layout)
-        spawn_new_terminator(self.terminator.origcwd, ['-u', '-l', layout])
+        if self.terminator.dbus_name or not self.launch_remote(layout):
+            self.terminator.launch_layout(layout)
+
+    def launch_remote(self, layout):
+        """Ask the master Terminator process to open a layout, so that we
+        do not pay for starting a new one. Returns False if there is no
+        master to ask"""
+        try:
+            import dbus
+            from . import ipc
+            bus = dbus.SessionBus()
+            proxy = bus.get_object(ipc.BUS_NAME, ipc.BUS_PATH)
+            proxy.launch_layout(layout)
+        except ImportError:
+            dbg('dbus not available, launching %s here' % layout)
+            return(False)
+        except dbus.DBusException as ex:
+            dbg('no master process, launching %s here: %s' % (layout, ex))
+            return(False)
+        return(True)
 
 if __name__ == '__main__':
     from . import util
@@ -0,0 +1,309 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""macros.py - Record what is typed into a terminal and play it back
+
+While a terminal is recording, everything it sends its child is kept, along
+with how long after the previous input it arrived if the recording is timed.
+Input that arrives close together is merged, so a macro is a short list of
+(delay in seconds, text) steps. Macros are kept as JSON in the config
+directory.
+
+A macro is played into any number of terminals with feed_child(), either at
+full speed through the chunked Paste writer or step by step with the
+recorded delays. Every terminal finishes in its own time.
+
+>>> macro = Macro('demo', [(0.0, 'ls'), (0.005, ' -l'), (1.5, '\\r')])
+>>> macro.steps
+[(0.0, 'ls -l'), (1.5, '\\r')]
+>>> macro.get_data()
+b'ls -l\\r'
+>>> Macro.from_json('demo', macro.to_json()).steps == macro.steps
+True
+"""
+
+import os
+import json
+import time
+import tempfile
+from gi.repository import GObject, GLib
+
+from .borg import Borg
+from .config import Config
+from .paste import Paste
+from .util import dbg, err, get_config_dir
+
+# Input closer together than this many seconds is one step
+MERGE_DELAY = 0.05
+
+class Macro(object):
+    """A recorded sequence of input"""
+
+    name = None
+    steps = None
+
+    def __init__(self, name, steps=None):
+        """Class initialiser"""
+        self.name = name
+        self.steps = []
+        for delay, text in steps or []:
+            self.add(delay, text)
+
+    def add(self, delay, text):
+        """Append text that was typed delay seconds after the last step"""
+        if self.steps and delay < MERGE_DELAY:
+            last_delay, last_text = self.steps[-1]
+            self.steps[-1] = (last_delay, last_text + text)
+        else:
+            self.steps.append((round(delay, 3), text))
+
+    def get_data(self):
+        """Return everything the macro types, as bytes"""
+        text = ''.join([text for _delay, text in self.steps])
+        return(text.encode('utf-8', 'surrogateescape'))
+
+    def is_timed(self):
+        """Whether playing the macro paced would be any different"""
+        return(len(self.steps) > 1)
+
+    def to_json(self):
+        """Return the steps in a form json can store"""
+        return([[delay, text] for delay, text in self.steps])
+
+    @classmethod
+    def from_json(cls, name, steps):
+        """Make a macro from what to_json() returned"""
+        return(cls(name, [(float(delay), text) for delay, text in steps]))
+
+class PacedPlayer(GObject.GObject):
+    """Play a macro into a number of terminals with its recorded delays"""
+
+    __gsignals__ = {
+        'terminal-finished': (GObject.SignalFlags.RUN_LAST, None,
+                              (GObject.TYPE_PYOBJECT,)),
+        'finished': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    macro = None
+    positions = None
+    timeouts = None
+
+    def __init__(self, macro, terminals):
+        """Class initialiser"""
+        GObject.GObject.__init__(self)
+        self.macro = macro
+        self.positions = dict([(terminal, 0) for terminal in terminals])
+        self.timeouts = {}
+
+    def start(self):
+        """Start typing into every terminal"""
+        for terminal in self.positions:
+            self.schedule(terminal)
+        if not self.timeouts:
+            self.emit('finished')
+
+    def schedule(self, terminal):
+        """Wait for the next step of a terminal"""
+        delay, _text = self.macro.steps[self.positions[terminal]]
+        self.timeouts[terminal] = GLib.timeout_add(int(delay * 1000),
+                                                   self.on_step, terminal)
+
+    def on_step(self, terminal):
+        """Type the next step into a terminal"""
+        if not terminal.vte:
+            return(self.done(terminal))
+        position = self.positions[terminal]
+        terminal.feed(self.macro.steps[position][1].encode('utf-8',
+                                                           'surrogateescape'))
+        self.positions[terminal] = position + 1
+        if position + 1 >= len(self.macro.steps):
+            return(self.done(terminal))
+        self.schedule(terminal)
+        return(False)
+
+    def done(self, terminal):
+        """A terminal has had the whole macro"""
+        del(self.timeouts[terminal])
+        self.emit('terminal-finished', terminal)
+        if not self.timeouts:
+            self.emit('finished')
+        return(False)
+
+    def forget(self, terminal):
+        """Stop typing into a terminal that has closed"""
+        timeout = self.timeouts.get(terminal)
+        if timeout is not None:
+            GLib.source_remove(timeout)
+            self.done(terminal)
+
+class Macros(Borg):
+    """Record, store and play macros. This is implemented as a Borg"""
+
+    config = None
+    filename = None
+    macros = None
+    recordings = None
+    players = None
+    playing = None
+    last = None
+
+    def __init__(self):
+        """Class initialiser"""
+        Borg.__init__(self, self.__class__.__name__)
+        self.prepare_attributes()
+
+    def prepare_attributes(self):
+        """Initialise anything that isn't already"""
+        if not self.config:
+            self.config = Config()
+        if not self.filename:
+            self.filename = os.path.join(get_config_dir(), 'macros')
+        if self.recordings is None:
+            self.recordings = {}
+        if self.players is None:
+            self.players = []
+        if self.playing is None:
+            self.playing = {}
+        if self.macros is None:
+            self.macros = {}
+            self.load()
+
+    def load(self):
+        """Read the saved macros, if there are any"""
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename) as fileobj:
+                data = json.load(fileobj)
+            for name, steps in data.items():
+                self.macros[name] = Macro.from_json(name, steps)
+        except (OSError, ValueError, TypeError) as ex:
+            err('unable to load macros from %s: %s' % (self.filename, ex))
+
+    def save(self):
+        """Write every macro out. The file is replaced atomically"""
+        data = dict([(name, macro.to_json())
+                     for name, macro in self.macros.items()])
+        dirname = os.path.dirname(self.filename)
+        tmpname = None
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(prefix='.macros', dir=dirname)
+            with os.fdopen(fd, 'w') as fileobj:
+                json.dump(data, fileobj, separators=(',', ':'))
+            os.replace(tmpname, self.filename)
+        except (OSError, TypeError, ValueError) as ex:
+            err('unable to save macros to %s: %s' % (self.filename, ex))
+            if tmpname and os.path.exists(tmpname):
+                os.unlink(tmpname)
+
+    def list_macros(self):
+        """Return the names of every macro"""
+        return(sorted(self.macros, key=str.lower))
+
+    def get_macro(self, name):
+        """Return the macro called name, or None"""
+        return(self.macros.get(name))
+
+    def delete(self, name):
+        """Throw a macro away"""
+        if self.macros.pop(name, None):
+            if self.last == name:
+                self.last = None
+            self.save()
+
+    def is_recording(self, terminal):
+        """Whether terminal is recording"""
+        return(terminal in self.recordings)
+
+    def start_recording(self, terminal, timed):
+        """Start keeping what terminal sends its child"""
+        dbg('recording a %s macro' % ('timed' if timed else 'untimed'))
+        self.recordings[terminal] = (Macro(None), timed, time.monotonic())
+
+    def record(self, terminal, text):
+        """terminal sent text to its child"""
+        recording = self.recordings.get(terminal)
+        if not recording:
+            return
+        macro, timed, last = recording
+        now = time.monotonic()
+        macro.add(now - last if timed else 0.0, text)
+        self.recordings[terminal] = (macro, timed, now)
+
+    def stop_recording(self, terminal, name=None, replace=False):
+        """Stop recording terminal, and keep what it recorded as name unless
+        name is None or nothing was typed. Returns the macro or None. If
+        there is already a macro called name and replace is not set, the
+        recording carries on and None is returned"""
+        if name in self.macros and not replace and \
+           self.recordings.get(terminal):
+            err('there is already a macro called %s' % name)
+            return(None)
+        macro, _timed, _last = self.recordings.pop(terminal, (None,) * 3)
+        if not macro or not name or not macro.steps:
+            dbg('dropping recorded macro')
+            return(None)
+        macro.name = name
+        if macro.steps[0][0]:
+            # Nobody wants to wait for the first step
+            macro.steps[0] = (0.0, macro.steps[0][1])
+        self.macros[name] = macro
+        self.last = name
+        self.save()
+        return(macro)
+
+    def play(self, name, terminals, paced=False):
+        """Type the macro called name into terminals, with its recorded
+        delays if paced. Returns how many terminals it is typed into"""
+        macro = self.macros.get(name)
+        if not macro:
+            err('no macro called %s' % name)
+            return(0)
+        terminals = [term for term in terminals if term.vte]
+        if not terminals:
+            return(0)
+        dbg('playing macro %s into %d terminals%s' % (name, len(terminals),
+            ' paced' if paced else ''))
+        self.last = name
+        if paced and macro.is_timed():
+            player = PacedPlayer(macro, terminals)
+        else:
+            player = Paste(macro.get_data(), terminals,
+                           self.config['paste_chunk_size'],
+                           self.config['paste_chunk_interval'])
+        for terminal in terminals:
+            self.playing[terminal] = self.playing.get(terminal, 0) + 1
+        player.connect('terminal-finished', self.on_terminal_finished)
+        player.connect('finished', self.on_player_finished)
+        self.players.append(player)
+        player.start()
+        return(len(terminals))
+
+    def on_terminal_finished(self, _player, terminal):
+        """A terminal has had all of a macro"""
+        count = self.playing.get(terminal, 0) - 1
+        if count > 0:
+            self.playing[terminal] = count
+        else:
+            self.playing.pop(terminal, None)
+
+    def on_player_finished(self, player):
+        """A macro has been typed into every terminal, or was cancelled"""
+        if player in self.players:
+            self.players.remove(player)
+        if not self.players:
+            self.playing = {}
+
+    def get_playing(self):
+        """Return the terminals a macro is still being typed into"""
+        return(list(self.playing))
+
+    def forget(self, terminal):
+        """Drop a terminal that has closed, and stop typing into it"""
+        self.recordings.pop(terminal, None)
+        for player in self.players[:]:
+            player.forget(terminal)
+        self.playing.pop(terminal, None)
+
+# vim: set expandtab ts=4 sw=4:
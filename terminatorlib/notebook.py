@@ -14,7 +14,7 @@ from .factory import Factory
 from .container import Container
 from .editablelabel import EditableLabel
 from .translation import _
-from .util import err, dbg, enumerate_descendants, make_uuid
+from .util import err, dbg, enumerate_descendants, make_uuid, inject_uuid
 
 class Notebook(Container, Gtk.Notebook):
     """Class implementing a Gtk.Notebook container"""
@@ -22,6 +22,7 @@ class Notebook(Container, Gtk.Notebook):
     last_active_term = None
     pending_on_tab_switch = None
     pending_on_tab_switch_args = None
+    layout_volatile = True
 
     def __init__(self, window):
         """Class initialiser"""
@@ -37,6 +38,9 @@ class Notebook(Container, Gtk.Notebook):
         self.register_signals(Notebook)
         self.connect('switch-page', self.deferred_on_tab_switch)
         self.connect('scroll-event', self.on_scroll_event)
+        for signal in ['page-added', 'page-removed', 'page-reordered']:
+            self.connect(signal, self.on_pages_changed)
+        self.connect('switch-page', self.on_page_shown)
         self.configure()
 
         child = window.get_child()
@@ -148,8 +152,10 @@ class Notebook(Container, Gtk.Notebook):
             err('Notebook::split_axis: %s not found in Notebook' % widget)
             return
 
+        # The label moves to the new page with its UUID, so it stays indexed
         label = self.get_tab_label(widget)
-        self.remove(widget)
+        self.remove_page(page_num)
+        self.disconnect_child(widget)
 
         maker = Factory()
         if vertical:
@@ -205,6 +211,7 @@ class Notebook(Container, Gtk.Notebook):
             err('%s not found in Notebook. Actual parent is: %s' % 
                     (widget, widget.get_parent()))
             return(False)
+        self.terminator.deregister_uuid(self.get_tab_label(widget))
         self.remove_page(page_num)
         self.disconnect_child(widget)
         return(True)
@@ -212,8 +219,9 @@ class Notebook(Container, Gtk.Notebook):
     def replace(self, oldwidget, newwidget):
         """Replace a tab's contents with a new widget"""
         page_num = self.page_num(oldwidget)
+        metadata = self.get_child_metadata(oldwidget)
         self.remove(oldwidget)
-        self.add(newwidget)
+        self.add(newwidget, metadata)
         self.reorder_child(newwidget, page_num)
 
     def get_child_metadata(self, widget):
@@ -228,6 +236,9 @@ class Notebook(Container, Gtk.Notebook):
             metadata['label'] = label.get_custom_label()
         else:
             dbg('don\'t grab the label as it was not customised')
+        if label:
+            # Keep the tab's UUID when its contents are replaced
+            metadata['uuid'] = label.uuid
         return metadata
 
     def get_children(self):
@@ -287,6 +298,11 @@ class Notebook(Container, Gtk.Notebook):
         if metadata and 'label' in metadata:
             dbg('creating TabLabel with text: %s' % metadata['label'])
             label.set_custom_label(metadata['label'])
+        if metadata and 'uuid' in metadata:
+            label.uuid = metadata['uuid']
+        else:
+            inject_uuid(label)
+        self.terminator.register_uuid(label, 'Tab')
         label.connect('close-clicked', self.closetab)
 
         label.show_all()
@@ -359,15 +375,8 @@ class Notebook(Container, Gtk.Notebook):
             result = self.construct_confirm_close(self.window, _('tab'))
 
             if result == Gtk.ResponseType.ACCEPT:
-                containers = None
-                objects = None
                 containers, objects = enumerate_descendants(child)
-
-                while len(objects) > 0:
-                    descendant = objects.pop()
-                    descendant.close()
-                    while Gtk.events_pending():
-                        Gtk.main_iteration()
+                self.terminator.close_terminals(objects)
                 return
             else:
                 dbg('Notebook::closetab: user cancelled request')
@@ -426,6 +435,8 @@ class Notebook(Container, Gtk.Notebook):
         if self.get_n_pages() == 1:
             dbg('Last page, removing self')
             child = self.get_nth_page(0)
+            self.terminator.deregister_uuid(self.get_tab_label(child))
+            self.terminator.deregister_uuid(self)
             self.remove_page(0)
             parent = self.get_parent()
             parent.remove(self)
@@ -497,6 +508,16 @@ class Notebook(Container, Gtk.Notebook):
                 GObject.idle_add(term.ensure_visible_and_focussed)
         return True
 
+    def on_pages_changed(self, notebook, child, page_num):
+        """A tab was added, removed or moved"""
+        self.invalidate_tree()
+
+    def on_page_shown(self, notebook, page, page_num):
+        """A different set of terminals is now visible"""
+        window = self.get_toplevel()
+        if hasattr(window, 'invalidate_geometry'):
+            window.invalidate_geometry()
+
     def on_scroll_event(self, notebook, event):
         '''Handle scroll events for scrolling through tabs'''
         #print "self: %s" % self
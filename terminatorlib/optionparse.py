@@ -88,6 +88,9 @@ icon for the window (by file or name)'))
             help=_('Set a custom WM_WINDOW_ROLE property on the window'))
     parser.add_option('-l', '--layout', dest='layout', 
             help=_('Launch with the given layout'))
+    parser.add_option('--restore-session', action='store_true',
+            dest='restore_session',
+            help=_('Launch with the last saved session'))
     parser.add_option('-s', '--select-layout', action='store_true',
             dest='select', help=_('Select a layout from a list'))
     parser.add_option('-p', '--profile', dest='profile', 
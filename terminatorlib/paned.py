@@ -1,7 +1,10 @@
 # Terminator by Chris Jones <cmsj@tenshu.net>
 # GPL v2 only
-"""paned.py - a base Paned container class and the vertical/horizontal
-variants"""
+"""paned.py - a Paned container class, split vertically or horizontally
+
+There is one Paned class, and whether a Paned is an HPaned or a VPaned comes
+from its orientation, so that rotating a layout can turn the existing Paneds
+round rather than replacing them."""
 
 import time
 from gi.repository import GObject, Gtk, Gdk
@@ -13,8 +16,8 @@ from .container import Container
 
 # pylint: disable-msg=R0921
 # pylint: disable-msg=E1101
-class Paned(Container):
-    """Base class for Paned Containers"""
+class Paned(Container, Gtk.Paned):
+    """Merge Gtk.Paned into our base Container"""
 
     position = None
     maker = None
@@ -22,7 +25,7 @@ class Paned(Container):
     last_balance_time = 0
     last_balance_args = None
 
-    def __init__(self):
+    def __init__(self, orientation=Gtk.Orientation.HORIZONTAL):
         """Class initialiser"""
         self.terminator = Terminator()
         self.maker = Factory()
@@ -31,6 +34,30 @@ class Paned(Container):
                              'flags': GObject.SignalFlags.RUN_LAST,
                              'return_type': None, 
                              'param_types': (GObject.TYPE_STRING,)})
+        GObject.GObject.__init__(self, orientation=orientation)
+        self.props.wide_handle = True
+        self.register_signals(Paned)
+        self.cnxids.new(self, 'button-press-event', self.on_button_press)
+        self.cnxids.new(self, 'button-release-event', self.on_button_release)
+        self.cnxids.new(self, 'notify::position', self.on_position_notify)
+
+    def is_vertical(self):
+        """Whether we are split top and bottom"""
+        return(self.get_orientation() == Gtk.Orientation.VERTICAL)
+
+    def get_paned_type(self):
+        """Return the type we are saved and made as, HPaned or VPaned"""
+        return('VPaned' if self.is_vertical() else 'HPaned')
+
+    def get_length(self):
+        """Return the size we split"""
+        if self.is_vertical():
+            return(self.get_allocated_height())
+        return(self.get_allocated_width())
+
+    def set_pos(self, pos):
+        Gtk.Paned.set_position(self, pos)
+        self.set_property('position-set',  True)
 
 
     # pylint: disable-msg=W0613
@@ -89,6 +116,8 @@ class Paned(Container):
             self.children.append(widget)
         else:
             raise ValueError('Paned widgets can only have two children')
+        self.invalidate_layout()
+        self.invalidate_tree()
 
         if self.maker.isinstance(widget, 'Terminal'):
             top_window = self.get_toplevel()
@@ -174,12 +203,17 @@ class Paned(Container):
             if maker.type(child) == maker.type(self):
                 child.set_autoresize(autoresize)
 
-    def do_redistribute(self, recurse_up=False, recurse_down=False):
-        """Evenly divide available space between sibling panes"""
+    def do_redistribute(self, recurse_up=False, recurse_down=False,
+                        weights=None):
+        """Divide available space between sibling panes, evenly unless
+        weights maps some of them to a larger or smaller share"""
         maker = Factory()
+        if weights is None:
+            weights = self.get_balance_weights()
         #1 Find highest ancestor of the same type => ha
         highest_ancestor = self
-        while type(highest_ancestor.get_parent()) == type(highest_ancestor):
+        while maker.type(highest_ancestor.get_parent()) == \
+              maker.type(highest_ancestor):
             highest_ancestor = highest_ancestor.get_parent()
 
         highest_ancestor.set_autoresize(False)
@@ -189,61 +223,88 @@ class Paned(Container):
             grandfather=highest_ancestor.get_parent()
             if maker.isinstance(grandfather, 'VPaned') or \
                maker.isinstance(grandfather, 'HPaned') :
-                grandfather.do_redistribute(recurse_up, recurse_down)
+                grandfather.do_redistribute(recurse_up, recurse_down, weights)
 
-        highest_ancestor._do_redistribute(recurse_up, recurse_down)
+        highest_ancestor._do_redistribute(recurse_up, recurse_down, weights)
 
         GObject.idle_add(highest_ancestor.set_autoresize, True)
+
+    def get_balance_weights(self):
+        """Return the weights to balance with. Every pane has a weight of 1,
+        except the one holding the focused terminal, which gets the
+        balance_focus_weight option"""
+        weights = {}
+        factor = self.terminator.config['balance_focus_weight']
+        toplevel = self.get_toplevel()
+        if factor == 1 or not hasattr(toplevel, 'get_focussed_terminal'):
+            return(weights)
+        # Whichever of its ancestors a Paned sees as a pane gets the weight
+        widget = toplevel.get_focussed_terminal()
+        while widget is not None and widget is not toplevel:
+            weights[widget] = factor
+            widget = widget.get_parent()
+        return(weights)
     
-    def _do_redistribute(self, recurse_up=False, recurse_down=False):
+    def _do_redistribute(self, recurse_up=False, recurse_down=False,
+                         weights=None):
         maker = Factory()
-        #2 Make a list of self + all children of same type
-        tree = [self, [], 0, None]
-        toproc = [tree]
-        number_splits = 1
+        if weights is None:
+            weights = {}
+        #2 Make a list of self + all children of same type, parents first
+        order = []
+        toproc = [self]
         while toproc:
-            curr = toproc.pop(0)
-            for child in curr[0].get_children():
-                if type(child) == type(curr[0]):
-                    childset = [child, [], 0, curr]
-                    curr[1].append(childset)
-                    toproc.append(childset)
-                    number_splits = number_splits+1
+            paned = toproc.pop()
+            order.append(paned)
+            for child in paned.get_children():
+                if maker.type(child) == maker.type(paned):
+                    toproc.append(child)
+                # (1c) If Shift modifier, redistribute lower sections too
+                elif recurse_down and \
+                  (maker.isinstance(child, 'VPaned') or \
+                   maker.isinstance(child, 'HPaned')):
+                    child.do_redistribute(False, True, weights)
+
+        #3 Total up the weight and number of panes below each of them
+        totals = {}
+        for paned in reversed(order):
+            weight = 0
+            count = 0
+            for child in paned.get_children():
+                if child in totals:
+                    weight += totals[child][0]
+                    count += totals[child][1]
                 else:
-                    curr[1].append([None,[], 1, None])
-                    p = curr
-                    while p:
-                        p[2] = p[2] + 1
-                        p = p[3]
-                    # (1c) If Shift modifier, redistribute lower sections too
-                    if recurse_down and \
-                      (maker.isinstance(child, 'VPaned') or \
-                       maker.isinstance(child, 'HPaned')):
-                        child.do_redistribute(False, True)
-                    
-        #3 Get ancestor x/y => a, and handle size => hs
-        avail_pixels=self.get_length()
+                    weight += weights.get(child, 1)
+                    count += 1
+            totals[paned] = (weight, count)
+
+        #4 Share the space left after the handles out by weight
+        avail_pixels = self.get_length()
         handle_size = self.get_handlesize()
-        #4 Math! eek (a - (n * hs)) / (n + 1) = single size => s
-        single_size = (avail_pixels - (number_splits * handle_size)) / (number_splits + 1)
-        arr_sizes = [single_size]*(number_splits+1)
-        for i in range(avail_pixels % (number_splits + 1)):
-            arr_sizes[i] = arr_sizes[i] + 1
-        #5 Descend down setting the handle position to s
-        #  (Has to handle nesting properly)
-        toproc = [tree]
-        while toproc:
-            curr = toproc.pop(0)
-            for child in curr[1]:
-                toproc.append(child)
-                if curr[1].index(child) == 0:
-                    curr[0].set_position((child[2]*single_size)+((child[2]-1)*handle_size))
+        weight = totals[self][0]
+        if weight <= 0:
+            return
+        unit = max(avail_pixels - (len(order) * handle_size), 0) / weight
+
+        #5 Each handle goes after the panes before it and their handles.
+        #  Work them all out first, so they are applied together
+        positions = []
+        for paned in order:
+            child = paned.get_child1()
+            weight, count = totals.get(child, (weights.get(child, 1), 1))
+            positions.append((paned, int(round(weight * unit +
+                                               (count - 1) * handle_size))))
+        for paned, position in positions:
+            paned.set_position(position)
 
     def remove(self, widget):
         """Remove a widget from the container"""
         Gtk.Paned.remove(self, widget)
         self.disconnect_child(widget)
         self.children.remove(widget)
+        self.invalidate_layout()
+        self.invalidate_tree()
         return(True)
 
     def get_children(self):
@@ -253,6 +314,17 @@ class Paned(Container):
         children.append(self.get_child2())
         return(children)
 
+    def get_layout_children(self):
+        """Return our children, putting back a terminal that has been
+        zoomed out of us"""
+        children = self.get_children()
+        if None in children:
+            for window in self.terminator.windows:
+                zoom_data = window.zoom_data
+                if zoom_data and zoom_data['old_parent'] is self:
+                    children[children.index(None)] = zoom_data['widget']
+        return(children)
+
     def get_child_metadata(self, widget):
         """Return metadata about a child"""
         metadata = {}
@@ -302,6 +374,7 @@ class Paned(Container):
             dbg('metadata obtained for %s: %s' % (self, metadata))
             parent.remove(self)
             self.cnxids.remove_all()
+            self.terminator.deregister_uuid(self)
             parent.add(sibling, metadata)
             if cur_tabnum:
                 notebook.set_current_page(cur_tabnum)
@@ -323,11 +396,12 @@ class Paned(Container):
             child = self.children[0]
             self.remove(child)
             parent.replace(self, child)
+            self.terminator.deregister_uuid(self)
             del(self)
 
     def resizeterm(self, widget, keyname):
         """Handle a keyboard event requesting a terminal resize"""
-        if keyname in ['up', 'down'] and isinstance(self, Gtk.VPaned):
+        if keyname in ['up', 'down'] and self.is_vertical():
             # This is a key we can handle
             position = self.get_position()
 
@@ -340,7 +414,7 @@ class Paned(Container):
                 self.set_position(position - fontheight)
             else:
                 self.set_position(position + fontheight)
-        elif keyname in ['left', 'right'] and isinstance(self, Gtk.HPaned):
+        elif keyname in ['left', 'right'] and not self.is_vertical():
             # This is a key we can handle
             position = self.get_position()
 
@@ -415,59 +489,73 @@ class Paned(Container):
         # Set the position with ratio. For some reason more reliable than by pos.
         if 'ratio' in layout:
             self.ratio = float(layout['ratio'])
+            self.invalidate_layout()
             self.set_position_by_ratio()
 
     def grab_focus(self):
         """We don't want focus, we want a Terminal to have it"""
         self.get_child1().grab_focus()
 
-    def rotate_recursive(self, parent, w, h, clockwise):
+    def rotate_tree(self, w, h, clockwise):
         """
-        Recursively rotate "self" into a new paned that'll have "w" x "h" size. Attach it to "parent".
-
-        As discussed in LP#1522542, we should build up the new layout (including the separator positions)
-        in a single step. We can't rely on Gtk+ computing the allocation sizes yet, so we have to do the
-        computation ourselves and carry the resulting paned sizes all the way down the widget tree.
+        Rotate "self" and the Paneds below it in place, for a new size of "w" x "h".
+
+        Taking a terminal out of its Paned unrealizes its VTE, which then has to
+        be realized, allocated and redrawn from scratch. So each Paned changes
+        orientation and keeps its children. Where they have to change places,
+        they are moved with Gtk.Widget.reparent(), which keeps them realized.
+        As in LP#1522542, the separator positions are worked out here and
+        carried down the tree, rather than waiting for Gtk+ to allocate the
+        new sizes.
         """
-        maker = Factory()
         handle_size = self.get_handlesize()
+        vertical = self.is_vertical()
 
-        if isinstance(self, HPaned):
-            container = VPaned()
-            reverse = not clockwise
-        else:
-            container = HPaned()
-            reverse = clockwise
+        # Turning clockwise, the left goes to the top and the top to the right
+        if vertical == clockwise:
+            self.swap_children()
+            self.ratio = 1 - self.ratio
 
-        container.ratio = self.ratio
-        children = self.get_children()
-        if reverse:
-            container.ratio = 1 - container.ratio
-            children.reverse()
-
-        if isinstance(self, HPaned):
-            w1 = w2 = w
-            h1 = pos = self.position_by_ratio(h, handle_size, container.ratio)
-            h2 = max(h - h1 - handle_size, 0)
-        else:
+        if vertical:
+            self.set_orientation(Gtk.Orientation.HORIZONTAL)
             h1 = h2 = h
-            w1 = pos = self.position_by_ratio(w, handle_size, container.ratio)
+            w1 = pos = self.position_by_ratio(w, handle_size, self.ratio)
             w2 = max(w - w1 - handle_size, 0)
-
-        container.set_pos(pos)
-        parent.add(container)
-
-        if maker.isinstance(children[0], 'Terminal'):
-            children[0].get_parent().remove(children[0])
-            container.add(children[0])
         else:
-            children[0].rotate_recursive(container, w1, h1, clockwise)
+            self.set_orientation(Gtk.Orientation.VERTICAL)
+            w1 = w2 = w
+            h1 = pos = self.position_by_ratio(h, handle_size, self.ratio)
+            h2 = max(h - h1 - handle_size, 0)
 
-        if maker.isinstance(children[1], 'Terminal'):
-            children[1].get_parent().remove(children[1])
-            container.add(children[1])
-        else:
-            children[1].rotate_recursive(container, w2, h2, clockwise)
+        children = self.get_children()
+        if self.maker.isinstance(children[0], 'Paned'):
+            children[0].rotate_tree(w1, h1, clockwise)
+        if self.maker.isinstance(children[1], 'Paned'):
+            children[1].rotate_tree(w2, h2, clockwise)
+
+        self.set_pos(pos)
+        self.invalidate_layout()
+
+    def swap_children(self):
+        """Swap our two children round without unrealizing them. Their
+        signal handlers stay connected, as they never leave us for good"""
+        first, second = self.get_children()
+        holder = Gtk.OffscreenWindow()
+        box = Gtk.Box()
+        holder.add(box)
+        holder.show_all()
+        # reparent() only keeps a widget realized if it goes to a realized
+        # parent, and it does nothing if that is the parent it already has
+        for child in (first, second):
+            child.reparent(box)
+        for child in (second, first):
+            child.reparent(self)
+        holder.destroy()
+        for child in (second, first):
+            self.child_set_property(child, 'resize', False)
+            self.child_set_property(child, 'shrink', True)
+        self.children = [second, first]
+        self.invalidate_tree()
 
     def new_size(self, widget, allocation):
         if self.get_toplevel().set_pos_by_ratio:
@@ -497,46 +585,22 @@ class Paned(Container):
 
     def set_position(self, pos):
         newratio = self.ratio_by_position(self.get_length(), self.get_handlesize(), pos)
-        if newratio is not None:
+        if newratio is not None and newratio != self.ratio:
             self.ratio = newratio
+            self.invalidate_layout()
         self.set_pos(pos)
 
-class HPaned(Paned, Gtk.HPaned):
-    """Merge Gtk.HPaned into our base Paned Container"""
-    def __init__(self):
-        """Class initialiser"""
-        Paned.__init__(self)
-        GObject.GObject.__init__(self)
-        self.props.wide_handle = True
-        self.register_signals(HPaned)
-        self.cnxids.new(self, 'button-press-event', self.on_button_press)
-        self.cnxids.new(self, 'button-release-event', self.on_button_release)
-
-    def get_length(self):
-        return(self.get_allocated_width())
-
-    def set_pos(self, pos):
-        Gtk.HPaned.set_position(self, pos)
-        self.set_property('position-set',  True)
-
-class VPaned(Paned, Gtk.VPaned):
-    """Merge Gtk.VPaned into our base Paned Container"""
-    def __init__(self):
-        """Class initialiser"""
-        Paned.__init__(self)
-        GObject.GObject.__init__(self)
-        self.props.wide_handle = True
-        self.register_signals(VPaned)
-        self.cnxids.new(self, 'button-press-event', self.on_button_press)
-        self.cnxids.new(self, 'button-release-event', self.on_button_release)
+    def on_position_notify(self, widget, pspec):
+        """Our handle has moved, so our layout description is stale"""
+        self.invalidate_layout()
 
-    def get_length(self):
-        return(self.get_allocated_height())
+def HPaned():
+    """Make a Paned that splits left and right"""
+    return(Paned(Gtk.Orientation.HORIZONTAL))
 
-    def set_pos(self, pos):
-        Gtk.VPaned.set_position(self, pos)
-        self.set_property('position-set',  True)
+def VPaned():
+    """Make a Paned that splits top and bottom"""
+    return(Paned(Gtk.Orientation.VERTICAL))
 
-GObject.type_register(HPaned)
-GObject.type_register(VPaned)
+GObject.type_register(Paned)
 # vim: set expandtab ts=4 sw=4:
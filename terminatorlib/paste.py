@@ -0,0 +1,277 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""paste.py - Paste into one or many terminals a chunk at a time
+
+Dumping a large paste into a terminal in one go stalls the user interface
+while VTE takes it in, and overruns programs that read slowly. A Paste hands
+each terminal a bounded chunk at a time from a low priority timeout, so
+redraws and VTE's own PTY I/O run in between, and the paste can be cancelled
+part way through. A terminal only gets its next chunk once its child has
+taken in the last one.
+
+Text is pasted with VTE's paste_text(), as if it came from the clipboard, so
+each terminal brackets it if the program reading asked for bracketed paste
+and control characters are made harmless. Raw input, such as a macro or
+remotinator send, is fed to the child as it is.
+
+Files dropped on a terminal are pasted as their quoted paths. Long lists of
+them are converted and quoted a batch at a time from an idle handler, so
+dropping thousands of files does not freeze the window.
+
+>>> prepare_paste('echo one\\r\\necho two\\n')
+'echo one\\necho two\\n'
+>>> shell_quote(uri_to_path("file:///tmp/it's%20here"))
+"'/tmp/it'\\\\''s here'"
+"""
+
+import os
+import select
+import tempfile
+from urllib.parse import unquote
+from gi.repository import GObject, GLib, Gtk
+
+from .translation import _
+from .util import dbg, err
+
+# How many dropped URIs to convert per main loop iteration
+DROP_BATCH = 500
+
+def prepare_paste(text):
+    """Turn text into what is pasted a chunk at a time. VTE sends each line
+    ending as a carriage return, so a CR LF split across two chunks would be
+    sent as two of them"""
+    return(text.replace('\r\n', '\n'))
+
+def uri_to_path(uri):
+    """Turn a file:// URI into a path"""
+    return(unquote(uri[7:]))
+
+def shell_quote(path):
+    """Quote a path so that a shell sees it as one word"""
+    return("'%s'" % path.replace("'", "'\\''"))
+
+def write_path_list(paths):
+    """Write paths to a temporary file, one per line, and return its name.
+    Returns None if it cannot be written"""
+    try:
+        fd, filename = tempfile.mkstemp(prefix='terminator-drop-',
+                                        suffix='.txt')
+        with os.fdopen(fd, 'w', errors='surrogateescape') as fileobj:
+            fileobj.write(''.join([path + '\n' for path in paths]))
+    except OSError as ex:
+        err('unable to write dropped file list: %s' % ex)
+        return(None)
+    dbg('wrote %d dropped paths to %s' % (len(paths), filename))
+    return(filename)
+
+class UriConverter(object):
+    """Turn a list of dropped file:// URIs into the text to paste, their
+    quoted paths, and hand it to a callback when done. A list longer than
+    threshold is written to a file and the name of that file is pasted
+    instead. Long lists are done a batch at a time from the main loop"""
+
+    uris = None
+    threshold = None
+    paths = None
+    words = None
+    callback = None
+    source = None
+
+    def __init__(self, uris, threshold, callback):
+        """Class initialiser"""
+        self.uris = uris
+        self.threshold = threshold
+        self.paths = []
+        self.words = []
+        self.callback = callback
+
+    def start(self):
+        """Start converting from the main loop"""
+        self.source = GLib.idle_add(self.on_idle)
+
+    def run(self):
+        """Convert everything now"""
+        while self.on_idle():
+            pass
+
+    def on_idle(self):
+        """Convert or quote the next batch"""
+        if len(self.paths) < len(self.uris):
+            start = len(self.paths)
+            for uri in self.uris[start:start + DROP_BATCH]:
+                self.paths.append(uri_to_path(uri))
+            if len(self.paths) < len(self.uris) or \
+               not self.threshold or len(self.paths) <= self.threshold:
+                return(True)
+            filename = write_path_list(self.paths)
+            if filename:
+                self.uris = self.paths = [filename]
+            return(True)
+        start = len(self.words)
+        for path in self.paths[start:start + DROP_BATCH]:
+            self.words.append(shell_quote(path) + ' ')
+        if len(self.words) < len(self.paths):
+            return(True)
+        dbg('converted %d dropped URIs' % len(self.words))
+        self.source = None
+        self.callback(''.join(self.words))
+        return(False)
+
+    def cancel(self):
+        """Stop converting, without calling back"""
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+
+class Paste(GObject.GObject):
+    """Write one paste out to a number of terminals. data is text to paste,
+    or bytes to feed to each child as they are. Each terminal is offered a
+    chunk every interval ms, or from an idle handler if interval is 0"""
+
+    __gsignals__ = {
+        'progress': (GObject.SignalFlags.RUN_LAST, None,
+                     (GObject.TYPE_FLOAT,)),
+        'terminal-finished': (GObject.SignalFlags.RUN_LAST, None,
+                              (GObject.TYPE_PYOBJECT,)),
+        'finished': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    data = None
+    chunk_size = None
+    interval = None
+    offsets = None
+    sources = None
+
+    def __init__(self, data, terminals, chunk_size, interval=0):
+        """Class initialiser"""
+        GObject.GObject.__init__(self)
+        self.data = data
+        self.chunk_size = max(chunk_size, 1)
+        self.interval = max(interval, 0)
+        self.offsets = dict([(terminal, 0) for terminal in terminals])
+        self.sources = {}
+
+    def start(self):
+        """Start writing to every terminal"""
+        dbg('pasting %d %s into %d terminals' % (len(self.data),
+            'characters' if self.is_text() else 'bytes', len(self.offsets)))
+        for terminal in list(self.offsets):
+            if self.interval:
+                source = GLib.timeout_add(self.interval, self.on_idle,
+                        terminal, priority=GLib.PRIORITY_DEFAULT_IDLE)
+            else:
+                source = GLib.idle_add(self.on_idle, terminal,
+                        priority=GLib.PRIORITY_DEFAULT_IDLE)
+            self.sources[terminal] = source
+        if not self.sources:
+            self.emit('finished')
+
+    def is_text(self):
+        """Whether we are pasting text rather than feeding bytes"""
+        return(isinstance(self.data, str))
+
+    def is_ready(self, terminal):
+        """Whether a terminal has taken in the last chunk, so that the next
+        one will not pile up behind it"""
+        backend = terminal.backend
+        if backend:
+            return(len(backend.outbuf) < self.chunk_size)
+        pty = terminal.vte.get_pty()
+        if not pty:
+            return(True)
+        # VTE writes out what it holds for the child whenever the PTY has
+        # room, at a higher priority than ours. So if the PTY still has room
+        # now, VTE is holding nothing and the child is keeping up
+        poller = select.poll()
+        poller.register(pty.get_fd(), select.POLLOUT)
+        return(bool(poller.poll(0)))
+
+    def on_idle(self, terminal):
+        """Send the next chunk to a terminal"""
+        if not terminal.vte:
+            # The terminal has gone away
+            return(self.done(terminal))
+        if not self.is_ready(terminal):
+            return(True)
+
+        offset = self.offsets[terminal]
+        chunk = self.data[offset:offset + self.chunk_size]
+        if self.is_text():
+            terminal.paste_text(chunk)
+        else:
+            terminal.feed(chunk)
+        self.offsets[terminal] = offset + len(chunk)
+        self.emit('progress', self.get_fraction())
+        if self.offsets[terminal] >= len(self.data):
+            return(self.done(terminal))
+        return(True)
+
+    def done(self, terminal):
+        """A terminal has had everything it is going to get"""
+        del(self.sources[terminal])
+        self.emit('terminal-finished', terminal)
+        if not self.sources:
+            self.emit('finished')
+        return(False)
+
+    def get_fraction(self):
+        """How much of the paste has been written, from 0 to 1"""
+        total = len(self.data) * len(self.offsets)
+        if not total:
+            return(1.0)
+        return(float(sum(self.offsets.values())) / total)
+
+    def forget(self, terminal):
+        """Stop writing to a terminal that has closed"""
+        source = self.sources.get(terminal)
+        if source is not None:
+            GLib.source_remove(source)
+            self.done(terminal)
+
+    def cancel(self):
+        """Stop writing. Each chunk of text is a paste of its own, so a
+        terminal is never left part way through a bracketed paste"""
+        dbg('cancelling paste at %d%%' % (self.get_fraction() * 100))
+        for source in self.sources.values():
+            GLib.source_remove(source)
+        self.sources = {}
+        self.emit('finished')
+
+class Pastebar(Gtk.HBox):
+    """Show the progress of a paste, with a button to cancel it"""
+
+    __gsignals__ = {
+        'cancel-paste': (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    progress = None
+
+    def __init__(self):
+        """Class initialiser"""
+        GObject.GObject.__init__(self)
+        self.get_style_context().add_class("terminator-terminal-pastebar")
+
+        label = Gtk.Label(label=_('Pasting:'))
+        label.show()
+
+        self.progress = Gtk.ProgressBar()
+        self.progress.set_show_text(True)
+        self.progress.show()
+
+        cancel = Gtk.Button.new_with_label(_('Cancel'))
+        cancel.set_focus_on_click(False)
+        cancel.connect('clicked', lambda _button: self.emit('cancel-paste'))
+        cancel.show()
+
+        self.pack_start(label, False, True, 0)
+        self.pack_start(self.progress, True, True, 0)
+        self.pack_end(cancel, False, False, 0)
+
+        self.hide()
+        self.set_no_show_all(True)
+
+    def set_fraction(self, fraction):
+        """Update the progress bar"""
+        self.progress.set_fraction(fraction)
+
+# vim: set expandtab ts=4 sw=4:
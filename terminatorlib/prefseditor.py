@@ -126,6 +126,11 @@ class PrefsEditor:
                         'paste'            : _('Paste clipboard'),
                         'toggle_scrollbar' : _('Show/Hide the scrollbar'),
                         'search'           : _('Search terminal scrollback'),
+                        'prev_prompt'      : _('Scroll to the previous prompt'),
+                        'next_prompt'      : _('Scroll to the next prompt'),
+                        'copy_last_output' : _('Copy the output of the last command'),
+                        'toggle_macro_recording': _('Start or stop recording a macro'),
+                        'play_last_macro'  : _('Play the last macro'),
                         'page_up'          : _('Scroll upwards one page'),
                         'page_down'        : _('Scroll downwards one page'),
                         'page_up_half'     : _('Scroll upwards half a page'),
@@ -204,6 +209,7 @@ class PrefsEditor:
 
         self.builder.add_from_string(gladedata)
         self.window = self.builder.get_object('prefswin')
+        self.window.connect('destroy', self.on_destroy)
 
         icon_theme = Gtk.IconTheme.get_default()
         if icon_theme.lookup_icon('terminator-preferences', 48, 0):
@@ -232,6 +238,10 @@ class PrefsEditor:
         self.calling_window.preventHide = False
         del(self)
 
+    def on_destroy(self, _window):
+        """The window is gone, however it was closed"""
+        self.keybindings.destroy()
+
     def set_values(self):
         """Update the preferences window with all the configuration from
         Config()"""
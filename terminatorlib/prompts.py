@@ -0,0 +1,167 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""prompts.py - Find prompts and command output by their semantic marks
+
+Shells set up for semantic prompts mark each step of running a command with
+an OSC 133 escape sequence:
+
+    ESC ] 133 ; A ST        the prompt starts
+    ESC ] 133 ; B ST        the prompt ends and the command line starts
+    ESC ] 133 ; C ST        the command's output starts
+    ESC ] 133 ; D ; n ST    the command finished with exit status n
+
+A MarkParser picks these out of a terminal's output, including marks split
+across reads. A PromptIndex keeps the scrollback row each mark was seen on,
+so that we can jump between prompts and find the output of a command.
+
+>>> parser = MarkParser()
+>>> parser.feed(b'$ \\x1b]133;B\\x07ls\\r\\n\\x1b]133;C\\x07')
+[(10, 'B', ''), (22, 'C', '')]
+>>> parser.feed(b'a b\\r\\n\\x1b]13')
+[]
+>>> parser.feed(b'3;D;1\\x1b\\\\')
+[(7, 'D', '1')]
+>>> index = PromptIndex()
+>>> for row, kind in [(0, 'A'), (0, 'C'), (5, 'D'), (5, 'A'), (5, 'C')]:
+...     index.add(row, kind)
+>>> index.add(9, 'D', 2)
+>>> index.previous(5), index.next(0), index.last_output()
+(0, 5, (5, 9))
+>>> index.trim(3)
+>>> index.previous(5), len(index)
+(None, 4)
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+MARK = re.compile(rb'\x1b\]133;([A-D])([^\x07\x1b]*)(?:\x07|\x1b\\)')
+MARK_PREFIX = b'\x1b]133;'
+# Anything longer than this without a terminator is not one of our marks
+MAX_MARK = 256
+# Only remember this many marks per terminal
+MAX_MARKS = 8192
+
+class MarkParser(object):
+    """Pick OSC 133 marks out of a stream of terminal output"""
+
+    tail = None
+
+    def __init__(self):
+        """Class initialiser"""
+        self.tail = b''
+
+    def feed(self, data):
+        """Return the marks that end in data, as a list of (offset just past
+        the mark, kind, argument)"""
+        text = self.tail + data
+        skip = len(self.tail)
+        marks = []
+        end = 0
+        for match in MARK.finditer(text):
+            end = match.end()
+            argument = match.group(2).lstrip(b';')
+            marks.append((end - skip, match.group(1).decode('ascii'),
+                          argument.decode('ascii', 'replace')))
+
+        # Hold on to the start of a mark that has not arrived in full yet
+        self.tail = b''
+        start = text.rfind(MARK_PREFIX, end)
+        if start < 0:
+            start = text.rfind(b'\x1b', max(end, len(text) - len(MARK_PREFIX)))
+            if start >= 0 and not MARK_PREFIX.startswith(text[start:]):
+                start = -1
+        if start >= 0 and len(text) - start < MAX_MARK:
+            self.tail = text[start:]
+        return(marks)
+
+class PromptIndex(object):
+    """The scrollback rows of the marks seen in one terminal, oldest first"""
+
+    rows = None
+    kinds = None
+    statuses = None
+
+    def __init__(self):
+        """Class initialiser"""
+        self.clear()
+
+    def __len__(self):
+        return(len(self.rows))
+
+    def clear(self):
+        """Forget every mark"""
+        self.rows = array('q')
+        self.kinds = bytearray()
+        self.statuses = array('i')
+
+    def add(self, row, kind, status=-1):
+        """Record a mark of kind on row, with the exit status for D"""
+        if self.rows and row < self.rows[-1]:
+            # The terminal was reset, so anything from here on is gone
+            self.drop_from(bisect_left(self.rows, row))
+        self.rows.append(row)
+        self.kinds.append(ord(kind))
+        self.statuses.append(status)
+        if len(self.rows) > MAX_MARKS:
+            self.drop_before(len(self.rows) - MAX_MARKS * 3 // 4)
+
+    def trim(self, first_row):
+        """Forget the marks on rows that have left the scrollback"""
+        if self.rows and self.rows[0] < first_row:
+            self.drop_before(bisect_left(self.rows, first_row))
+
+    def drop_before(self, index):
+        """Forget the marks before index"""
+        del(self.rows[:index])
+        del(self.kinds[:index])
+        del(self.statuses[:index])
+
+    def drop_from(self, index):
+        """Forget the marks from index on"""
+        del(self.rows[index:])
+        del(self.kinds[index:])
+        del(self.statuses[index:])
+
+    def previous(self, row, kind='A'):
+        """Return the row of the last mark of kind above row, or None"""
+        code = ord(kind)
+        for index in range(bisect_left(self.rows, row) - 1, -1, -1):
+            if self.kinds[index] == code:
+                return(self.rows[index])
+        return(None)
+
+    def next(self, row, kind='A'):
+        """Return the row of the first mark of kind below row, or None"""
+        code = ord(kind)
+        for index in range(bisect_right(self.rows, row), len(self.rows)):
+            if self.kinds[index] == code:
+                return(self.rows[index])
+        return(None)
+
+    def last_output(self):
+        """Return the first row of the output of the last command to start,
+        and the row its D mark is on, or None for the end row if it is still
+        running. Returns None if no command has started"""
+        code = ord('C')
+        for index in range(len(self.rows) - 1, -1, -1):
+            if self.kinds[index] == code:
+                break
+        else:
+            return(None)
+        end = None
+        if index + 1 < len(self.rows) and self.kinds[index + 1] == ord('D'):
+            end = self.rows[index + 1]
+        return(self.rows[index], end)
+
+    def last_status(self):
+        """Return the exit status of the last command to finish, or None"""
+        code = ord('D')
+        for index in range(len(self.rows) - 1, -1, -1):
+            if self.kinds[index] == code:
+                status = self.statuses[index]
+                return(status if status >= 0 else None)
+        return(None)
+
+# vim: set expandtab ts=4 sw=4:
@@ -0,0 +1,277 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""ptybackend.py - Connect a Terminal to its session in the PTY daemon
+
+When the pty_backend option is enabled, the VTE widget has no PTY of its
+own. Output from the daemon is fed to it with Vte.Terminal.feed(), and
+everything the widget would have written to its child (keystrokes, pastes,
+feed_child()) is picked up from its 'commit' signal and sent to the daemon.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+from collections import deque
+from gi.repository import GLib
+
+from . import ptyd
+from .prompts import MarkParser
+from .util import dbg, err
+from .signalman import Signalman
+
+CONNECT_TIMEOUT = 5.0
+# VTE only works through what it is fed later on, from the main loop. So this
+# status request is fed after each prompt mark, and VTE answers it when it
+# gets to that point in the output, with its cursor where the mark was
+STATUS_REQUEST = b'\x1b[5n'
+STATUS_REPLY = '\x1b[0n'
+
+def start_daemon(path):
+    """Start a daemon in the background, detached from our session"""
+    dbg('starting PTY daemon on %s' % path)
+    subprocess.Popen([sys.executable, os.path.abspath(ptyd.__file__),
+                      '--socket', path],
+                     cwd='/', start_new_session=True, close_fds=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL)
+
+def connect_daemon(path):
+    """Return a socket connected to the daemon, starting one if needed"""
+    started = False
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return(sock)
+        except OSError:
+            sock.close()
+            if time.monotonic() > deadline:
+                raise
+        if not started:
+            start_daemon(path)
+            started = True
+        time.sleep(0.05)
+
+class PtyBackend(object):
+    """The connection between one Terminal and its daemon session"""
+
+    terminal = None
+    sock = None
+    reader = None
+    pid = None
+    size = None
+    outbuf = None
+    in_watch = None
+    out_watch = None
+    cnxids = None
+    marks = None
+    replies = None
+
+    def __init__(self, terminal):
+        """Class initialiser"""
+        self.terminal = terminal
+        self.cnxids = Signalman()
+        self.reader = ptyd.FrameReader()
+        self.marks = MarkParser()
+        self.replies = deque()
+        self.outbuf = bytearray()
+
+    def open(self, uuid, filename, argv, cwd, env, buffer_size):
+        """Attach to the session for uuid, spawning filename if the daemon
+        does not have one. Returns the child pid, or None on failure"""
+        vte = self.terminal.vte
+        self.size = (vte.get_column_count(), vte.get_row_count())
+        try:
+            self.sock = connect_daemon(ptyd.socket_path())
+            self.sock.settimeout(CONNECT_TIMEOUT)
+            self.sock.sendall(ptyd.pack_control({
+                'cmd': 'open', 'uuid': uuid, 'file': filename,
+                'argv': argv, 'cwd': cwd, 'env': env,
+                'cols': self.size[0], 'rows': self.size[1],
+                'buffer_size': buffer_size}))
+            reply, frames = self.read_reply()
+        except (OSError, ValueError) as ex:
+            err('PtyBackend::open: unable to reach the PTY daemon: %s' % ex)
+            self.close()
+            return(None)
+
+        if reply.get('event') not in ['spawned', 'attached']:
+            err('PtyBackend::open: %s' % reply.get('message', reply))
+            self.close()
+            return(None)
+
+        dbg('%s session %s, pid %s' % (reply['event'], uuid, reply['pid']))
+        self.pid = reply['pid']
+        self.sock.setblocking(False)
+        self.in_watch = GLib.io_add_watch(self.sock,
+                GLib.PRIORITY_DEFAULT,
+                GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.on_readable)
+        self.cnxids.new(vte, 'commit', self.on_commit)
+        self.cnxids.new(vte, 'size-allocate', self.on_size_allocate)
+        self.handle_frames(frames)
+        return(self.pid)
+
+    def read_reply(self):
+        """Block until the daemon answers our open request. Returns the
+        reply and any frames that arrived with it"""
+        while True:
+            data = self.sock.recv(ptyd.READ_SIZE)
+            if not data:
+                raise OSError('connection closed')
+            frames = self.reader.feed(data)
+            for index, (kind, payload) in enumerate(frames):
+                if kind == ptyd.CONTROL:
+                    reply = json.loads(payload.decode('utf-8'))
+                    return(reply, frames[index + 1:])
+
+    def send(self, frame):
+        """Queue a frame for the daemon"""
+        if not self.sock:
+            return
+        self.outbuf += frame
+        self.flush()
+
+    def flush(self, *args):
+        """Send as much as the socket will take, then wait for it to drain"""
+        while self.outbuf and self.sock:
+            try:
+                sent = self.sock.send(self.outbuf)
+            except BlockingIOError:
+                break
+            except OSError as ex:
+                err('PtyBackend::flush: %s' % ex)
+                self.on_disconnect()
+                return(False)
+            del self.outbuf[:sent]
+
+        if self.outbuf and not self.out_watch:
+            self.out_watch = GLib.io_add_watch(self.sock,
+                    GLib.PRIORITY_DEFAULT, GLib.IO_OUT, self.flush)
+        elif not self.outbuf and self.out_watch:
+            if not args:
+                GLib.source_remove(self.out_watch)
+            self.out_watch = None
+            return(False)
+        return(True)
+
+    def on_readable(self, source, condition):
+        """Handle output and events from the daemon"""
+        try:
+            data = self.sock.recv(ptyd.READ_SIZE)
+        except BlockingIOError:
+            return(True)
+        except OSError:
+            data = b''
+        if not data:
+            self.in_watch = None
+            self.on_disconnect()
+            return(False)
+        try:
+            self.handle_frames(self.reader.feed(data))
+        except ValueError as ex:
+            err('PtyBackend::on_readable: %s' % ex)
+            self.in_watch = None
+            self.on_disconnect()
+            return(False)
+        return(True)
+
+    def handle_frames(self, frames):
+        for kind, payload in frames:
+            if kind == ptyd.DATA:
+                self.feed_output(payload)
+            elif kind == ptyd.CONTROL:
+                message = json.loads(payload.decode('utf-8'))
+                self.handle_event(message)
+
+    def feed_output(self, data):
+        """Show output from the child, telling the terminal about any prompt
+        marks in it once VTE has moved its cursor up to them"""
+        vte = self.terminal.vte
+        start = 0
+        for end, kind, argument in self.marks.feed(data):
+            self.expect_replies(data[start:end])
+            vte.feed(data[start:end] + STATUS_REQUEST)
+            self.replies.append((kind, argument))
+            start = end
+        data = data[start:] if start else data
+        self.expect_replies(data)
+        vte.feed(data)
+
+    def expect_replies(self, data):
+        """Note the status requests the child makes itself, so that their
+        replies go to it and not to our marks"""
+        for _ in range(data.count(STATUS_REQUEST)):
+            self.replies.append(None)
+
+    def handle_event(self, message):
+        """Act on a control message from the daemon"""
+        event = message.get('event')
+        if event == 'exited':
+            self.close()
+            self.terminal.vte.emit('child-exited', message.get('status', 0))
+        elif event == 'detached':
+            # Another Terminator took over our session
+            self.close()
+            self.terminal.vte.feed(b'\r\n[session attached elsewhere]\r\n')
+        elif event == 'error':
+            err('PtyBackend: %s' % message.get('message'))
+
+    def on_commit(self, vte, text, size):
+        """The widget wants to send something to the child. Replies to our
+        own status requests mean VTE has reached a prompt mark"""
+        if text == STATUS_REPLY and self.replies:
+            mark = self.replies.popleft()
+            if mark:
+                self.terminal.on_prompt_mark(*mark)
+                return
+        self.send(ptyd.pack_data(text.encode('utf-8', 'surrogateescape')))
+
+    def on_size_allocate(self, vte, allocation):
+        """Let the child know when our size in characters changes"""
+        size = (vte.get_column_count(), vte.get_row_count())
+        if size != self.size:
+            self.size = size
+            self.send(ptyd.pack_control({'cmd': 'resize', 'cols': size[0],
+                                         'rows': size[1]}))
+
+    def on_disconnect(self):
+        """The daemon went away. The child is gone with it"""
+        if not self.sock:
+            return
+        self.close()
+        self.terminal.vte.emit('child-exited', 0)
+
+    def detach(self):
+        """Leave the child running in the daemon, so that a Terminator that
+        restores our UUID attaches to it again. Anything not yet sent is
+        sent first, since the main loop may not run again"""
+        if not self.sock:
+            return
+        dbg('detaching from session, pid %s' % self.pid)
+        data = bytes(self.outbuf) + ptyd.pack_control({'cmd': 'detach'})
+        self.outbuf = bytearray()
+        try:
+            self.sock.settimeout(CONNECT_TIMEOUT)
+            self.sock.sendall(data)
+        except OSError as ex:
+            err('PtyBackend::detach: %s' % ex)
+        self.close()
+
+    def close(self):
+        """Drop our connection. The daemon keeps the session running, which
+        is what lets a restarted Terminator attach to it again"""
+        for watch in [self.in_watch, self.out_watch]:
+            if watch:
+                GLib.source_remove(watch)
+        self.in_watch = None
+        self.out_watch = None
+        self.cnxids.remove_all()
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+# vim: set expandtab ts=4 sw=4:
@@ -0,0 +1,541 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""ptyd.py - Optional daemon that owns terminal PTYs and their children, so
+that shells survive Terminator being restarted or crashing
+
+Each Terminal talks to the daemon over its own connection to a Unix socket.
+Everything sent either way is a frame: a one byte kind, a four byte length
+and a payload. Control frames carry a JSON object, data frames carry raw
+bytes to or from the PTY. Recent output of every session is kept in a
+bounded buffer and replayed when a Terminal with the same UUID attaches.
+
+This module deliberately only uses the standard library, so that the daemon
+does not need a display and can be run and tested on its own:
+
+    python3 ptyd.py --socket /tmp/test.sock --debug
+
+>>> reader = FrameReader()
+>>> frames = pack_control({'cmd': 'kill'}) + pack_data(b'ls\\n')
+>>> reader.feed(frames[:5])
+[]
+>>> reader.feed(frames[5:])
+[(b'C', b'{"cmd": "kill"}'), (b'D', b'ls\\n')]
+"""
+
+import os
+import sys
+import pty
+import json
+import time
+import fcntl
+import signal
+import socket
+import struct
+import termios
+import argparse
+import selectors
+import collections
+
+PROTOCOL_VERSION = 1
+CONTROL = b'C'
+DATA = b'D'
+HEADER = struct.Struct('!cI')
+MAX_FRAME = 16 * 1024 * 1024
+READ_SIZE = 65536
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Stop reading a PTY while its client is this far behind
+CLIENT_HIGH_WATER = 1024 * 1024
+IDLE_EXIT = 30
+
+DEBUG = False
+
+def log(message):
+    """Print a message if debugging is enabled"""
+    if DEBUG:
+        print('ptyd[%d]: %s' % (os.getpid(), message), file=sys.stderr)
+
+def socket_path():
+    """Return the path of the daemon socket for this user"""
+    rundir = os.environ.get('XDG_RUNTIME_DIR')
+    if not rundir or not os.path.isdir(rundir):
+        rundir = os.path.join('/tmp', 'terminator-%d' % os.getuid())
+    return(os.path.join(rundir, 'terminator-ptyd.sock'))
+
+def pack_frame(kind, payload):
+    """Build a frame"""
+    return(HEADER.pack(kind, len(payload)) + payload)
+
+def pack_control(message):
+    """Build a control frame from a dict"""
+    return(pack_frame(CONTROL, json.dumps(message).encode('utf-8')))
+
+def pack_data(data):
+    """Build a data frame"""
+    return(pack_frame(DATA, data))
+
+class FrameReader(object):
+    """Split a byte stream into frames"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes, return a list of complete (kind, payload)"""
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            kind, length = HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME:
+                raise ValueError('frame of %d bytes is too large' % length)
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((kind, bytes(self.buffer[offset + HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return(frames)
+
+class Session(object):
+    """A child process, the master side of its PTY and its recent output"""
+
+    def __init__(self, daemon, uuid, buffer_size):
+        self.daemon = daemon
+        self.uuid = uuid
+        self.buffer_size = max(int(buffer_size), 0)
+        self.pid = None
+        self.fd = None
+        self.client = None
+        self.output = collections.deque()
+        self.output_size = 0
+        self.pending_input = bytearray()
+
+    def spawn(self, filename, argv, cwd, env, cols, rows):
+        """Fork the child on a new PTY"""
+        pid, fd = pty.fork()
+        if pid == 0:
+            # Python ignores SIGPIPE, and ignored signals survive exec()
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            try:
+                if cwd:
+                    os.chdir(cwd)
+            except OSError:
+                pass
+            try:
+                os.execvpe(filename, argv, env)
+            except OSError as ex:
+                os.write(2, ('Unable to start %s: %s\r\n' %
+                             (filename, ex)).encode('utf-8'))
+            os._exit(127)
+
+        self.pid = pid
+        self.fd = fd
+        os.set_blocking(fd, False)
+        self.resize(cols, rows)
+        log('spawned %s as %d for %s' % (filename, pid, self.uuid))
+
+    def resize(self, cols, rows):
+        """Tell the PTY, and so the child, about a new size"""
+        if self.fd is None or not cols or not rows:
+            return
+        try:
+            fcntl.ioctl(self.fd, termios.TIOCSWINSZ,
+                        struct.pack('HHHH', int(rows), int(cols), 0, 0))
+        except OSError as ex:
+            log('unable to resize %s: %s' % (self.uuid, ex))
+
+    def attach(self, client):
+        """Make client the receiver of our output, replaying recent output"""
+        if self.client and self.client is not client:
+            self.client.send(pack_control({'event': 'detached'}))
+            self.client.session = None
+        self.client = client
+        client.session = self
+        replay = b''.join(self.output)
+        if replay:
+            client.send(pack_data(replay))
+        self.update_events()
+
+    def detach(self, client):
+        """Forget client, keep running and buffering"""
+        if self.client is client:
+            self.client = None
+            self.update_events()
+
+    def record(self, data):
+        """Remember output, dropping the oldest beyond buffer_size"""
+        if self.buffer_size == 0:
+            return
+        if len(data) > self.buffer_size:
+            data = data[-self.buffer_size:]
+        self.output.append(data)
+        self.output_size += len(data)
+        while self.output_size > self.buffer_size:
+            oldest = self.output.popleft()
+            excess = self.output_size - self.buffer_size
+            if len(oldest) > excess:
+                self.output.appendleft(oldest[excess:])
+                self.output_size -= excess
+            else:
+                self.output_size -= len(oldest)
+
+    def write(self, data):
+        """Queue input for the child"""
+        self.pending_input += data
+        self.flush_input()
+
+    def flush_input(self):
+        """Write as much queued input as the PTY will take"""
+        while self.pending_input:
+            try:
+                written = os.write(self.fd, self.pending_input)
+            except BlockingIOError:
+                break
+            except OSError as ex:
+                log('write to %s failed: %s' % (self.uuid, ex))
+                del self.pending_input[:]
+                break
+            del self.pending_input[:written]
+        self.update_events()
+
+    def update_events(self):
+        """Watch the PTY for what we currently need from it"""
+        if self.fd is None:
+            return
+        events = 0
+        if self.client is None or len(self.client.outbuf) < CLIENT_HIGH_WATER:
+            events |= selectors.EVENT_READ
+        if self.pending_input:
+            events |= selectors.EVENT_WRITE
+        self.daemon.watch(self.fd, events, self.on_event)
+
+    def on_event(self, mask):
+        """Handle the PTY becoming readable or writable"""
+        if mask & selectors.EVENT_WRITE:
+            self.flush_input()
+        if mask & selectors.EVENT_READ:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                # EIO once the last slave side descriptor is closed
+                data = b''
+            if not data:
+                self.daemon.end_session(self)
+                return
+            self.record(data)
+            if self.client:
+                self.client.send(pack_data(data))
+
+    def close(self):
+        """Release the PTY and report how the child exited"""
+        self.daemon.watch(self.fd, 0, None)
+        os.close(self.fd)
+        self.fd = None
+        status = 0
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid == 0:
+                # Still running without a terminal, let the reaper have it
+                os.kill(self.pid, signal.SIGHUP)
+                status = 0
+        except OSError:
+            pass
+        if self.client:
+            self.client.send(pack_control({'event': 'exited',
+                                           'status': status}))
+            self.client.session = None
+            self.client = None
+        log('session %s ended with status %d' % (self.uuid, status))
+
+class Connection(object):
+    """A Terminal connected to the daemon"""
+
+    def __init__(self, daemon, sock):
+        self.daemon = daemon
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.reader = FrameReader()
+        self.outbuf = bytearray()
+        self.session = None
+        self.closed = False
+        self.update_events()
+
+    def update_events(self):
+        events = selectors.EVENT_READ
+        if self.outbuf:
+            events |= selectors.EVENT_WRITE
+        self.daemon.watch(self.sock, events, self.on_event)
+
+    def send(self, frame):
+        """Queue a frame for the client"""
+        if self.closed:
+            return
+        self.outbuf += frame
+        self.flush()
+
+    def flush(self):
+        """Send as much queued output as the socket will take"""
+        while self.outbuf:
+            try:
+                sent = self.sock.send(self.outbuf)
+            except BlockingIOError:
+                break
+            except OSError:
+                self.close()
+                return
+            del self.outbuf[:sent]
+        self.update_events()
+        if self.session and len(self.outbuf) < CLIENT_HIGH_WATER:
+            self.session.update_events()
+
+    def on_event(self, mask):
+        """Handle the socket becoming readable or writable"""
+        if mask & selectors.EVENT_WRITE:
+            self.flush()
+        if mask & selectors.EVENT_READ and not self.closed:
+            try:
+                data = self.sock.recv(READ_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b''
+            if not data:
+                self.close()
+                return
+            try:
+                frames = self.reader.feed(data)
+            except ValueError as ex:
+                log('dropping client: %s' % ex)
+                self.close()
+                return
+            for kind, payload in frames:
+                if kind == DATA:
+                    if self.session:
+                        self.session.write(payload)
+                elif kind == CONTROL:
+                    try:
+                        message = json.loads(payload.decode('utf-8'))
+                    except ValueError:
+                        self.reply_error('malformed control frame')
+                        continue
+                    self.handle(message)
+
+    def reply_error(self, message):
+        self.send(pack_control({'event': 'error', 'message': message}))
+
+    def handle(self, message):
+        """Act on a control message"""
+        cmd = message.get('cmd')
+        if cmd == 'hello':
+            self.send(pack_control({'event': 'hello',
+                                    'version': PROTOCOL_VERSION}))
+        elif cmd == 'open':
+            self.daemon.open_session(self, message)
+        elif cmd == 'resize':
+            if self.session:
+                self.session.resize(message.get('cols'), message.get('rows'))
+        elif cmd == 'kill':
+            if self.session:
+                try:
+                    os.kill(self.session.pid, signal.SIGHUP)
+                except OSError:
+                    pass
+        elif cmd == 'detach':
+            if self.session:
+                self.session.detach(self)
+                self.session = None
+        elif cmd == 'list':
+            sessions = []
+            for session in self.daemon.sessions.values():
+                sessions.append({'uuid': session.uuid, 'pid': session.pid,
+                                 'attached': session.client is not None,
+                                 'buffered': session.output_size})
+            self.send(pack_control({'event': 'sessions',
+                                    'sessions': sessions}))
+        else:
+            self.reply_error('unknown command %s' % cmd)
+
+    def close(self):
+        """Drop the client, leaving any session running"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.session:
+            self.session.detach(self)
+            self.session = None
+        self.daemon.watch(self.sock, 0, None)
+        self.sock.close()
+        self.daemon.connections.discard(self)
+
+class Daemon(object):
+    """Accept connections and run every session from one select() loop"""
+
+    def __init__(self, path, idle_exit=IDLE_EXIT):
+        self.path = path
+        self.idle_exit = idle_exit
+        self.selector = selectors.DefaultSelector()
+        self.sessions = {}
+        self.connections = set()
+        self.listener = None
+        self.running = False
+
+    def watch(self, fileobj, events, callback):
+        """Register, change or remove interest in a file"""
+        try:
+            key = self.selector.get_key(fileobj)
+        except KeyError:
+            key = None
+        if not events:
+            if key:
+                self.selector.unregister(fileobj)
+        elif key:
+            if key.events != events or key.data != callback:
+                self.selector.modify(fileobj, events, callback)
+        else:
+            self.selector.register(fileobj, events, callback)
+
+    def listen(self):
+        """Bind our socket. Returns False if another daemon already has it"""
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+        info = os.stat(dirname)
+        if info.st_uid != os.getuid():
+            raise OSError('%s is not owned by us' % dirname)
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                log('another daemon is listening on %s' % self.path)
+                return(False)
+            except OSError:
+                probe.close()
+                os.unlink(self.path)
+
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        oldmask = os.umask(0o177)
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(oldmask)
+        self.listener.listen(16)
+        self.listener.setblocking(False)
+        self.watch(self.listener, selectors.EVENT_READ, self.on_accept)
+        log('listening on %s' % self.path)
+        return(True)
+
+    def on_accept(self, mask):
+        try:
+            sock, _address = self.listener.accept()
+        except BlockingIOError:
+            return
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+        _pid, uid, _gid = struct.unpack('3i', creds)
+        if uid != os.getuid():
+            log('rejecting connection from uid %d' % uid)
+            sock.close()
+            return
+        self.connections.add(Connection(self, sock))
+
+    def open_session(self, client, message):
+        """Attach client to the session for a UUID, creating it if needed"""
+        uuid = message.get('uuid')
+        if not uuid:
+            client.reply_error('open needs a uuid')
+            return
+
+        session = self.sessions.get(uuid)
+        if session:
+            session.resize(message.get('cols'), message.get('rows'))
+            client.send(pack_control({'event': 'attached',
+                                      'pid': session.pid}))
+            session.attach(client)
+            return
+
+        session = Session(self, uuid, message.get('buffer_size',
+                                                  DEFAULT_BUFFER_SIZE))
+        try:
+            session.spawn(message['file'], message['argv'], message.get('cwd'),
+                          message.get('env', {}), message.get('cols'),
+                          message.get('rows'))
+        except (KeyError, OSError) as ex:
+            client.reply_error('unable to spawn: %s' % ex)
+            return
+        self.sessions[uuid] = session
+        client.send(pack_control({'event': 'spawned', 'pid': session.pid}))
+        session.attach(client)
+
+    def end_session(self, session):
+        session.close()
+        self.sessions.pop(session.uuid, None)
+
+    def reap(self):
+        """Collect children that outlived their PTY"""
+        while True:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+    def run(self):
+        """Serve until there has been nothing to do for idle_exit seconds"""
+        self.running = True
+        idle_since = None
+        while self.running:
+            for key, mask in self.selector.select(1.0):
+                key.data(mask)
+            self.reap()
+            if self.sessions or self.connections:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > self.idle_exit:
+                log('idle, exiting')
+                self.running = False
+        self.shutdown()
+
+    def shutdown(self):
+        for connection in list(self.connections):
+            connection.close()
+        if self.listener:
+            self.watch(self.listener, 0, None)
+            self.listener.close()
+            self.listener = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+def main(args=None):
+    """Run the daemon"""
+    global DEBUG
+    parser = argparse.ArgumentParser(
+            description='PTY backend daemon for Terminator')
+    parser.add_argument('--socket', default=socket_path(),
+                        help='path of the Unix socket to listen on')
+    parser.add_argument('--idle-exit', type=int, default=IDLE_EXIT,
+                        help='exit after this many seconds without sessions')
+    parser.add_argument('--debug', action='store_true',
+                        help='print debugging information')
+    options = parser.parse_args(args)
+    DEBUG = options.debug
+
+    daemon = Daemon(options.socket, options.idle_exit)
+    if not daemon.listen():
+        return(0)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown()
+                  or sys.exit(0))
+    daemon.run()
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim: set expandtab ts=4 sw=4:
@@ -0,0 +1,136 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""scroller.py - Keep a terminal scrolling after a touchpad is let go of
+
+VTE handles every wheel event itself: it scrolls the view, or reports the
+wheel to a program that asked for mouse events, and it only moves the view
+once per update however many events arrive. The scroll_speed option is
+applied by scaling each event before VTE sees it. A Scroller keeps the
+recent events, so that when the fingers leave a touchpad the terminal can
+carry on moving at the speed it was last scrolled at, slowing down until it
+stops, and moving at most once per frame of the frame clock.
+
+>>> fling_velocity([(0, 1.0), (10, 1.0), (20, 2.0)])
+150.0
+>>> fling_velocity([(0, 3.0)])
+0.0
+"""
+
+import math
+
+from .util import dbg
+
+# Only the events this recent, in ms, count towards the speed of a fling
+FLING_WINDOW = 100
+# How quickly a fling slows down, as the seconds it takes to lose 63% of
+# its speed
+FRICTION = 0.325
+# Rows per second below which a fling stops
+MIN_VELOCITY = 5.0
+
+def fling_velocity(samples):
+    """Return the speed in rows per second of a list of samples of (time in
+    ms, rows scrolled), or 0 if there is not enough to go on"""
+    if len(samples) < 2:
+        return(0.0)
+    span = samples[-1][0] - samples[0][0]
+    if span <= 0:
+        return(0.0)
+    return(sum([rows for _time, rows in samples[1:]]) * 1000.0 / span)
+
+class Scroller(object):
+    """Fling one terminal"""
+
+    terminal = None
+    pending = None
+    velocity = None
+    samples = None
+    start_value = None
+    tick_id = None
+    last_frame = None
+
+    def __init__(self, terminal):
+        """Class initialiser"""
+        self.terminal = terminal
+        self.pending = 0.0
+        self.velocity = 0.0
+        self.samples = []
+
+    def wheel(self, rows, time):
+        """VTE is about to handle a wheel event at time in ms, which scrolls
+        by rows if it scrolls the view. This stops any fling"""
+        self.stop_fling()
+        if self.samples and (time - self.samples[-1][0] > FLING_WINDOW or
+                             self.samples[-1][1] * rows < 0):
+            # A new gesture, or a change of direction
+            self.samples = []
+        if not self.samples:
+            adjustment = self.terminal.vte.get_vadjustment()
+            self.start_value = adjustment.get_value()
+        self.samples.append((time, rows))
+        while time - self.samples[0][0] > FLING_WINDOW:
+            del(self.samples[0])
+
+    def release(self, kinetic):
+        """The touchpad has been let go of. If kinetic, and VTE has been
+        scrolling the view rather than sending the wheel to a program, keep
+        scrolling at the speed it was moving"""
+        velocity = fling_velocity(self.samples) if kinetic else 0.0
+        self.samples = []
+        if abs(velocity) < MIN_VELOCITY:
+            return
+        adjustment = self.terminal.vte.get_vadjustment()
+        if adjustment.get_value() == self.start_value:
+            return
+        dbg('flinging at %.1f rows/s' % velocity)
+        self.velocity = velocity
+        self.schedule()
+
+    def schedule(self):
+        """Make sure we get called on the next frame"""
+        if self.tick_id is None and self.terminal.vte:
+            self.last_frame = None
+            self.tick_id = self.terminal.vte.add_tick_callback(self.on_tick)
+
+    def on_tick(self, vte, frame_clock):
+        """Move as far as the fling has gone since the last frame"""
+        now = frame_clock.get_frame_time() / 1000000.0
+        if self.last_frame is not None:
+            elapsed = now - self.last_frame
+            self.pending += self.velocity * elapsed
+            self.velocity *= math.exp(-elapsed / FRICTION)
+            if abs(self.velocity) < MIN_VELOCITY:
+                self.velocity = 0.0
+        self.last_frame = now
+
+        rows = int(self.pending)
+        if rows:
+            self.pending -= rows
+            adjustment = vte.get_vadjustment()
+            before = adjustment.get_value()
+            self.terminal.scroll_by(rows)
+            if adjustment.get_value() == before:
+                # Hit the top or the bottom
+                self.velocity = 0.0
+
+        if self.velocity:
+            return(True)
+        self.tick_id = None
+        self.pending = 0.0
+        return(False)
+
+    def stop_fling(self):
+        """Stop moving on our own"""
+        if self.tick_id is not None:
+            if self.terminal.vte:
+                self.terminal.vte.remove_tick_callback(self.tick_id)
+            self.tick_id = None
+        self.pending = 0.0
+        self.velocity = 0.0
+
+    def stop(self):
+        """Stop moving, and forget the events so far"""
+        self.stop_fling()
+        self.samples = []
+
+# vim: set expandtab ts=4 sw=4:
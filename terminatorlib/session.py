@@ -0,0 +1,196 @@
+# Terminator by Chris Jones <cmsj@tenshu.net>
+# GPL v2 only
+"""session.py - Snapshot the running session and restore it later
+
+Sessions are stored as the same flat layout description that describe_layout()
+produces, extended with the live working directory and foreground command of
+each terminal, and written as compact JSON. Restoring simply registers the
+snapshot as an internal layout and lets create_layout() do the work.
+
+>>> stringify({'order': 1, 'ratio': 0.5, 'size': (80, 24), 'labels': [None],
+...            'group': None})
+{'order': 1, 'ratio': '0.5', 'size': ['80', '24'], 'labels': [None]}
+"""
+
+import os
+import json
+import shlex
+import tempfile
+import psutil
+from gi.repository import GObject
+
+from .borg import Borg
+from .config import Config
+from .util import dbg, err, get_config_dir
+
+SESSION_LAYOUT_NAME = "__internal_session_layout__"
+SESSION_VERSION = 1
+
+def stringify(layout):
+    """Convert the values of a layout entry into the strings that ConfigObj
+    would have handed back, so that restored sessions take exactly the same
+    paths through create_layout() as saved layouts. The child order is left
+    alone so that notebooks with more than ten tabs sort correctly. Unset
+    values are left out, and unset items of lists are kept as null, rather
+    than coming back as the string 'None'."""
+    result = {}
+    for key, value in layout.items():
+        if value is None:
+            continue
+        if key == 'order':
+            result[key] = value
+        elif isinstance(value, (list, tuple)):
+            result[key] = [None if item is None else str(item)
+                           for item in value]
+        else:
+            result[key] = str(value)
+    return(result)
+
+def foreground_command(terminal):
+    """Return the command line running in the foreground of a terminal, or
+    None if the shell itself is in the foreground"""
+    try:
+        pgrp = os.tcgetpgrp(terminal.vte.get_pty().get_fd())
+    except (AttributeError, OSError) as ex:
+        dbg('unable to find the foreground process: %s' % ex)
+        return(None)
+
+    try:
+        cmdline = psutil.Process(pgrp).cmdline()
+    except psutil.Error as ex:
+        dbg('unable to read the command line of %d: %s' % (pgrp, ex))
+        return(None)
+    if not cmdline:
+        return(None)
+
+    command = ' '.join([shlex.quote(arg) for arg in cmdline])
+    if pgrp == terminal.pid:
+        # Our child is in the foreground. Either it is an idle shell, or the
+        # shell exec()d a command that it was asked to run
+        shell = os.path.basename(terminal.command or '')
+        if os.path.basename(cmdline[0]).lstrip('-') == shell:
+            return(None)
+        return(command)
+
+    # Drop back to the shell once the command finishes, as it did originally
+    if terminal.command:
+        command = '%s; exec %s' % (command, shlex.quote(terminal.command))
+    return(command)
+
+class SessionStore(Borg):
+    """Save and restore the running session. This is implemented as a Borg"""
+    terminator = None
+    config = None
+    filename = None
+    timeout_id = None
+
+    def __init__(self):
+        """Class initialiser"""
+        Borg.__init__(self, self.__class__.__name__)
+        self.prepare_attributes()
+
+    def prepare_attributes(self):
+        """Initialise anything that isn't already"""
+        if not self.terminator:
+            from .terminator import Terminator
+            self.terminator = Terminator()
+        if not self.config:
+            self.config = Config()
+        if not self.filename:
+            self.filename = os.path.join(get_config_dir(), 'session')
+
+    def start(self):
+        """Begin saving the session periodically, if configured to"""
+        if self.timeout_id is not None:
+            GObject.source_remove(self.timeout_id)
+            self.timeout_id = None
+        interval = self.config['session_save_interval']
+        if self.config['save_session'] and interval > 0:
+            self.timeout_id = GObject.timeout_add_seconds(interval,
+                                                          self.on_timeout)
+
+    def on_timeout(self):
+        """Periodic save"""
+        self.save()
+        return(True)
+
+    def autosave(self):
+        """Save the session if the user wants it saved, e.g. on exit.
+        Returns whether it was saved"""
+        if self.config['save_session']:
+            return(self.save())
+        return(False)
+
+    def snapshot(self):
+        """Return a layout describing every window, container and terminal,
+        including each terminal's live directory and foreground command"""
+        terminals = {}
+        for terminal in self.terminator.terminals:
+            terminals[terminal.uuid] = terminal
+
+        layout = self.terminator.describe_layout()
+        for name in layout:
+            item = layout[name]
+            if item['type'] != 'Terminal':
+                continue
+            terminal = terminals.get(item['uuid'])
+            if not terminal:
+                continue
+            try:
+                directory = terminal.get_cwd()
+            except (psutil.Error, OSError):
+                directory = None
+            if directory:
+                item['directory'] = directory
+            command = foreground_command(terminal)
+            if command:
+                item['command'] = command
+
+        for name in layout:
+            layout[name] = stringify(layout[name])
+        return(layout)
+
+    def save(self):
+        """Write a snapshot of the session to disk. The file is replaced
+        atomically, so a crash mid-write leaves the previous session intact"""
+        if not self.terminator.terminals:
+            dbg('no terminals, not saving session')
+            return(False)
+
+        data = {'version': SESSION_VERSION, 'layout': self.snapshot()}
+        dirname = os.path.dirname(self.filename)
+        tmpname = None
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(prefix='.session', dir=dirname)
+            with os.fdopen(fd, 'w') as fileobj:
+                json.dump(data, fileobj, separators=(',', ':'))
+            os.replace(tmpname, self.filename)
+        except (OSError, TypeError, ValueError) as ex:
+            err('unable to save session to %s: %s' % (self.filename, ex))
+            if tmpname and os.path.exists(tmpname):
+                os.unlink(tmpname)
+            return(False)
+
+        dbg('saved session to %s' % self.filename)
+        return(True)
+
+    def load(self):
+        """Register the saved session as a layout and return its name, or
+        None if there is no usable session"""
+        try:
+            with open(self.filename) as fileobj:
+                data = json.load(fileobj)
+        except (OSError, ValueError) as ex:
+            err('unable to load session from %s: %s' % (self.filename, ex))
+            return(None)
+
+        if data.get('version') != SESSION_VERSION or not data.get('layout'):
+            err('ignoring incompatible session file %s' % self.filename)
+            return(None)
+
+        self.config.layout_set_config(SESSION_LAYOUT_NAME, data['layout'])
+        return(SESSION_LAYOUT_NAME)
+
+# vim: set expandtab ts=4 sw=4:
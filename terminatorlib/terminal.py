@@ -4,16 +4,13 @@
 
 
 import os
+import math
 import signal
 import gi
 from gi.repository import GLib, GObject, Pango, Gtk, Gdk, GdkPixbuf
 gi.require_version('Vte', '2.91')  # vte-0.38 (gnome-3.14)
 from gi.repository import Vte
 import subprocess
-try:
-    from urllib.parse import unquote as urlunquote
-except ImportError:
-    from urllib import unquote as urlunquote
 
 from .util import dbg, err, spawn_new_terminator, make_uuid, manual_lookup, display_manager
 from . import util
@@ -25,8 +22,14 @@ from .titlebar import Titlebar
 from .terminal_popup_menu import TerminalPopupMenu
 from .prefseditor import PrefsEditor
 from .searchbar import Searchbar
+from .paste import Paste, Pastebar, UriConverter, DROP_BATCH, prepare_paste
+from .latency import LatencyMonitor
+from .scroller import Scroller
+from .prompts import PromptIndex
+from .macros import Macros
 from .translation import _
 from .signalman import Signalman
+from .ptybackend import PtyBackend
 from . import plugin
 from terminatorlib.layoutlauncher import LayoutLauncher
 from . import regex
@@ -84,6 +87,9 @@ class Terminal(Gtk.VBox):
     scrollbar = None
     titlebar = None
     searchbar = None
+    pastebar = None
+    paste = None
+    dropping = None
 
     group = None
     cwd = None
@@ -101,6 +107,15 @@ class Terminal(Gtk.VBox):
     layout_command = None
     relaunch_command = None
     directory = None
+    layout_fragment = None
+    backend = None
+    feeding = False
+    typing = False
+    latency = None
+    measuring = False
+    scroller = None
+    prompts = None
+    macros = None
 
     is_held_open = False
 
@@ -114,6 +129,7 @@ class Terminal(Gtk.VBox):
 
     cnxids = None
     targets_for_new_group = None
+    key_handlers = None
 
     def __init__(self):
         """Class initialiser"""
@@ -126,11 +142,17 @@ class Terminal(Gtk.VBox):
         self.connect('enumerate', self.terminator.do_enumerate)
         self.connect('focus-in', self.terminator.focus_changed)
         self.connect('focus-out', self.terminator.focus_left)
+        self.connect('size-allocate', self.on_size_allocate)
 
         self.matches = {}
+        self.key_handlers = {}
         self.cnxids = Signalman()
 
         self.config = Config()
+        self.latency = LatencyMonitor()
+        self.scroller = Scroller(self)
+        self.prompts = PromptIndex()
+        self.macros = Macros()
 
         self.cwd = get_pid_cwd()
         self.origcwd = self.terminator.origcwd
@@ -177,6 +199,9 @@ class Terminal(Gtk.VBox):
         self.searchbar = Searchbar()
         self.searchbar.connect('end-search', self.on_search_done)
 
+        self.pastebar = Pastebar()
+        self.pastebar.connect('cancel-paste', self.on_cancel_paste)
+
         self.show()
         if self.config['title_at_bottom']:
             self.pack_start(self.terminalbox, True, True, 0)
@@ -186,6 +211,7 @@ class Terminal(Gtk.VBox):
             self.pack_start(self.terminalbox, True, True, 0)
 
         self.pack_end(self.searchbar, True, True, 0)
+        self.pack_end(self.pastebar, False, True, 0)
 
         self.connect_signals()
 
@@ -211,6 +237,7 @@ class Terminal(Gtk.VBox):
         """Set our profile"""
         if profile != self.config.get_profile():
             self.config.set_profile(profile, force)
+            self.invalidate_layout()
             self.reconfigure()
 
     def get_profile(self):
@@ -253,7 +280,25 @@ class Terminal(Gtk.VBox):
         dbg('close: called')
         self.cnxids.remove_widget(self.vte)
         self.emit('close-term')
-        if self.pid is not None:
+        self.hangup()
+
+    def hangup(self, detach=False):
+        """Kill our child and drop the VTE widget, without telling our
+        container. Terminator.close_terminals() uses this to close many
+        terminals at once. If detach, a child run by the pty backend is left
+        running instead, for --restore-session to attach to again"""
+        if self.paste:
+            self.paste.cancel()
+        if self.dropping:
+            self.dropping.cancel()
+            self.dropping = None
+        self.scroller.stop()
+        self.latency.forget(self)
+        self.macros.forget(self)
+        if detach and self.backend:
+            self.backend.detach()
+            self.backend = None
+        elif self.pid is not None:
             try:
                 dbg('close: killing %d' % self.pid)
                 os.kill(self.pid, signal.SIGHUP)
@@ -262,6 +307,9 @@ class Terminal(Gtk.VBox):
                 # not what we should be doing.
                 dbg('os.kill failed: %s' % ex)
                 pass
+        if self.backend:
+            self.backend.close()
+            self.backend = None
 
         if self.vte:
             self.terminalbox.remove(self.vte)
@@ -378,6 +426,21 @@ class Terminal(Gtk.VBox):
         self.vte.match_remove(self.matches[name])
         del(self.matches[name])
 
+    def connect_latency(self):
+        """Watch for our contents changing and being drawn, but only while
+        latency is being measured"""
+        if self.latency.enabled == self.measuring:
+            return
+        self.measuring = self.latency.enabled
+        if self.measuring:
+            self.cnxids.new(self.vte, 'contents-changed',
+                            lambda _vte: self.latency.reached(self, 'contents'))
+            self.cnxids.new(self.vte, 'draw',
+                            lambda _vte, _cr: self.latency.reached(self, 'draw'))
+        else:
+            self.cnxids.remove_signal(self.vte, 'contents-changed')
+            self.cnxids.remove_signal(self.vte, 'draw')
+
     def maybe_copy_clipboard(self):
         if self.config['copy_on_selection'] and self.vte.get_has_selection():
             self.vte.copy_clipboard()
@@ -388,6 +451,8 @@ class Terminal(Gtk.VBox):
         self.scrollbar.connect('button-press-event', self.on_buttonpress)
 
         self.cnxids.new(self.vte, 'key-press-event', self.on_keypress)
+        self.cnxids.new(self.vte, 'commit', self.on_commit)
+        self.connect_latency()
         self.cnxids.new(self.vte, 'button-press-event', self.on_buttonpress)
         self.cnxids.new(self.vte, 'scroll-event', self.on_mousewheel)
         self.cnxids.new(self.vte, 'popup-menu', self.popup_menu)
@@ -583,9 +648,11 @@ class Terminal(Gtk.VBox):
             # already in this group, no action needed
             return
         dbg('Terminal::set_group: Setting group to %s' % name)
+        old = self.group
         self.group = name
+        self.terminator.update_group_member(self, old, name)
         self.titlebar.set_group_label(name)
-        self.terminator.group_hoover()
+        self.invalidate_layout()
 
     def create_group(self, _item):
         """Trigger the creation of a group via the titlebar (because popup 
@@ -600,10 +667,9 @@ class Terminal(Gtk.VBox):
     def ungroup(self, _widget, data):
         """Remove a group"""
         # FIXME: Could we emit and have Terminator do this?
-        for term in self.terminator.terminals:
-            if term.group == data:
-                term.set_group(None, None)
-        self.terminator.group_hoover()
+        for term in list(self.terminator.group_members.get(data, ())):
+            term.set_group(None, None)
+        self.terminator.group_hoover(data)
 
     def set_groupsend(self, _widget, value):
         """Set the groupsend mode"""
@@ -619,10 +685,12 @@ class Terminal(Gtk.VBox):
     def do_autocleangroups_toggle(self):
         """Toggle the autocleangroups mode"""
         self.config['autoclean_groups'] = not self.config['autoclean_groups']
+        self.terminator.group_hoover()
 
     def reconfigure(self, _widget=None):
         """Reconfigure our settings"""
         dbg('Terminal::reconfigure')
+        self.connect_latency()
         self.cnxids.remove_signal(self.vte, 'realize')
 
         # Handle child command exiting
@@ -818,7 +886,7 @@ class Terminal(Gtk.VBox):
             elif self.config['scrollbar_position'] == 'right':
                 self.terminalbox.reorder_child(self.vte, 0)
 
-        self.titlebar.update()
+        self.titlebar.reconfigure()
         self.vte.queue_draw()
 
     def set_cursor_color(self):
@@ -880,6 +948,10 @@ class Terminal(Gtk.VBox):
         if not event:
             dbg('Terminal::on_keypress: Called on %s with no event' % widget)
             return False
+        self.latency.key_pressed(self)
+        if self.macros.recordings or \
+           self.terminator.groupsend != self.terminator.groupsend_type['off']:
+            self.start_typing()
 
         # FIXME: Does keybindings really want to live in Terminator()?
         mapping = self.terminator.keybindings.lookup(event)
@@ -909,20 +981,27 @@ class Terminal(Gtk.VBox):
             # to ^<key>
             if (mapping == "copy" and event.get_state() & Gdk.ModifierType.CONTROL_MASK):
                 if self.vte.get_has_selection():
-                    getattr(self, "key_" + mapping)()
+                    self.get_key_handler(mapping)()
                     return True
                 elif not self.config['smart_copy']:
                     return True
             else:
-                getattr(self, "key_" + mapping)()
+                self.get_key_handler(mapping)()
                 return True
 
         # FIXME: This is all clearly wrong. We should be doing this better
         #         maybe we can emit the key event and let Terminator() care?
         groupsend = self.terminator.groupsend
         groupsend_type = self.terminator.groupsend_type
+        if groupsend == groupsend_type['off']:
+            # Most keys end here, so keep this path short
+            return False
+        if self.config['broadcast_mode'] == 'bytes':
+            # on_commit() will pass on whatever this key sends our child
+            return False
+
         window_focussed = self.vte.get_toplevel().get_property('has-toplevel-focus')
-        if groupsend != groupsend_type['off'] and window_focussed and self.vte.is_focus():
+        if window_focussed and self.vte.is_focus():
             if self.group and groupsend == groupsend_type['group']:
                 self.terminator.group_emit(self, self.group, 'key-press-event',
                                            event)
@@ -931,6 +1010,48 @@ class Terminal(Gtk.VBox):
 
         return False
 
+    def get_key_handler(self, mapping):
+        """Return the bound key_ method for a keybinding action"""
+        try:
+            return(self.key_handlers[mapping])
+        except KeyError:
+            handler = getattr(self, 'key_' + mapping)
+            self.key_handlers[mapping] = handler
+            return(handler)
+
+    def start_typing(self):
+        """Note that what VTE commits until the main loop comes round again
+        was typed. Key presses are handled, and input methods commit what
+        they make of them, all in one go"""
+        if not self.typing:
+            self.typing = True
+            GLib.idle_add(self.stop_typing, priority=GLib.PRIORITY_HIGH)
+
+    def stop_typing(self):
+        """Anything VTE commits from here on was not typed"""
+        self.typing = False
+        return(False)
+
+    def on_commit(self, widget, text, size):
+        """Broadcast what we send our child, if broadcasting bytes, and
+        record it if we are recording a macro. VTE commits its own replies
+        to the child as well, such as mouse reports and answers to queries,
+        so only what it commits while handling a key press is broadcast or
+        recorded"""
+        if self.feeding or not self.typing:
+            return
+        self.latency.reached(self, 'commit')
+        if self.macros.recordings:
+            self.macros.record(self, text)
+        if self.config['broadcast_mode'] != 'bytes':
+            return
+        if self.terminator.groupsend == self.terminator.groupsend_type['off']:
+            return
+        window_focussed = self.vte.get_toplevel().get_property('has-toplevel-focus')
+        if window_focussed and self.vte.is_focus():
+            self.terminator.broadcast_bytes(self,
+                    text.encode('utf-8', 'surrogateescape'))
+
     def on_buttonpress(self, widget, event):
         """Handler for mouse events"""
         # Any button event should grab focus
@@ -1019,6 +1140,34 @@ class Terminal(Gtk.VBox):
             elif event.direction == Gdk.ScrollDirection.DOWN or SMOOTH_SCROLL_DOWN:
                 self.scroll_by_page(1)
                 return True
+
+        smooth = event.direction == Gdk.ScrollDirection.SMOOTH
+        if event.direction == Gdk.ScrollDirection.UP:
+            notches = -1
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            notches = 1
+        elif smooth:
+            notches = event.delta_y
+        else:
+            return False
+        adjustment = self.vte.get_vadjustment()
+        if adjustment.get_upper() <= adjustment.get_page_size():
+            # Nothing to scroll back through, e.g. on the alternate screen,
+            # where VTE turns the wheel into cursor keys
+            return False
+        speed = self.config['scroll_speed']
+        if notches and speed != 1:
+            # VTE scrolls the view, or reports the wheel to a program that
+            # asked for mouse events, so scale the event it gets. Only a
+            # smooth scroll can go part of a notch
+            event.direction = Gdk.ScrollDirection.SMOOTH
+            event.delta_y = notches * speed
+        if notches:
+            # As far as VTE scrolls the view, a tenth of a page per notch
+            rows = max(1, math.ceil(adjustment.get_page_increment() / 10))
+            self.scroller.wheel(notches * speed * rows, event.time)
+        if smooth and event.is_scroll_stop_event():
+            self.scroller.release(self.config['kinetic_scrolling'])
         return False
 
     def popup_menu(self, widget, event=None):
@@ -1160,6 +1309,7 @@ class Terminal(Gtk.VBox):
             else:
                  txt = txt.decode()
 
+            targets = self.terminator.get_target_terms(self)
             txt_lines = txt.split( "\r\n" )
             if txt_lines[-1] == '':
                 for line in txt_lines[:-1]:
@@ -1169,16 +1319,21 @@ class Terminal(Gtk.VBox):
                 else:
                     # It is a list of crlf terminated file:// URL. let's
                     # iterate over all elements except the last one.
-                    str=''
-                    for fname in txt_lines[:-1]:
-                        fname = "'%s'" % urlunquote(fname[7:].replace("'",
-                                                                      '\'\\\'\''))
-                        str += fname + ' '
-                    txt = str
+                    uris = txt_lines[:-1]
+                    if self.dropping:
+                        self.refuse_paste()
+                        return
+                    converter = UriConverter(uris,
+                            self.config['drop_tempfile_threshold'],
+                            lambda text: self.on_drop_paths(text, targets))
+                    if len(uris) <= DROP_BATCH:
+                        converter.run()
+                    else:
+                        self.dropping = converter
+                        self.dropping.start()
+                    return
             # Never send a CRLF to the terminal from here
-            txt = txt.rstrip('\r\n')
-            for term in self.terminator.get_target_terms(self):
-                term.feed(txt.encode())
+            self.drop_text(txt.rstrip('\r\n'), targets)
             return
 
         widgetsrc = data.terminator.terminals[int(selection_data.get_data())]
@@ -1214,6 +1369,31 @@ class Terminal(Gtk.VBox):
         srcpaned.hoover()
         widgetsrc.ensure_visible_and_focussed()
 
+    def on_drop_paths(self, text, targets):
+        """The quoted paths of dropped files are ready to paste"""
+        self.dropping = None
+        if self.vte:
+            self.drop_text(text, targets)
+
+    def drop_text(self, text, targets):
+        """Paste dropped text into targets, a chunk at a time if it is long"""
+        targets = [term for term in targets if term.vte]
+        if len(text) <= self.config['paste_chunk_size']:
+            self.record_paste(text)
+            for term in targets:
+                term.paste_text(text)
+        elif self.paste:
+            self.refuse_paste()
+        else:
+            self.record_paste(text)
+            self.start_paste(prepare_paste(text), targets)
+
+    def refuse_paste(self):
+        """Tell the user a paste or drop was thrown away because we are
+        still busy with the last one"""
+        err('Terminal::refuse_paste: still busy with the last paste or drop')
+        self.vte.error_bell()
+
     def get_location(self, term, x, y):
         """Get our location within the terminal"""
         pos = ''
@@ -1296,6 +1476,7 @@ class Terminal(Gtk.VBox):
 
     def on_window_focus_out(self):
         """Update our UI when the window loses focus"""
+        self.terminator.focus_styled = None
         self.titlebar.update('window-focus-out')
 
     def scrollbar_jump(self, position):
@@ -1310,6 +1491,7 @@ class Terminal(Gtk.VBox):
 
     def on_edit_done(self, _widget):
         """A child widget is done editing a label, return focus to VTE"""
+        self.invalidate_layout()
         self.vte.grab_focus()
 
     def deferred_on_vte_size_allocate(self, widget, allocation):
@@ -1324,6 +1506,12 @@ class Terminal(Gtk.VBox):
         self.pending_on_vte_size_allocate = False
         self.on_vte_size_allocate(widget, allocation)
 
+    def on_size_allocate(self, widget, allocation):
+        """We moved or changed size, which our window may have cached"""
+        window = self.get_toplevel()
+        if hasattr(window, 'invalidate_geometry'):
+            window.invalidate_geometry()
+
     def on_vte_size_allocate(self, widget, allocation):
         self.titlebar.update_terminal_size(self.vte.get_column_count(),
                 self.vte.get_row_count())
@@ -1497,14 +1685,20 @@ class Terminal(Gtk.VBox):
 
         dbg('Forking shell: "%s" with args: %s' % (shell, args))
         args.insert(0, shell)
-        result,  self.pid = self.vte.spawn_sync(Vte.PtyFlags.DEFAULT,
-                                                self.cwd,
-                                                args,
-                                                envv,
-                                                GLib.SpawnFlags.FILE_AND_ARGV_ZERO,
-                                                None,
-                                                None,
-                                                None)
+        if self.backend:
+            self.backend.close()
+            self.backend = None
+        if self.config['pty_backend']:
+            self.pid = self.spawn_backend_child(args, envv)
+        if not self.backend:
+            result,  self.pid = self.vte.spawn_sync(Vte.PtyFlags.DEFAULT,
+                                                    self.cwd,
+                                                    args,
+                                                    envv,
+                                                    GLib.SpawnFlags.FILE_AND_ARGV_ZERO,
+                                                    None,
+                                                    None,
+                                                    None)
         self.command = shell
 
         self.titlebar.update()
@@ -1513,6 +1707,23 @@ class Terminal(Gtk.VBox):
             self.vte.feed(_('Unable to start shell:') + shell)
             return -1
 
+    def spawn_backend_child(self, args, envv):
+        """Have the PTY daemon run our child, or reattach to the one it
+        already runs for our UUID. Returns the pid, or None on failure"""
+        env = dict(os.environ)
+        for item in envv:
+            key, _sep, value = item.partition('=')
+            env[key] = value
+
+        backend = PtyBackend(self)
+        pid = backend.open(self.uuid.urn, args[0], args[1:], self.cwd, env,
+                           self.config['pty_backend_buffer_size'])
+        if pid is None:
+            err('Terminal::spawn_backend_child: falling back to a local PTY')
+            return(None)
+        self.backend = backend
+        return(pid)
+
     def prepare_url(self, urlmatch):
         """Prepare a URL from a VTE match"""
         url = urlmatch[0]
@@ -1572,16 +1783,92 @@ class Terminal(Gtk.VBox):
 
     def paste_clipboard(self, primary=False):
         """Paste one of the two clipboards"""
-        for term in self.terminator.get_target_terms(self):
-            if primary:
-                term.vte.paste_primary()
-            else:
-                term.vte.paste_clipboard()
+        if self.paste:
+            self.refuse_paste()
+            return
+        if primary:
+            clipboard = Gtk.Clipboard.get(Gdk.SELECTION_PRIMARY)
+        else:
+            clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        targets = self.terminator.get_target_terms(self)
+        clipboard.request_text(self.on_paste_text, (targets, primary))
         self.vte.grab_focus()
 
+    def on_paste_text(self, _clipboard, text, data):
+        """The clipboard has handed us something to paste"""
+        targets, primary = data
+        if not text or not self.vte:
+            return
+        targets = [term for term in targets if term.vte]
+        self.record_paste(text)
+        if not hasattr(self.vte, 'paste_text') or \
+           (targets == [self] and len(text) <= self.config['paste_chunk_size']):
+            # Let VTE paste it, which only it knows how to do safely
+            # without paste_text()
+            for term in targets:
+                if primary:
+                    term.vte.paste_primary()
+                else:
+                    term.vte.paste_clipboard()
+            return
+        self.start_paste(prepare_paste(text), targets)
+
+    def record_paste(self, text):
+        """Keep a paste in the macro we are recording, as VTE sends it. It
+        is not typed, so on_commit() leaves it out"""
+        if self.macros.is_recording(self):
+            self.macros.record(self, prepare_paste(text).replace('\n', '\r'))
+
+    def start_paste(self, data, targets):
+        """Paste text, or feed bytes, to targets a chunk at a time, showing
+        our progress if it will take more than one chunk"""
+        chunk_size = self.config['paste_chunk_size']
+        self.paste = Paste(data, targets, chunk_size,
+                           self.config['paste_chunk_interval'])
+        self.paste.connect('progress', self.on_paste_progress)
+        self.paste.connect('finished', self.on_paste_finished)
+        if len(data) > chunk_size:
+            self.pastebar.set_fraction(0)
+            self.pastebar.show()
+        self.paste.start()
+
+    def on_paste_progress(self, _paste, fraction):
+        """Show how far our paste has got"""
+        self.pastebar.set_fraction(fraction)
+
+    def on_paste_finished(self, _paste):
+        """Our paste is done, or was cancelled"""
+        self.paste = None
+        self.pastebar.hide()
+
+    def on_cancel_paste(self, _widget=None):
+        """Stop pasting"""
+        if self.paste:
+            self.paste.cancel()
+
+    def paste_text(self, text):
+        """Paste text as if it came from the clipboard, so that it is
+        bracketed if our child asked for that and its control characters
+        are made harmless. VTE before 0.68 cannot do that, and the text is
+        fed as it is"""
+        if not hasattr(self.vte, 'paste_text'):
+            self.feed(text.encode('utf-8', 'surrogateescape'))
+            return
+        # This is not typed, so it is never broadcast
+        self.feeding = True
+        try:
+            self.vte.paste_text(text)
+        finally:
+            self.feeding = False
+
     def feed(self, text):
         """Feed the supplied text to VTE"""
-        self.vte.feed_child(text)
+        # This is not typed, so it is never broadcast
+        self.feeding = True
+        try:
+            self.vte.feed_child(text)
+        finally:
+            self.feeding = False
 
     def zoom_in(self):
         """Increase the font size"""
@@ -1676,7 +1963,16 @@ class Terminal(Gtk.VBox):
 
     def describe_layout(self, count, parent, global_layout, child_order):
         """Describe our layout"""
-        layout = {'type': 'Terminal', 'parent': parent, 'order': child_order}
+        fragment = self.get_layout_fragment()
+        return(util.emit_layout_fragment(fragment, count, parent,
+                                         global_layout, child_order))
+
+    def get_layout_fragment(self):
+        """Return our cached layout fragment, see util.emit_layout_fragment()"""
+        if self.layout_fragment is not None:
+            return(self.layout_fragment)
+
+        layout = {'type': 'Terminal'}
         if self.group:
             layout['group'] = self.group
         profile = self.get_profile()
@@ -1687,10 +1983,15 @@ class Terminal(Gtk.VBox):
         if title:
             layout['title'] = title
         layout['uuid'] = self.uuid
-        name = 'terminal%d' % count
-        count = count + 1
-        global_layout[name] = layout
-        return count
+        self.layout_fragment = [('terminal', layout, None, None)]
+        return(self.layout_fragment)
+
+    def invalidate_layout(self):
+        """Something we describe in our layout has changed"""
+        self.layout_fragment = None
+        parent = self.get_parent()
+        if hasattr(parent, 'invalidate_layout'):
+            parent.invalidate_layout()
 
     def create_layout(self, layout):
         """Apply our layout"""
@@ -1709,7 +2010,132 @@ class Terminal(Gtk.VBox):
         if 'directory' in layout and layout['directory'] != '':
             self.directory = layout['directory']
         if 'uuid' in layout and layout['uuid'] != '':
+            self.terminator.deregister_uuid(self)
             self.uuid = make_uuid(layout['uuid'])
+            self.terminator.register_uuid(self, 'Terminal')
+        self.invalidate_layout()
+
+    def on_prompt_mark(self, kind, argument):
+        """The shell marked the start of a prompt, command or output, or the
+        end of a command, at our cursor"""
+        _col, row = self.vte.get_cursor_position()
+        status = -1
+        if kind == 'D' and argument.isdigit():
+            status = int(argument)
+        self.prompts.add(row, kind, status)
+        self.prompts.trim(int(self.vte.get_vadjustment().get_lower()))
+
+    def has_prompt_marks(self):
+        """Whether we see the shell's prompt marks. VTE keeps the output to
+        itself, so they only pass through us when the pty backend runs the
+        shell. If they do not, say so and ring the bell"""
+        if self.backend:
+            return(True)
+        err('Terminal: prompt marks are only seen with pty_backend enabled')
+        self.vte.error_bell()
+        return(False)
+
+    def jump_to_prompt(self, forwards):
+        """Scroll the next or previous prompt to the top of the terminal"""
+        if not self.has_prompt_marks():
+            return
+        self.prompts.trim(int(self.vte.get_vadjustment().get_lower()))
+        top = int(self.scrollbar.get_value())
+        if forwards:
+            row = self.prompts.next(top)
+        else:
+            row = self.prompts.previous(top)
+        if row is None:
+            dbg('Terminal::jump_to_prompt: no more prompts')
+            return
+        self.scrollbar_jump(row)
+
+    def copy_last_output(self):
+        """Copy the output of the last command to run to both clipboards"""
+        if not self.has_prompt_marks():
+            return
+        self.prompts.trim(int(self.vte.get_vadjustment().get_lower()))
+        rows = self.prompts.last_output()
+        if rows is None:
+            dbg('Terminal::copy_last_output: no command output marked')
+            return
+        start, end = rows
+        if end is None:
+            # Still running, take everything up to the cursor
+            _col, end = self.vte.get_cursor_position()
+        else:
+            # The D mark starts the line after the output
+            end -= 1
+        if end < start:
+            return
+        text = self.vte.get_text_range(start, 0, end,
+                                       self.vte.get_column_count() - 1,
+                                       None)[0]
+        if not text:
+            return
+        text = text.rstrip('\n')
+        self.clipboard.set_text(text, len(text.encode('utf-8')))
+        Gtk.Clipboard.get(Gdk.SELECTION_PRIMARY).set_text(
+                text, len(text.encode('utf-8')))
+
+    def toggle_macro_recording(self, timed=None):
+        """Start recording a macro, or stop and ask what to call it"""
+        if timed is None:
+            timed = self.config['macro_timing']
+        if not self.macros.is_recording(self):
+            self.macros.start_recording(self, timed)
+            return
+        name = self.ask_macro_name()
+        self.macros.stop_recording(self, name, replace=True)
+        self.vte.grab_focus()
+
+    def ask_macro_name(self):
+        """Ask the user for the name of a new macro, and whether to replace
+        any macro that already has that name. Returns None if they would
+        rather throw it away"""
+        window = self.get_toplevel()
+        dialog = Gtk.Dialog(_('Save Macro'), window,
+                            Gtk.DialogFlags.MODAL,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.REJECT,
+                             Gtk.STOCK_OK, Gtk.ResponseType.ACCEPT))
+        dialog.set_default_response(Gtk.ResponseType.ACCEPT)
+        dialog.set_resizable(False)
+        dialog.set_border_width(8)
+
+        label = Gtk.Label(label=_('Enter a name for the recorded macro...'))
+        name = Gtk.Entry()
+        name.set_activates_default(True)
+        name.set_text(_('Macro %d') % (len(self.macros.list_macros()) + 1))
+
+        dialog.vbox.pack_start(label, False, False, 6)
+        dialog.vbox.pack_start(name, False, False, 6)
+
+        dialog.show_all()
+        result = None
+        while dialog.run() == Gtk.ResponseType.ACCEPT:
+            result = name.get_text() or None
+            if not result or not self.macros.get_macro(result) or \
+               self.confirm_replace_macro(dialog, result):
+                break
+            result = None
+        dialog.destroy()
+        return(result)
+
+    def confirm_replace_macro(self, parent, name):
+        """Ask whether to replace the macro called name"""
+        dialog = Gtk.MessageDialog(parent, Gtk.DialogFlags.MODAL,
+                Gtk.MessageType.QUESTION, Gtk.ButtonsType.YES_NO,
+                _('A macro called "%s" already exists. Replace it?') % name)
+        res = dialog.run()
+        dialog.destroy()
+        return(res == Gtk.ResponseType.YES)
+
+    def play_macro(self, name, paced=None):
+        """Type a macro into us, or into every terminal we broadcast to"""
+        if paced is None:
+            paced = self.config['macro_timing']
+        targets = self.terminator.get_target_terms(self)
+        self.macros.play(name, targets, paced)
 
     def scroll_by_page(self, pages):
         """Scroll up or down in pages"""
@@ -1890,6 +2316,23 @@ class Terminal(Gtk.VBox):
 
     def key_reset_clear(self):
         self.vte.reset (True, True)
+        self.prompts.clear()
+
+    def key_prev_prompt(self):
+        self.jump_to_prompt(False)
+
+    def key_next_prompt(self):
+        self.jump_to_prompt(True)
+
+    def key_copy_last_output(self):
+        self.copy_last_output()
+
+    def key_toggle_macro_recording(self):
+        self.toggle_macro_recording()
+
+    def key_play_last_macro(self):
+        if self.macros.last:
+            self.play_macro(self.macros.last)
 
     def key_create_group(self):
         self.titlebar.create_group()
@@ -9,7 +9,7 @@ from .version import APP_NAME
 from .translation import _
 from .encoding import TerminatorEncoding
 from .terminator import Terminator
-from .util import err, dbg, spawn_new_terminator
+from .util import err, dbg
 from .config import Config
 from .prefseditor import PrefsEditor
 from . import plugin
@@ -219,6 +219,7 @@ class TerminalPopupMenu(object):
 
         self.add_encoding_items(menu)
         self.add_layout_launcher(menu)
+        self.add_macro_items(menu)
 
         try:
             menuitems = []
@@ -250,9 +251,56 @@ class TerminalPopupMenu(object):
         layouts = self.config.list_layouts()
         for layout in layouts:
                 item = Gtk.MenuItem(layout)
-                item.connect('activate', lambda x: spawn_new_terminator(self.terminator.origcwd, ['-u', '-l', layout]))
+                item.connect('activate', lambda x, name:
+                             self.terminator.launch_layout(name), layout)
                 submenu.append(item)
 
+    def add_macro_items(self, menu):
+        """Add the macro recording and playing items to the menu"""
+        terminal = self.terminal
+        macros = terminal.macros
+        item = Gtk.MenuItem.new_with_mnemonic(_('_Macros'))
+        menu.append(item)
+        submenu = Gtk.Menu()
+        item.set_submenu(submenu)
+
+        if macros.is_recording(terminal):
+            item = Gtk.MenuItem.new_with_mnemonic(_('_Stop recording'))
+            item.connect('activate',
+                         lambda x: terminal.toggle_macro_recording())
+            submenu.append(item)
+        else:
+            item = Gtk.MenuItem.new_with_mnemonic(_('_Record'))
+            item.connect('activate',
+                         lambda x: terminal.toggle_macro_recording(False))
+            submenu.append(item)
+            item = Gtk.MenuItem.new_with_mnemonic(_('Record with _timing'))
+            item.connect('activate',
+                         lambda x: terminal.toggle_macro_recording(True))
+            submenu.append(item)
+
+        names = macros.list_macros()
+        if names:
+            submenu.append(Gtk.SeparatorMenuItem())
+        for name in names:
+            item = Gtk.MenuItem(name)
+            submenu.append(item)
+            actions = Gtk.Menu()
+            item.set_submenu(actions)
+
+            item = Gtk.MenuItem.new_with_mnemonic(_('_Play'))
+            item.connect('activate', lambda x, name:
+                         terminal.play_macro(name, False), name)
+            actions.append(item)
+            if macros.get_macro(name).is_timed():
+                item = Gtk.MenuItem.new_with_mnemonic(_('Play with _timing'))
+                item.connect('activate', lambda x, name:
+                             terminal.play_macro(name, True), name)
+                actions.append(item)
+            item = Gtk.MenuItem.new_with_mnemonic(_('_Delete'))
+            item.connect('activate', lambda x, name: macros.delete(name), name)
+            actions.append(item)
+
     def add_encoding_items(self, menu):
         """Add the encoding list to the menu"""
         terminal = self.terminal
@@ -6,15 +6,16 @@ import copy
 import os
 import gi
 gi.require_version('Vte', '2.91')
-from gi.repository import Gtk, Gdk, Vte
+from gi.repository import GObject, Gtk, Gdk, Vte
 from gi.repository.GLib import GError
 
 from . import borg
 from .borg import Borg
 from .config import Config
 from .keybindings import Keybindings
-from .util import dbg, err, enumerate_descendants
+from .util import dbg, err, walk_descendants
 from .factory import Factory
+from .latency import LatencyMonitor
 from .version import APP_NAME, APP_VERSION
 
 try:
@@ -45,10 +46,13 @@ class Terminator(Borg):
     windowtitle = None
     terminals = None
     groups = None
+    group_members = None
+    uuids = None
     config = None
     keybindings = None
     style_providers = None
     last_focused_term = None
+    focus_styled = None
 
     origcwd = None
     dbus_path = None
@@ -63,6 +67,8 @@ class Terminator(Borg):
 
     groupsend = None
     groupsend_type = {'all':0, 'group':1, 'off':2}
+    broadcast_pending = None
+    broadcast_idle = None
 
     cur_gtk_theme_name = None
     gtk_settings = None
@@ -83,7 +89,13 @@ class Terminator(Borg):
         if not self.terminals:
             self.terminals = []
         if not self.groups:
-            self.groups = []
+            self.groups = {}
+        if self.group_members is None:
+            self.group_members = {}
+        if self.uuids is None:
+            self.uuids = {}
+        if self.broadcast_pending is None:
+            self.broadcast_pending = {}
         if not self.config:
             self.config = Config()
         if self.groupsend == None:
@@ -126,6 +138,7 @@ class Terminator(Borg):
             dbg('Terminator::register_window: registering %s:%s' % (id(window),
                 type(window)))
             self.windows.append(window)
+            self.register_uuid(window, 'Window')
 
     def deregister_window(self, window):
         """de-register a window widget"""
@@ -135,6 +148,8 @@ class Terminator(Borg):
             self.windows.remove(window)
         else:
             err('%s is not in registered window list' % window)
+        self.deregister_uuid(window)
+        self.hoover_uuids(window)
 
         if len(self.windows) == 0:
             # We have no windows left, we should exit
@@ -168,12 +183,20 @@ class Terminator(Borg):
             dbg('Terminator::register_terminal: registering %s:%s' %
                     (id(terminal), type(terminal)))
             self.terminals.append(terminal)
+            self.register_uuid(terminal, 'Terminal')
+            self.focus_styled = None
+            if terminal.group:
+                self.update_group_member(terminal, None, terminal.group)
 
     def deregister_terminal(self, terminal):
         """De-register a terminal widget"""
         dbg('Terminator::deregister_terminal: de-registering %s:%s' %
                 (id(terminal), type(terminal)))
         self.terminals.remove(terminal)
+        self.deregister_uuid(terminal)
+        self.focus_styled = None
+        if terminal.group:
+            self.update_group_member(terminal, terminal.group, None)
 
         if len(self.terminals) == 0:
             dbg('no terminals remain, destroying all windows')
@@ -183,23 +206,74 @@ class Terminator(Borg):
             dbg('Terminator::deregister_terminal: %d terminals remain' %
                     len(self.terminals))
 
+    def deregister_terminals(self, terminals):
+        """De-register a number of terminal widgets at once. Returns the
+        ones that were registered"""
+        registered = set(self.terminals)
+        terminals = [term for term in terminals if term in registered]
+        if not terminals:
+            return(terminals)
+        dbg('Terminator::deregister_terminals: de-registering %d terminals' %
+                len(terminals))
+        closing = set(terminals)
+        self.terminals[:] = [term for term in self.terminals
+                             if term not in closing]
+        self.focus_styled = None
+        for terminal in terminals:
+            self.deregister_uuid(terminal)
+            if terminal.group:
+                self.update_group_member(terminal, terminal.group, None)
+
+        if len(self.terminals) == 0:
+            dbg('no terminals remain, destroying all windows')
+            for window in self.windows:
+                window.destroy()
+        return(terminals)
+
+    def register_uuid(self, widget, kind=None):
+        """Index a widget by its UUID. kind is the Factory type of the
+        widget, or 'Tab' for the label of a Notebook page"""
+        if getattr(widget, 'uuid', None) is None:
+            return
+        if kind is None:
+            kind = Factory().type(widget)
+        self.uuids[widget.uuid.urn] = (kind, widget)
+
+    def deregister_uuid(self, widget):
+        """Remove a widget from the UUID index"""
+        if getattr(widget, 'uuid', None) is None:
+            return
+        entry = self.uuids.get(widget.uuid.urn)
+        if entry and entry[1] is widget:
+            del(self.uuids[widget.uuid.urn])
+
+    def hoover_uuids(self, window):
+        """Forget the containers and tabs of a window that has gone away"""
+        for urn, (kind, widget) in list(self.uuids.items()):
+            if kind in ['Terminal', 'Window']:
+                continue
+            toplevel = widget.get_toplevel()
+            if toplevel is window or toplevel not in self.windows:
+                del(self.uuids[urn])
+
+    def find_by_uuid(self, uuid, kind=None):
+        """Return the widget with the supplied UUID, optionally only if it
+        is of the given kind"""
+        entry = self.uuids.get(uuid)
+        if not entry:
+            return None
+        if kind and entry[0] != kind and \
+           not (kind == 'Paned' and entry[0] in ['HPaned', 'VPaned']):
+            return None
+        return entry[1]
+
     def find_terminal_by_uuid(self, uuid):
-        """Search our terminals for one matching the supplied UUID"""
-        dbg('searching self.terminals for: %s' % uuid)
-        for terminal in self.terminals:
-            dbg('checking: %s (%s)' % (terminal.uuid.urn, terminal))
-            if terminal.uuid.urn == uuid:
-                return terminal
-        return None
+        """Return the terminal with the supplied UUID"""
+        return self.find_by_uuid(uuid, 'Terminal')
 
     def find_window_by_uuid(self, uuid):
-        """Search our terminals for one matching the supplied UUID"""
-        dbg('searching self.terminals for: %s' % uuid)
-        for window in self.windows:
-            dbg('checking: %s (%s)' % (window.uuid.urn, window))
-            if window.uuid.urn == uuid:
-                return window
-        return None
+        """Return the window with the supplied UUID"""
+        return self.find_by_uuid(uuid, 'Window')
 
     def new_window(self, cwd=None, profile=None):
         """Create a window with a Terminal in it"""
@@ -311,6 +385,16 @@ class Terminator(Borg):
 
         self.layoutname = layoutname
 
+    def launch_layout(self, layoutname):
+        """Open the windows of a layout in this process"""
+        dbg('Terminator::launch_layout: %s' % layoutname)
+        try:
+            self.create_layout(layoutname)
+        except (KeyError, ValueError) as ex:
+            err('layout creation failed, creating a window ("%s")' % ex)
+            self.new_window()
+        self.layout_done()
+
     def layout_done(self):
         """Layout operations have finished, record that fact"""
         self.doing_layout = False
@@ -379,6 +463,7 @@ class Terminator(Borg):
 
     def reconfigure(self):
         """Update configuration for the whole application"""
+        self.focus_styled = None
 
         if self.style_providers != []:
             for style_provider in self.style_providers:
@@ -505,6 +590,8 @@ class Terminator(Borg):
                 self.style_providers[idx],
                 Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION+idx)
 
+        LatencyMonitor().reconfigure()
+
         # Cause all the terminals to reconfigure
         for terminal in self.terminals:
             terminal.reconfigure()
@@ -532,48 +619,175 @@ class Terminator(Borg):
         """Create a new group"""
         if name not in self.groups:
             dbg('Terminator::create_group: registering group %s' % name)
-            self.groups.append(name)
+            self.groups[name] = None
+
+    def update_group_member(self, terminal, old, new):
+        """Move a terminal from group old to group new in the group index.
+        Either may be None. The members of each group are kept as the keys
+        of a dict, so they always come out in the order they joined"""
+        self.focus_styled = None
+        if old is not None:
+            members = self.group_members.get(old)
+            if members:
+                members.pop(terminal, None)
+                if not members:
+                    del(self.group_members[old])
+                    self.group_hoover(old)
+        if new is not None:
+            self.group_members.setdefault(new, {})[terminal] = None
 
     def closegroupedterms(self, group):
         """Close all terminals in a group"""
-        for terminal in self.terminals[:]:
-            if terminal.group == group:
-                terminal.close()
+        self.close_terminals(self.group_members.get(group, ()))
+
+    def close_terminals(self, terminals):
+        """Close a number of terminals at once. Everything that is going away
+        is cut out of the widget tree first, each container left with one
+        child collapses once, and the group and focus bookkeeping is done at
+        the end, rather than after every terminal"""
+        closing = set(terminals)
+        if not closing:
+            return
+        maker = Factory()
 
-    def group_hoover(self):
-        """Clean out unused groups"""
+        # A zoomed window has to put its tree back before we can prune it
+        for window in self.windows:
+            if not window.get_property('term_zoomed'):
+                continue
+            hidden = walk_descendants(window.zoom_data['old_child'])[1]
+            if window.zoom_data['widget'] in closing or \
+               not closing.isdisjoint(hidden):
+                window.unzoom(None)
+
+        doomed_windows = []
+        doomed = []
+        paneds = []
+        notebooks = []
+        refocus = []
+        for window in self.windows:
+            containers, terminals, _spans = window.get_tree_model()
+            if closing.isdisjoint(terminals):
+                continue
+            # A container is doomed when all of its children are, so work
+            # upwards from the terminals
+            dead = set(term for term in terminals if term in closing)
+            for container in reversed(containers):
+                if all(child in dead for child in container.get_children()):
+                    dead.add(container)
+            for container in containers:
+                if container in dead:
+                    container.cnxids.remove_all()
+                    self.deregister_uuid(container)
+                    if maker.isinstance(container, 'Notebook'):
+                        for child in container.get_children():
+                            self.deregister_uuid(
+                                    container.get_tab_label(child))
+            if window.get_child() in dead:
+                doomed_windows.append(window)
+                continue
+
+            focussed = window.get_focussed_terminal()
+            if focussed is None or focussed in closing:
+                refocus.append(window)
+            # Cut each doomed subtree out where it joins the survivors
+            for widget in containers + terminals:
+                parent = widget.get_parent()
+                if widget not in dead or parent in dead:
+                    continue
+                if maker.isinstance(parent, 'Notebook'):
+                    if widget in parent.last_active_term:
+                        del(parent.last_active_term[widget])
+                    if parent not in notebooks:
+                        notebooks.append(parent)
+                else:
+                    paneds.append(parent)
+                parent.remove(widget)
+                doomed.append(widget)
+
+        dbg('Terminator::close_terminals: closing %d terminals, pruning %d '
+            'subtrees and %d windows' % (len(closing), len(doomed),
+                                         len(doomed_windows)))
+        for terminal in self.deregister_terminals(closing):
+            terminal.cnxids.remove_widget(terminal.vte)
+            terminal.hangup()
+        for widget in doomed:
+            widget.destroy()
+        for window in doomed_windows:
+            window.destroy()
+
+        for paned in paneds:
+            paned.hoover()
+            paned.cnxids.remove_all()
+        for notebook in notebooks:
+            notebook.hoover()
+            notebook.clean_last_active_term()
+
+        self.group_hoover()
+        for window in refocus:
+            terminals = window.get_visible_terminals()
+            if terminals:
+                list(terminals.keys())[0].grab_focus()
+
+    def group_hoover(self, group=None):
+        """Clean out unused groups, or just the supplied one"""
 
         if self.config['autoclean_groups']:
-            inuse = []
-            todestroy = []
-
-            for terminal in self.terminals:
-                if terminal.group:
-                    if not terminal.group in inuse:
-                        inuse.append(terminal.group)
-
-            for group in self.groups:
-                if not group in inuse:
-                    todestroy.append(group)
+            if group is None:
+                todestroy = [name for name in self.groups
+                             if name not in self.group_members]
+            elif group in self.groups and group not in self.group_members:
+                todestroy = [group]
+            else:
+                return
 
             dbg('Terminator::group_hoover: %d groups, hoovering %d' %
                     (len(self.groups), len(todestroy)))
-            for group in todestroy:
-                self.groups.remove(group)
+            for name in todestroy:
+                del(self.groups[name])
 
     def group_emit(self, terminal, group, type, event):
         """Emit to each terminal in a group"""
         dbg('Terminator::group_emit: emitting a keystroke for group %s' %
                 group)
-        for term in self.terminals:
-            if term != terminal and term.group == group:
+        for term in self.group_members.get(group, ()):
+            if term != terminal:
                 term.vte.emit(type, eventkey2gdkevent(event))
+        LatencyMonitor().reached(terminal, 'broadcast')
 
     def all_emit(self, terminal, type, event):
         """Emit to all terminals"""
         for term in self.terminals:
             if term != terminal:
                 term.vte.emit(type, eventkey2gdkevent(event))
+        LatencyMonitor().reached(terminal, 'broadcast')
+
+    def broadcast_bytes(self, terminal, data):
+        """Queue bytes that terminal sent its child, for the terminals it is
+        broadcasting to. Everything queued in one main loop iteration is
+        written out together"""
+        pending = self.broadcast_pending.get(terminal)
+        if pending is None:
+            self.broadcast_pending[terminal] = bytearray(data)
+        else:
+            pending.extend(data)
+        if self.broadcast_idle is None:
+            self.broadcast_idle = GObject.idle_add(self.flush_broadcast,
+                    priority=GObject.PRIORITY_HIGH_IDLE)
+
+    def flush_broadcast(self):
+        """Write out everything queued by broadcast_bytes()"""
+        pending = self.broadcast_pending
+        self.broadcast_pending = {}
+        self.broadcast_idle = None
+        for terminal, data in pending.items():
+            if not terminal.vte:
+                continue
+            data = bytes(data)
+            for term in self.get_target_terms(terminal):
+                if term is not terminal and term.vte:
+                    term.feed(data)
+            LatencyMonitor().reached(terminal, 'broadcast')
+        return(False)
 
     def do_enumerate(self, widget, pad):
         """Insert the number of each terminal in a group, into that terminal"""
@@ -582,21 +796,31 @@ class Terminator(Borg):
         else:
             numstr = '%d'
 
-        terminals = []
-        for window in self.windows:
-            containers, win_terminals = enumerate_descendants(window)
-            terminals.extend(win_terminals)
-
+        numbers = self.get_terminal_numbers()
+        feeds = []
         for term in self.get_target_terms(widget):
-            idx = terminals.index(term)
-            term.feed(numstr % (idx + 1))
+            if term not in numbers:
+                dbg('%s is not in any window, not numbering it' % term)
+                continue
+            feeds.append((term, numstr % numbers[term]))
+
+        for term, text in feeds:
+            term.feed(text)
+
+    def get_terminal_numbers(self):
+        """Return a dict mapping each terminal to its number, counting from
+        1 across all windows in layout order"""
+        numbers = {}
+        for window in self.windows:
+            for term in window.get_tree_model()[1]:
+                numbers[term] = len(numbers) + 1
+        return(numbers)
 
     def get_sibling_terms(self, widget):
-        termset = []
-        for term in self.terminals:
-            if term.group == widget.group:
-                termset.append(term)
-        return(termset)
+        """Return the terminals in the same group as widget"""
+        if widget.group is None:
+            return([term for term in self.terminals if term.group is None])
+        return(list(self.group_members.get(widget.group, ())))
 
     def get_target_terms(self, widget):
         """Get the terminals we should currently be broadcasting to"""
@@ -615,10 +839,23 @@ class Terminator(Borg):
         return(None)
 
     def focus_changed(self, widget):
-        """We just moved focus to a new terminal"""
-        for terminal in self.terminals:
+        """We just moved focus to a new terminal. Only the titlebars of the
+        terminals that had and have the focus, and of their groups, can
+        look any different. If anything else has changed since they were
+        last styled, such as the groups or groupsend, every titlebar works
+        out how it should look now"""
+        previous, groupsend = self.focus_styled or (None, None)
+        if previous and widget and groupsend == self.groupsend:
+            terminals = {previous: None, widget: None}
+            for terminal in (previous, widget):
+                if terminal.group:
+                    terminals.update(self.group_members.get(terminal.group,
+                                                            {}))
+        else:
+            terminals = self.terminals
+        for terminal in terminals:
             terminal.titlebar.update(widget)
-        return
+        self.focus_styled = (widget, self.groupsend)
 
     def focus_left(self, widget):
         self.last_focused_term=widget
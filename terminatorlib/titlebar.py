@@ -14,6 +14,11 @@ from .terminator import Terminator
 from .editablelabel import EditableLabel
 from .translation import _
 
+# How a titlebar looks, depending on where the focus is
+TRANSMIT, RECEIVE, INACTIVE, FOCUS_OUT = range(4)
+STATE_COLORS = {TRANSMIT: 'transmit', RECEIVE: 'receive',
+                INACTIVE: 'inactive', FOCUS_OUT: 'inactive'}
+
 # pylint: disable-msg=R0904
 # pylint: disable-msg=W0613
 class Titlebar(Gtk.EventBox):
@@ -31,6 +36,9 @@ class Titlebar(Gtk.EventBox):
     grouplabel = None
     groupentry = None
     bellicon = None
+    text = None
+    font = None
+    state = None
 
     __gsignals__ = {
             'clicked': (GObject.SignalFlags.RUN_LAST, None, ()),
@@ -102,8 +110,12 @@ class Titlebar(Gtk.EventBox):
         self.ebox.connect('button-press-event', func)
 
     def update(self, other=None):
-        """Update our contents"""
-        default_bg = False
+        """Update our contents. If other is given, it is the terminal that
+        now has the focus, or 'window-focus-out', and we restyle ourselves
+        to suit if that makes us look any different"""
+        if other:
+            self.update_style(other)
+            return
 
         temp_heldtext_str = ''
         temp_sizetext_str = ''
@@ -112,77 +124,93 @@ class Titlebar(Gtk.EventBox):
             temp_heldtext_str = _('[INACTIVE: Right-Click for Relaunch option] ')
         if not self.config['title_hide_sizetext']:
             temp_sizetext_str = " %s" % (self.sizetext)
-        self.label.set_text("%s%s%s" % (temp_heldtext_str, self.termtext, temp_sizetext_str))
+        text = "%s%s%s" % (temp_heldtext_str, self.termtext, temp_sizetext_str)
+        if text != self.text:
+            self.text = text
+            self.label.set_text(text)
 
         if (not self.config['title_use_system_font']) and self.config['title_font']:
-            title_font = Pango.FontDescription(self.config['title_font'])
+            font = self.config['title_font']
         else:
-            title_font = Pango.FontDescription(self.config.get_system_prop_font())
-        self.label.modify_font(title_font)
-        self.grouplabel.modify_font(title_font)
-
-        if other:
-            term = self.terminal
-            terminator = self.terminator
-            if other == 'window-focus-out':
-                title_fg = self.config['title_inactive_fg_color']
-                title_bg = self.config['title_inactive_bg_color']
+            font = self.config.get_system_prop_font()
+        if font != self.font:
+            self.font = font
+            title_font = Pango.FontDescription(font)
+            self.label.modify_font(title_font)
+            self.grouplabel.modify_font(title_font)
+
+    def get_state(self, other):
+        """Work out how we should look, as a tuple of the states of our
+        title and our group label, our icon and our visibility"""
+        term = self.terminal
+        terminator = self.terminator
+        groupsend = terminator.groupsend
+        groupsend_type = terminator.groupsend_type
+        if other == 'window-focus-out':
+            title = group = FOCUS_OUT
+            icon = '_receive_off'
+        elif term != other and term.group and term.group == other.group:
+            if groupsend == groupsend_type['off']:
+                title = INACTIVE
+                icon = '_receive_off'
+            else:
+                title = RECEIVE
+                icon = '_receive_on'
+            group = RECEIVE
+        elif term != other and not term.group or term.group != other.group:
+            if groupsend == groupsend_type['all']:
+                title = RECEIVE
+                icon = '_receive_on'
+            else:
+                title = INACTIVE
                 icon = '_receive_off'
-                default_bg = True
-                group_fg = self.config['title_inactive_fg_color']
-                group_bg = self.config['title_inactive_bg_color']
-            elif term != other and term.group and term.group == other.group:
-                if terminator.groupsend == terminator.groupsend_type['off']:
-                    title_fg = self.config['title_inactive_fg_color']
-                    title_bg = self.config['title_inactive_bg_color']
-                    icon = '_receive_off'
-                    default_bg = True
-                else:
-                    title_fg = self.config['title_receive_fg_color']
-                    title_bg = self.config['title_receive_bg_color']
-                    icon = '_receive_on'
-                group_fg = self.config['title_receive_fg_color']
-                group_bg = self.config['title_receive_bg_color']
-            elif term != other and not term.group or term.group != other.group:
-                if terminator.groupsend == terminator.groupsend_type['all']:
-                    title_fg = self.config['title_receive_fg_color']
-                    title_bg = self.config['title_receive_bg_color']
-                    icon = '_receive_on'
-                else:
-                    title_fg = self.config['title_inactive_fg_color']
-                    title_bg = self.config['title_inactive_bg_color']
-                    icon = '_receive_off'
-                    default_bg = True
-                group_fg = self.config['title_inactive_fg_color']
-                group_bg = self.config['title_inactive_bg_color']
+            group = INACTIVE
+        else:
+            # We're the active terminal
+            title = group = TRANSMIT
+            if groupsend == groupsend_type['all']:
+                icon = '_active_broadcast_all'
+            elif groupsend == groupsend_type['group']:
+                icon = '_active_broadcast_group'
             else:
-                # We're the active terminal
-                title_fg = self.config['title_transmit_fg_color']
-                title_bg = self.config['title_transmit_bg_color']
-                if terminator.groupsend == terminator.groupsend_type['all']:
-                    icon = '_active_broadcast_all'
-                elif terminator.groupsend == terminator.groupsend_type['group']:
-                    icon = '_active_broadcast_group'
-                else:
-                    icon = '_active_broadcast_off'
-                group_fg = self.config['title_transmit_fg_color']
-                group_bg = self.config['title_transmit_bg_color']
-
-            self.label.modify_fg(Gtk.StateType.NORMAL,
-                    Gdk.color_parse(title_fg))
-            self.grouplabel.modify_fg(Gtk.StateType.NORMAL,
-                    Gdk.color_parse(group_fg))
-            self.modify_bg(Gtk.StateType.NORMAL, 
-                    Gdk.color_parse(title_bg))
-            if not self.get_desired_visibility():
-                if default_bg == True:
-                    color = term.get_style_context().get_background_color(Gtk.StateType.NORMAL)  # VERIFY FOR GTK3
-                else:
-                    color = Gdk.color_parse(title_bg)
-            self.update_visibility()
-            self.ebox.modify_bg(Gtk.StateType.NORMAL,
-                    Gdk.color_parse(group_bg))
-            self.set_from_icon_name(icon, Gtk.IconSize.MENU)
+                icon = '_active_broadcast_off'
+        return((title, group, icon, self.get_desired_visibility()))
+
+    def update_style(self, other):
+        """Restyle ourselves for the focus being on other, unless we
+        already look the part. Most of the titlebars are left alone when
+        the focus moves"""
+        state = self.get_state(other)
+        if state == self.state:
+            return
+        self.state = state
+        title, group, icon, _visible = state
+
+        title_fg, title_bg = self.get_colors(title)
+        group_fg, group_bg = self.get_colors(group)
+        self.label.modify_fg(Gtk.StateType.NORMAL,
+                Gdk.color_parse(title_fg))
+        self.grouplabel.modify_fg(Gtk.StateType.NORMAL,
+                Gdk.color_parse(group_fg))
+        self.modify_bg(Gtk.StateType.NORMAL,
+                Gdk.color_parse(title_bg))
+        self.update_visibility()
+        self.ebox.modify_bg(Gtk.StateType.NORMAL,
+                Gdk.color_parse(group_bg))
+        self.set_from_icon_name(icon, Gtk.IconSize.MENU)
+
+    def get_colors(self, state):
+        """Return the configured foreground and background colours for a
+        state"""
+        name = STATE_COLORS[state]
+        return(self.config['title_%s_fg_color' % name],
+               self.config['title_%s_bg_color' % name])
+
+    def reconfigure(self):
+        """Our configuration may have changed, so forget how we look"""
+        self.state = None
+        self.font = None
+        self.update()
 
     def update_visibility(self):
         """Make the titlebar be visible or not"""
@@ -199,10 +227,8 @@ class Titlebar(Gtk.EventBox):
         """Returns True if the titlebar is supposed to be visible. False if
         not"""
         if self.editing() == True or self.terminal.group:
-            dbg('implicit desired visibility')
             return(True)
         else:
-            dbg('configured visibility: %s' % self.config['show_titlebar'])
             return(self.config['show_titlebar'])
 
     def set_from_icon_name(self, name, size = Gtk.IconSize.MENU):
@@ -321,5 +347,8 @@ class Titlebar(Gtk.EventBox):
         """Set a custom string"""
         self.label.set_text(string)
         self.label.set_custom()
+        # That replaced the title the label falls back to, so set it again
+        # on our next update
+        self.text = None
 
 GObject.type_register(Titlebar)
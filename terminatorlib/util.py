@@ -275,6 +275,20 @@ def get_nav_offset(edge, allocation, direction):
     else:
         raise ValueError('Unknown direction: %s' % direction)
 
+def get_nav_target_edge(allocation, direction):
+    """Return the edge of the supplied allocation that navigating in the given
+    direction would reach it by"""
+    if direction == 'left':
+        return(allocation.x + allocation.width)
+    elif direction == 'right':
+        return(allocation.x)
+    elif direction == 'up':
+        return(allocation.y + allocation.height)
+    elif direction == 'down':
+        return(allocation.y)
+    else:
+        raise ValueError('Unknown direction: %s' % direction)
+
 def get_nav_tiebreak(direction, cursor_x, cursor_y, rect):
     """We have multiple candidate terminals. Pick the closest by cursor
     position"""
@@ -287,38 +301,137 @@ def get_nav_tiebreak(direction, cursor_x, cursor_y, rect):
 
 def enumerate_descendants(parent):
     """Walk all our children and build up a list of containers and
-    terminals"""
+    terminals, in the order they appear in the layout (depth first), which
+    is also the order that cycling through terminals follows. Inside a
+    Window this is answered from the Window's cached tree model, and the
+    lists must not be modified"""
+    if parent is None:
+        err('no parent widget specified')
+        return
+
+    toplevel = parent.get_toplevel()
+    descendants = None
+    if hasattr(toplevel, 'get_descendants'):
+        descendants = toplevel.get_descendants(parent)
+    if descendants is None:
+        containers, terminals, _spans = walk_descendants(parent)
+        descendants = (containers, terminals)
+
+    dbg('%d containers and %d terminals fall beneath %s' % (
+        len(descendants[0]), len(descendants[1]), parent))
+    return(descendants)
+
+def walk_descendants(parent):
+    """Walk the widget tree below parent depth first. Returns the lists of
+    containers and terminals in layout order, and a dict mapping each
+    container to the (start, end) slices of both lists that it covers"""
     # FIXME: Does having to import this here mean we should move this function
     # back to Container?
     from .factory import Factory
 
-    containerstmp = []
     containers = []
     terminals = []
+    spans = {}
     maker = Factory()
 
-    if parent is None:
-        err('no parent widget specified')
-        return
-
-    for descendant in parent.get_children():
-        if maker.isinstance(descendant, 'Container'):
-            containerstmp.append(descendant)
-        elif maker.isinstance(descendant, 'Terminal'):
-            terminals.append(descendant)
-
-        while len(containerstmp) > 0:
-            child = containerstmp.pop(0)
-            for descendant in child.get_children():
-                if maker.isinstance(descendant, 'Container'):
-                    containerstmp.append(descendant)
-                elif maker.isinstance(descendant, 'Terminal'):
-                    terminals.append(descendant)
-            containers.append(child)
-
-    dbg('%d containers and %d terminals fall beneath %s' % (len(containers), 
-        len(terminals), parent))
-    return(containers, terminals)
+    stack = [(False, child) for child in reversed(parent.get_children())]
+    while stack:
+        leaving, widget = stack.pop()
+        if leaving:
+            start = spans[widget]
+            spans[widget] = (start[0], len(containers), start[1],
+                             len(terminals))
+        elif maker.isinstance(widget, 'Container'):
+            containers.append(widget)
+            spans[widget] = (len(containers), len(terminals))
+            stack.append((True, widget))
+            for child in reversed(widget.get_children()):
+                stack.append((False, child))
+        elif maker.isinstance(widget, 'Terminal'):
+            terminals.append(widget)
+
+    return(containers, terminals, spans)
+
+def emit_layout_fragment(fragment, count, parent, global_layout, child_order):
+    """Add a cached layout fragment to global_layout, naming its entries the
+    way describe_layout() always has. A fragment is a list of (prefix, entry,
+    parent offset, order) tuples in numbering order. Parent offsets are
+    relative, so fragments can be nested without being rewritten. The first
+    tuple describes the root of the fragment, which takes the supplied parent
+    and child_order. Returns the next free count.
+
+    >>> layout = {}
+    >>> fragment = [('child', {'type': 'HPaned'}, None, None),
+    ...             ('terminal', {'type': 'Terminal'}, -1, 0),
+    ...             ('terminal', {'type': 'Terminal'}, -2, 1)]
+    >>> emit_layout_fragment(fragment, 1, 'child0', layout, 0)
+    4
+    >>> sorted(layout.keys())
+    ['child1', 'terminal2', 'terminal3']
+    >>> layout['terminal3']
+    {'type': 'Terminal', 'parent': 'child1', 'order': 1}
+    """
+    names = []
+    for index, (prefix, entry, offset, order) in enumerate(fragment):
+        name = '%s%d' % (prefix, count)
+        count = count + 1
+        names.append(name)
+
+        layout = {'type': entry['type']}
+        if offset is None:
+            layout['parent'] = parent
+            layout['order'] = child_order
+        else:
+            layout['parent'] = names[index + offset]
+            layout['order'] = order
+        layout.update(entry)
+        global_layout[name] = layout
+    return(count)
+
+def summarise_layout(layout):
+    """Count the windows, tabs and terminals in a flat layout description
+    and list the profiles it uses. A window without a notebook counts as
+    one tab.
+
+    >>> summary = summarise_layout({
+    ...     'window0': {'type': 'Window', 'parent': ''},
+    ...     'child1': {'type': 'Notebook', 'parent': 'window0'},
+    ...     'terminal2': {'type': 'Terminal', 'parent': 'child1'},
+    ...     'child3': {'type': 'HPaned', 'parent': 'child1'},
+    ...     'terminal4': {'type': 'Terminal', 'parent': 'child3',
+    ...                   'profile': 'work'},
+    ...     'terminal5': {'type': 'Terminal', 'parent': 'child3'}})
+    >>> sorted(summary.items())
+    [('profiles', ['default', 'work']), ('tabs', 2), ('terminals', 3), ('windows', 1)]
+    """
+    windows = 0
+    tabs = 0
+    terminals = 0
+    profiles = set()
+    notebooks = set()
+    for name, item in layout.items():
+        if item.get('type') == 'Notebook':
+            notebooks.add(name)
+
+    parents_with_notebooks = set()
+    for name, item in layout.items():
+        kind = item.get('type')
+        if kind == 'Window':
+            windows += 1
+        elif kind == 'Terminal':
+            terminals += 1
+            profiles.add(item.get('profile') or 'default')
+        if item.get('parent') in notebooks:
+            tabs += 1
+        if name in notebooks:
+            parents_with_notebooks.add(item.get('parent'))
+
+    for name, item in layout.items():
+        if item.get('type') == 'Window' and name not in parents_with_notebooks:
+            tabs += 1
+
+    return({'windows': windows, 'tabs': tabs, 'terminals': terminals,
+            'profiles': sorted(profiles)})
 
 def make_uuid(str_uuid=None):
     """Generate a UUID for an object"""
@@ -2,8 +2,8 @@
 # GPL v2 only
 """window.py - class for the main Terminator window"""
 
-import copy
 import time
+from bisect import bisect_left
 import uuid
 import gi
 from gi.repository import GObject
@@ -23,6 +23,7 @@ from .version import APP_NAME
 from .container import Container
 from .factory import Factory
 from .terminator import Terminator
+from .session import SessionStore
 if display_manager() == 'X11':
     try:
         gi.require_version('Keybinder', '3.0')
@@ -48,8 +49,13 @@ class Window(Container, Gtk.Window):
     set_pos_by_ratio = None
     last_active_term = None
     preventHide = None
+    layout_volatile = True
 
     zoom_data = None
+    tree_model = None
+    tree_slices = None
+    nav_index = None
+    visible_terminals = None
 
     term_zoomed = False
     __gproperties__ = {
@@ -298,8 +304,21 @@ class Window(Container, Gtk.Window):
     def on_destroy_event(self, widget, data=None):
         """Handle window destruction"""
         dbg('destroying self')
-        for terminal in self.get_visible_terminals():
-            terminal.close()
+        detach = False
+        if self.terminator.windows == [self]:
+            # We are the last window, so this is the last chance to save. If
+            # the session was saved, leave its shells running so that
+            # --restore-session can pick them up again
+            detach = SessionStore().autosave()
+        # Our whole tree is going, so there is nothing to collapse. Just let
+        # go of every terminal in it, including any hidden behind a zoom
+        terminals = list(self.get_tree_model()[1])
+        if self.get_property('term_zoomed'):
+            terminals.extend(
+                    util.walk_descendants(self.zoom_data['old_child'])[1])
+        for terminal in self.terminator.deregister_terminals(terminals):
+            terminal.cnxids.remove_widget(terminal.vte)
+            terminal.hangup(detach)
         self.cnxids.remove_all()
         self.terminator.deregister_window(self)
         self.destroy()
@@ -408,6 +427,7 @@ class Window(Container, Gtk.Window):
         """Add a widget to the window by way of Gtk.Window.add()"""
         maker = Factory()
         Gtk.Window.add(self, widget)
+        self.invalidate_tree()
         if maker.isinstance(widget, 'Terminal'):
             signals = {'close-term': self.closeterm,
                        'title-change': self.title.set_title,
@@ -439,6 +459,7 @@ class Window(Container, Gtk.Window):
         """Remove our child widget by way of Gtk.Window.remove()"""
         Gtk.Window.remove(self, widget)
         self.disconnect_child(widget)
+        self.invalidate_tree()
         return(True)
 
     def get_children(self):
@@ -447,6 +468,93 @@ class Window(Container, Gtk.Window):
         children.append(self.get_child())
         return(children)
 
+    def invalidate_layout(self):
+        """Drop cached layout fragments, including those of the tree that
+        is hidden while a terminal is zoomed"""
+        Container.invalidate_layout(self)
+        if self.get_property('term_zoomed'):
+            self.zoom_data['old_parent'].invalidate_layout()
+
+    def invalidate_tree(self, container=None):
+        """The children of container have changed. Update its part of our
+        tree model, or drop the whole model if the change was ours or the
+        container is not in it; it will be rebuilt when next needed"""
+        if self.tree_model is None or container is None or \
+           container is self or container not in self.tree_model[2] or \
+           not self.update_tree(container):
+            self.tree_model = None
+        self.tree_slices = None
+        self.invalidate_geometry()
+
+    def update_tree(self, container):
+        """Walk just the part of the tree below container again, and splice
+        it into our tree model in place. Returns False if container is no
+        longer below us"""
+        ancestors = set()
+        widget = container
+        while widget is not self:
+            if widget is None:
+                return(False)
+            ancestors.add(widget)
+            widget = widget.get_parent()
+
+        containers, terminals, spans = self.tree_model
+        cstart, cend, tstart, tend = spans[container]
+        for widget in containers[cstart:cend]:
+            del(spans[widget])
+        new_containers, new_terminals, new_spans = \
+                util.walk_descendants(container)
+        containers[cstart:cend] = new_containers
+        terminals[tstart:tend] = new_terminals
+        cdelta = len(new_containers) - (cend - cstart)
+        tdelta = len(new_terminals) - (tend - tstart)
+
+        if cdelta or tdelta:
+            for widget, (first, last, tfirst, tlast) in spans.items():
+                if widget in ancestors:
+                    spans[widget] = (first, last + cdelta, tfirst,
+                                     tlast + tdelta)
+                elif first > cend:
+                    # Comes after container, so it has moved along
+                    spans[widget] = (first + cdelta, last + cdelta,
+                                     tfirst + tdelta, tlast + tdelta)
+        for widget, (first, last, tfirst, tlast) in new_spans.items():
+            spans[widget] = (first + cstart, last + cstart, tfirst + tstart,
+                             tlast + tstart)
+        return(True)
+
+    def get_tree_model(self):
+        """Return our containers and terminals in layout order, and the
+        slices of those lists that each container covers"""
+        if self.tree_model is None:
+            self.tree_model = util.walk_descendants(self)
+        return(self.tree_model)
+
+    def get_descendants(self, widget=None):
+        """Return the containers and terminals below widget, or below us.
+        Returns None if widget is not a container in our tree. The lists are
+        shared until the tree changes, so callers must not modify them"""
+        containers, terminals, spans = self.get_tree_model()
+        if widget is None or widget is self:
+            return(containers, terminals)
+        if self.tree_slices is None:
+            self.tree_slices = {}
+        elif widget in self.tree_slices:
+            return(self.tree_slices[widget])
+        if widget not in spans:
+            return(None)
+        cstart, cend, tstart, tend = spans[widget]
+        descendants = (containers[cstart:cend], terminals[tstart:tend])
+        self.tree_slices[widget] = descendants
+        return(descendants)
+
+    def get_layout_children(self):
+        """Return the child to describe in a layout, which is not the one
+        being shown while a terminal is zoomed"""
+        if self.get_property('term_zoomed'):
+            return([self.zoom_data['old_child']])
+        return(self.get_children())
+
     def hoover(self):
         """Ensure we still have a reason to exist"""
         if not self.get_child():
@@ -557,14 +665,10 @@ class Window(Container, Gtk.Window):
             child = child.get_nth_page(pagenum)
 
         if maker.isinstance(child, 'Paned'):
-            parent = child.get_parent()
-            # Need to get the allocation before we remove the child,
-            # otherwise _sometimes_ we get incorrect values.
             alloc = child.get_allocation()
-            parent.remove(child)
-            child.rotate_recursive(parent, alloc.width, alloc.height, clockwise)
+            child.rotate_tree(alloc.width, alloc.height, clockwise)
+            self.invalidate_tree()
 
-            self.show_all()
             while Gtk.events_pending():
                 Gtk.main_iteration_do(False)
             widget.grab_focus()
@@ -573,7 +677,12 @@ class Window(Container, Gtk.Window):
 
     def get_visible_terminals(self):
         """Walk down the widget tree to find all of the visible terminals.
-        Mostly using Container::get_visible_terminals()"""
+        Mostly using Container::get_visible_terminals(). The result is cached
+        until something is allocated, shown or hidden, so callers must not
+        modify it"""
+        if self.visible_terminals is not None:
+            return(self.visible_terminals)
+
         terminals = {}
         if not hasattr(self, 'cached_maker'):
             self.cached_maker = Factory()
@@ -595,6 +704,7 @@ class Window(Container, Gtk.Window):
         else:
             err('Unknown child type %s' % type(child))
 
+        self.visible_terminals = terminals
         return(terminals)
 
     def get_focussed_terminal(self):
@@ -794,76 +904,85 @@ class Window(Container, Gtk.Window):
 
     def navigate_terminal(self, terminal, direction):
         """Navigate around terminals"""
-        _containers, terminals = util.enumerate_descendants(self)
-        visibles = self.get_visible_terminals()
-        current = terminals.index(terminal)
-        length = len(terminals)
-        next = None
-
-        if length <= 1 or len(visibles) <= 1:
-            return
-
-        if direction in ['next', 'prev']:
-            tmpterms = copy.copy(terminals)
-            tmpterms = tmpterms[current+1:]
-            tmpterms.extend(terminals[0:current])
-
-            if direction == 'next':
-                tmpterms.reverse()
-
-            next = 0
-            while len(tmpterms) > 0:
-                tmpitem = tmpterms.pop()
-                if tmpitem in visibles:
-                    next = terminals.index(tmpitem)
-                    break
-        elif direction in ['left', 'right', 'up', 'down']:
-            layout = self.get_visible_terminals()
-            allocation = terminal.get_allocation()
-            possibles = []
-
-            # Get the co-ordinate of the appropriate edge for this direction
-            edge, p1, p2 = util.get_edge(allocation, direction)
-            # Find all visible terminals which are, in their entirity, in the
-            # direction we want to move, and are at least partially spanning
-            # p1 to p2
-            for term in layout:
-                rect = layout[term]
-                if util.get_nav_possible(edge, rect, direction, p1, p2):
-                    possibles.append(term)
-
-            if len(possibles) == 0:
-                return
-
-            # Find out how far away each of the possible terminals is, then
-            # find the smallest distance. The winning terminals are all of
-            # those who are that distance away.
-            offsets = {}
-            for term in possibles:
-                rect = layout[term]
-                offsets[term] = util.get_nav_offset(edge, rect, direction)
-            keys = list(offsets.values())
-            keys.sort()
-            winners = [k for k, v in offsets.items() if v == keys[0]]
-            next = terminals.index(winners[0])
-
-            if len(winners) > 1:
-                # Break an n-way tie using the cursor position
-                term_alloc = terminal.get_allocation()
-                cursor_x = term_alloc.x + term_alloc.width / 2
-                cursor_y = term_alloc.y + term_alloc.height / 2
-
-                for term in winners:
-                    rect = layout[term]
-                    if util.get_nav_tiebreak(direction, cursor_x, cursor_y,
-                            rect):
-                        next = terminals.index(term)
-                        break;
-        else:
+        if direction not in ['next', 'prev', 'left', 'right', 'up', 'down']:
             err('Unknown navigation direction: %s' % direction)
+            return
 
-        if next is not None:
-            terminals[next].grab_focus()
+        if self.nav_index is None:
+            _containers, terminals = util.enumerate_descendants(self)
+            self.nav_index = self.build_nav_index(terminals,
+                                                  self.get_visible_terminals())
+        target = self.nav_index.get((terminal, direction))
+        if target is not None:
+            target.grab_focus()
+
+    def invalidate_geometry(self):
+        """Something moved, was resized, shown or hidden, so forget which
+        terminals neighbour each other and where they are"""
+        self.nav_index = None
+        self.visible_terminals = None
+
+    def build_nav_index(self, terminals, visibles):
+        """Work out where navigating in each direction goes from every
+        terminal, as a dict mapping (terminal, direction) to the terminal to
+        move to. This is done once per change of geometry: the edges that a
+        terminal can be reached by are sorted once per direction, so each
+        terminal only looks at the edges nearest to it"""
+        index = {}
+        if len(terminals) <= 1 or len(visibles) <= 1:
+            return(index)
+
+        # next and prev go to the nearest visible terminal in layout order
+        length = len(terminals)
+        following = preceding = None
+        for num in range(2 * length - 1, -1, -1):
+            term = terminals[num % length]
+            if num < length:
+                index[(term, 'next')] = following
+            if term in visibles:
+                following = term
+        for num in range(2 * length):
+            term = terminals[num % length]
+            if num >= length:
+                index[(term, 'prev')] = preceding
+            if term in visibles:
+                preceding = term
+
+        for direction in ['left', 'right', 'up', 'down']:
+            # Group the terminals by the edge we would reach them by. Left
+            # and up look for the largest edge, so sort those backwards
+            sign = -1 if direction in ['left', 'up'] else 1
+            groups = {}
+            for term, rect in visibles.items():
+                edge = util.get_nav_target_edge(rect, direction)
+                groups.setdefault(sign * edge, []).append(term)
+            edges = sorted(groups)
+
+            for term, allocation in visibles.items():
+                edge, p1, p2 = util.get_edge(allocation, direction)
+                winners = []
+                for key in edges[bisect_left(edges, sign * edge):]:
+                    # The nearest edge with a terminal alongside us wins
+                    winners = [other for other in groups[key] if
+                               util.get_nav_possible(edge, visibles[other],
+                                                     direction, p1, p2)]
+                    if winners:
+                        break
+                if not winners:
+                    continue
+
+                target = winners[0]
+                if len(winners) > 1:
+                    # Break an n-way tie using the cursor position
+                    cursor_x = allocation.x + allocation.width / 2
+                    cursor_y = allocation.y + allocation.height / 2
+                    for other in winners:
+                        if util.get_nav_tiebreak(direction, cursor_x,
+                                                 cursor_y, visibles[other]):
+                            target = other
+                            break
+                index[(term, direction)] = target
+        return(index)
 
     def create_layout(self, layout):
         """Apply any config items from our layout"""
@@ -903,6 +1022,14 @@ class Window(Container, Gtk.Window):
         if 'last_active_window' in layout and layout['last_active_window'] == 'True':
             self.terminator.last_active_window = self.uuid
 
+        if 'zoomed' in layout and layout['zoomed'] not in ['', None]:
+            terminal = self.terminator.find_terminal_by_uuid(
+                    make_uuid(layout['zoomed']).urn)
+            if terminal:
+                font_scale = layout.get('zoom_font_scale') == 'True'
+                # Zoom once the layout has settled, or ratios are lost
+                GObject.idle_add(self.zoom, terminal, font_scale)
+
 class WindowTitle(object):
     """Class to handle the setting of the window title"""
 
@@ -0,0 +1,182 @@
+"""Shared pytest configuration for the Terminator test suite.
+
+The widget tree benchmarks are opt-in. They only run when pytest is given
+--benchmark, and they need an X display. If DISPLAY is not set, a private
+Xvfb server is started for the duration of the session.
+
+    python -m pytest tests --benchmark --benchmark-json=results.json
+    python -m pytest tests --benchmark --benchmark-compare=results.json
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import pytest
+
+XVFB_SCREEN = '1920x1080x24'
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('terminator benchmarks')
+    group.addoption('--benchmark', action='store_true', default=False,
+                    help='run the widget tree benchmarks')
+    group.addoption('--benchmark-json', metavar='PATH', default=None,
+                    help='write the benchmark results to PATH as JSON')
+    group.addoption('--benchmark-compare', metavar='PATH', default=None,
+                    help='fail benchmarks that are slower than the baseline '
+                         'results stored in PATH')
+    group.addoption('--benchmark-tolerance', metavar='FRACTION', type=float,
+                    default=0.25,
+                    help='allowed slowdown against the baseline before a '
+                         'benchmark fails (default: 0.25)')
+    group.addoption('--benchmark-rounds', metavar='N', type=int, default=5,
+                    help='number of timed rounds per benchmark (default: 5)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers',
+                            'benchmark: widget tree benchmark, only run '
+                            'with --benchmark')
+    config.benchmark_results = {}
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    path = config.getoption('--benchmark-json')
+    if not path or not config.benchmark_results:
+        return
+    from terminatorlib.version import APP_VERSION
+    data = {'version': APP_VERSION,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': config.benchmark_results}
+    with open(path, 'w') as fileobj:
+        json.dump(data, fileobj, indent=2, sort_keys=True)
+
+
+@pytest.fixture(scope='session')
+def display():
+    """Make sure there is an X display, starting Xvfb if we have to"""
+    if os.environ.get('DISPLAY'):
+        yield os.environ['DISPLAY']
+        return
+
+    xvfb = shutil.which('Xvfb')
+    if not xvfb:
+        pytest.skip('no DISPLAY set and Xvfb is not installed')
+
+    readfd, writefd = os.pipe()
+    proc = subprocess.Popen([xvfb, '-displayfd', str(writefd), '-screen',
+                             '0', XVFB_SCREEN, '-nolisten', 'tcp'],
+                            pass_fds=(writefd,),
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    os.close(writefd)
+    with os.fdopen(readfd) as reader:
+        number = reader.readline().strip()
+    if not number:
+        proc.kill()
+        pytest.skip('Xvfb failed to start')
+
+    os.environ['DISPLAY'] = ':%s' % number
+    try:
+        yield os.environ['DISPLAY']
+    finally:
+        del os.environ['DISPLAY']
+        proc.terminate()
+        proc.wait()
+
+
+@pytest.fixture(scope='session')
+def terminator_env(display):
+    """Point Terminator at an empty configuration directory so the user's
+    own config cannot skew the numbers"""
+    confdir = tempfile.mkdtemp(prefix='terminator-bench-')
+    saved = os.environ.get('XDG_CONFIG_HOME')
+    os.environ['XDG_CONFIG_HOME'] = confdir
+    try:
+        yield confdir
+    finally:
+        if saved is None:
+            del os.environ['XDG_CONFIG_HOME']
+        else:
+            os.environ['XDG_CONFIG_HOME'] = saved
+        shutil.rmtree(confdir, ignore_errors=True)
+
+
+def flush_events():
+    """Run the GTK main loop until there is nothing left to do"""
+    from gi.repository import Gtk
+    while Gtk.events_pending():
+        Gtk.main_iteration_do(False)
+
+
+class BenchmarkRecorder(object):
+    """Time a callable over a number of rounds and record the result"""
+
+    def __init__(self, config):
+        self.results = config.benchmark_results
+        self.rounds = config.getoption('--benchmark-rounds')
+        self.tolerance = config.getoption('--benchmark-tolerance')
+        self.baseline = None
+        path = config.getoption('--benchmark-compare')
+        if path:
+            with open(path) as fileobj:
+                self.baseline = json.load(fileobj).get('results', {})
+
+    def __call__(self, name, func, setup=None, teardown=None, rounds=None):
+        """Run setup(), time func(state) and run teardown(state), once per
+        round. Pending GTK events are processed inside the timed region, so
+        the numbers include the resulting size allocation and drawing."""
+        timings = []
+        for _ in range(rounds or self.rounds):
+            state = setup() if setup else None
+            flush_events()
+            start = time.perf_counter()
+            func(state)
+            flush_events()
+            timings.append(time.perf_counter() - start)
+            if teardown:
+                teardown(state)
+            flush_events()
+
+        timings.sort()
+        result = {'rounds': len(timings),
+                  'min': timings[0],
+                  'max': timings[-1],
+                  'mean': sum(timings) / len(timings),
+                  'median': timings[len(timings) // 2]}
+        self.results[name] = result
+        self.compare(name, result)
+        return(result)
+
+    def compare(self, name, result):
+        """Fail if the median is worse than the baseline plus tolerance"""
+        if not self.baseline or name not in self.baseline:
+            return
+        previous = self.baseline[name]['median']
+        limit = previous * (1 + self.tolerance)
+        if result['median'] > limit:
+            pytest.fail('%s regressed: median %.4fs, baseline %.4fs '
+                        '(tolerance %d%%)' % (name, result['median'], previous,
+                                              self.tolerance * 100))
+
+
+@pytest.fixture
+def benchmark(request, terminator_env):
+    return(BenchmarkRecorder(request.config))
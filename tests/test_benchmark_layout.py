@@ -0,0 +1,438 @@
+"""Benchmarks for building and manipulating the widget tree.
+
+These only run with --benchmark (see conftest.py). Each benchmark builds
+its own windows from a generated layout and tears them down afterwards, so
+they can run in any order.
+"""
+
+import pytest
+
+from conftest import flush_events
+
+pytestmark = pytest.mark.benchmark
+
+GRID_SIZES = [4, 16, 64]
+TAB_COUNTS = [4, 16, 32]
+DIRECTIONS = ['up', 'down', 'left', 'right']
+
+
+class LayoutBuilder(object):
+    """Generate layouts in the same flat format that describe_layout()
+    produces and the config file stores"""
+
+    def __init__(self):
+        self.layout = {}
+        self.count = 0
+
+    def node(self, kind, parent, order, **extra):
+        if kind == 'Terminal':
+            name = 'terminal%d' % self.count
+        else:
+            name = 'child%d' % self.count
+        self.count += 1
+        entry = {'type': kind, 'order': order}
+        if parent:
+            entry['parent'] = parent
+        entry.update(extra)
+        self.layout[name] = entry
+        return(name)
+
+    def split(self, kind, parent, order, count, leaf):
+        """Lay count leaves out under parent as a balanced tree of Paneds"""
+        if count == 1:
+            return(leaf(parent, order))
+        first = count // 2
+        paned = self.node(kind, parent, order,
+                          ratio=str(float(first) / count))
+        self.split(kind, paned, 0, first, leaf)
+        self.split(kind, paned, 1, count - first, leaf)
+        return(paned)
+
+    def terminal(self, parent, order):
+        return(self.node('Terminal', parent, order))
+
+
+def grid_layout(panes):
+    """A window split into a roughly square grid of panes"""
+    builder = LayoutBuilder()
+    window = builder.node('Window', None, 0, size=[1600, 1000])
+    columns = int(panes ** 0.5)
+    rows = panes // columns
+
+    def row(parent, order):
+        return(builder.split('HPaned', parent, order, columns,
+                             builder.terminal))
+
+    builder.split('VPaned', window, 0, rows, row)
+    return(builder.layout)
+
+
+def tabs_layout(tabs):
+    """A window with a notebook of single terminal tabs"""
+    builder = LayoutBuilder()
+    window = builder.node('Window', None, 0, size=[1600, 1000])
+    notebook = builder.node('Notebook', window, 0,
+                            labels=['tab %d' % i for i in range(tabs)])
+    for num in range(tabs):
+        builder.terminal(notebook, num)
+    return(builder.layout)
+
+
+@pytest.fixture
+def terminator(monkeypatch, terminator_env):
+    from gi.repository import Gtk
+    from terminatorlib.terminator import Terminator
+
+    # Closing the last window calls Gtk.main_quit(), but the benchmarks drive
+    # the main loop themselves
+    monkeypatch.setattr(Gtk, 'main_quit', lambda: None)
+    instance = Terminator()
+    yield instance
+    close_all(instance)
+
+
+def close_all(terminator):
+    for terminal in terminator.terminals[:]:
+        terminal.close()
+    flush_events()
+    for window in terminator.windows[:]:
+        window.destroy()
+        terminator.deregister_window(window)
+    flush_events()
+
+
+def build(terminator, name, layout):
+    """Build a layout and return the first window"""
+    terminator.config.base.layouts[name] = layout
+    terminator.create_layout(name)
+    terminator.layout_done()
+    flush_events()
+    return(terminator.windows[0])
+
+
+@pytest.mark.parametrize('panes', GRID_SIZES)
+def test_create_layout_grid(benchmark, terminator, panes):
+    layout = grid_layout(panes)
+    terminator.config.base.layouts['bench'] = layout
+
+    def run(_state):
+        terminator.create_layout('bench')
+        terminator.layout_done()
+
+    benchmark('create_layout_grid[%d]' % panes, run,
+              teardown=lambda _state: close_all(terminator))
+    assert not terminator.terminals
+
+
+@pytest.mark.parametrize('tabs', TAB_COUNTS)
+def test_create_layout_tabs(benchmark, terminator, tabs):
+    terminator.config.base.layouts['bench'] = tabs_layout(tabs)
+
+    def run(_state):
+        terminator.create_layout('bench')
+        terminator.layout_done()
+
+    benchmark('create_layout_tabs[%d]' % tabs, run,
+              teardown=lambda _state: close_all(terminator))
+
+
+@pytest.mark.parametrize('splits', [15, 63])
+def test_split_axis(benchmark, terminator, splits):
+    def setup():
+        window, terminal = terminator.new_window()
+        flush_events()
+        return(window, terminal)
+
+    def run(state):
+        window, terminal = state
+        for num in range(splits):
+            terminal.get_parent().split_axis(terminal, num % 2 == 0)
+            terminal = terminator.terminals[-1]
+
+    benchmark('split_axis[%d]' % splits, run, setup=setup,
+              teardown=lambda _state: close_all(terminator))
+    assert not terminator.windows
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_closeterm(benchmark, terminator, panes):
+    def run(_state):
+        for terminal in terminator.terminals[1:]:
+            terminal.close()
+
+    benchmark('closeterm[%d]' % panes, run,
+              setup=lambda: build(terminator, 'bench', grid_layout(panes)),
+              teardown=lambda _state: close_all(terminator))
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_rotate(benchmark, terminator, panes):
+    window = build(terminator, 'bench', grid_layout(panes))
+
+    def run(_state):
+        for clockwise in (True, False, True, False):
+            window.rotate(terminator.terminals[0], clockwise)
+            flush_events()
+
+    benchmark('rotate[%d]' % panes, run)
+    assert len(terminator.terminals) == panes
+
+
+@pytest.mark.parametrize('clockwise', [True, False])
+def test_rotate_events(benchmark, terminator, clockwise):
+    """Count how often the VTEs of a 16 pane grid are realized, unrealized
+    and allocated while it is rotated a quarter turn at a time"""
+    window = build(terminator, 'bench', grid_layout(16))
+    signals = ('realize', 'unrealize', 'size-allocate')
+    counts = dict([(signal, 0) for signal in signals])
+    counts['rotations'] = 0
+    parents = [terminal.get_parent() for terminal in terminator.terminals]
+
+    def count(*args):
+        counts[args[-1]] += 1
+
+    for terminal in terminator.terminals:
+        for signal in signals:
+            terminal.vte.connect(signal, count, signal)
+
+    def run(_state):
+        window.rotate(terminator.terminals[0], clockwise)
+        flush_events()
+        counts['rotations'] += 1
+
+    result = benchmark('rotate_events[%s]' % clockwise, run, rounds=4)
+    for signal in signals:
+        result[signal] = float(counts[signal]) / counts['rotations']
+    assert len(terminator.terminals) == 16
+    # The Paneds turn round in place, so no terminal leaves its parent for
+    # good and no VTE has to be realized again
+    assert counts['realize'] == 0 and counts['unrealize'] == 0
+    assert [terminal.get_parent() for terminal in terminator.terminals] == \
+           parents
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_zoom_unzoom(benchmark, terminator, panes):
+    window = build(terminator, 'bench', grid_layout(panes))
+
+    def run(_state):
+        for terminal in terminator.terminals[:8]:
+            window.zoom(terminal, True)
+            flush_events()
+            window.unzoom(terminal)
+            flush_events()
+
+    benchmark('zoom_unzoom[%d]' % panes, run)
+    assert not window.get_property('term_zoomed')
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_navigate_terminal(benchmark, terminator, panes):
+    window = build(terminator, 'bench', grid_layout(panes))
+
+    def run(_state):
+        for terminal in terminator.terminals:
+            for direction in DIRECTIONS:
+                window.navigate_terminal(terminal, direction)
+
+    benchmark('navigate_terminal[%d]' % panes, run)
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_reconfigure(benchmark, terminator, panes):
+    build(terminator, 'bench', grid_layout(panes))
+
+    benchmark('reconfigure[%d]' % panes,
+              lambda _state: terminator.reconfigure())
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_describe_layout(benchmark, terminator, panes):
+    build(terminator, 'bench', grid_layout(panes))
+    terminal = terminator.terminals[0]
+
+    def run(_state):
+        for num in range(20):
+            # Dirty one pane per save, as an autosave timer would see it
+            terminal.set_group(None, 'group%d' % (num % 2))
+            terminator.describe_layout()
+
+    benchmark('describe_layout[%d]' % panes, run)
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_find_terminal_by_uuid(benchmark, terminator, panes):
+    build(terminator, 'bench', grid_layout(panes))
+    urns = [terminal.uuid.urn for terminal in terminator.terminals]
+
+    def run(_state):
+        for num in range(100):
+            for urn in urns:
+                terminator.find_terminal_by_uuid(urn)
+
+    benchmark('find_terminal_by_uuid[%d]' % panes, run)
+    assert all(terminator.find_terminal_by_uuid(urn) for urn in urns)
+
+
+def test_tree_walk(benchmark, terminator):
+    """Type checks over a tree of about 500 widgets: 256 terminals and the
+    255 Paneds holding them"""
+    from terminatorlib import util
+    from terminatorlib.factory import Factory
+
+    window = build(terminator, 'bench', grid_layout(256))
+    maker = Factory()
+
+    def run(_state):
+        for num in range(10):
+            containers, terminals, _spans = util.walk_descendants(window)
+            window.get_visible_terminals()
+            for widget in containers + terminals:
+                maker.type(widget)
+
+    benchmark('tree_walk[256]', run)
+    containers, terminals, _spans = util.walk_descendants(window)
+    assert len(containers) + len(terminals) == 511
+
+
+def test_enumerate(benchmark, terminator):
+    """Number 200 panes, as insert_terminal_number does while broadcasting
+    to all of them"""
+    build(terminator, 'bench', grid_layout(200))
+    def run(_state):
+        for num in range(10):
+            terminator.get_terminal_numbers()
+
+    benchmark('enumerate[200]', run)
+    numbers = terminator.get_terminal_numbers()
+    assert sorted(numbers.values()) == list(range(1, 201))
+
+
+@pytest.mark.parametrize('panes', [16, 64])
+def test_close_group(benchmark, terminator, panes):
+    """Close every other pane of a grid as one group"""
+    def setup():
+        build(terminator, 'bench', grid_layout(panes))
+        for terminal in terminator.terminals[::2]:
+            terminal.set_group(None, 'doomed')
+
+    def run(_state):
+        terminator.closegroupedterms('doomed')
+
+    benchmark('close_group[%d]' % panes, run, setup=setup,
+              teardown=lambda _state: close_all(terminator))
+    assert not terminator.windows
+
+
+@pytest.mark.parametrize('mode', ['keys', 'bytes'])
+@pytest.mark.parametrize('panes', [10, 50, 100])
+def test_broadcast(benchmark, terminator, mode, panes):
+    """Time from one terminal sending a short line until every other
+    terminal has been handed it, broadcasting to all"""
+    from gi.repository import Gdk
+
+    build(terminator, 'bench', grid_layout(panes))
+    source = terminator.terminals[0]
+    terminator.groupsend = terminator.groupsend_type['all']
+    text = 'echo broadcast\r'
+
+    def keys(_state):
+        for char in text:
+            event = Gdk.Event.new(Gdk.EventType.KEY_PRESS).key
+            event.window = source.vte.get_window()
+            event.keyval = Gdk.unicode_to_keyval(ord(char))
+            terminator.all_emit(source, 'key-press-event', event)
+
+    def send(_state):
+        for char in text:
+            terminator.broadcast_bytes(source, char.encode('utf-8'))
+
+    benchmark('broadcast_%s[%d]' % (mode, panes),
+              keys if mode == 'keys' else send)
+    assert not terminator.broadcast_pending
+
+
+def touchpad_flick():
+    """A two finger flick: smooth events every 4ms for 300ms, fast at first
+    and slowing down, then the fingers leave the touchpad"""
+    return([(num * 4, 0.6 * (1 - num / 100.0)) for num in range(75)] +
+           [(300, None)])
+
+
+def wheel_spin():
+    """A mouse wheel spun up 30 notches, a notch every 15ms"""
+    return([(num * 15, 'up') for num in range(30)])
+
+
+@pytest.mark.parametrize('stream', ['touchpad_flick', 'wheel_spin'])
+def test_wheel_replay(benchmark, terminator, stream):
+    """Replay a stream of wheel events in real time against a terminal with
+    a long scrollback, and count how often it is redrawn"""
+    import time
+    from gi.repository import Gdk, Gtk
+
+    events = {'touchpad_flick': touchpad_flick,
+              'wheel_spin': wheel_spin}[stream]()
+    build(terminator, 'bench', grid_layout(1))
+    terminal = terminator.terminals[0]
+    terminal.vte.feed(b''.join([b'line %d\r\n' % num for num in range(5000)]))
+    flush_events()
+    counts = {'draw': 0, 'events': 0, 'replays': 0}
+
+    def count(*_args):
+        counts['draw'] += 1
+
+    terminal.vte.connect('draw', count)
+    adjustment = terminal.vte.get_vadjustment()
+
+    def run(_state):
+        terminal.scroller.stop()
+        adjustment.set_value(adjustment.get_upper())
+        flush_events()
+        start = time.perf_counter()
+        for offset, delta in events:
+            while time.perf_counter() - start < offset / 1000.0:
+                Gtk.main_iteration_do(False)
+            if delta is None:
+                terminal.scroller.release(True)
+                continue
+            wrapper = Gdk.Event.new(Gdk.EventType.SCROLL)
+            event = wrapper.scroll
+            event.window = terminal.vte.get_window()
+            event.time = offset
+            if delta == 'up':
+                event.direction = Gdk.ScrollDirection.UP
+            else:
+                event.direction = Gdk.ScrollDirection.SMOOTH
+                event.delta_y = -delta
+            # Through our handler to VTE, as a real event goes
+            terminal.vte.event(wrapper)
+            counts['events'] += 1
+        # Let any fling run out
+        while terminal.scroller.tick_id is not None:
+            Gtk.main_iteration_do(True)
+        counts['replays'] += 1
+
+    result = benchmark('wheel_replay[%s]' % stream, run, rounds=3)
+    result['events'] = float(counts['events']) / counts['replays']
+    result['draw'] = float(counts['draw']) / counts['replays']
+    assert adjustment.get_value() < \
+        adjustment.get_upper() - adjustment.get_page_size()
+
+
+@pytest.mark.parametrize('panes', [16, 100])
+def test_focus_changed(benchmark, terminator, panes):
+    """Move the focus across a grid, restyling titlebars as it goes"""
+    from terminatorlib.titlebar import TRANSMIT
+
+    build(terminator, 'bench', grid_layout(panes))
+    terminals = terminator.terminals[:20]
+
+    def run(_state):
+        for terminal in terminals:
+            terminator.focus_changed(terminal)
+
+    benchmark('focus_changed[%d]' % panes, run)
+    transmitting = [term for term in terminator.terminals
+                    if term.titlebar.state[0] == TRANSMIT]
+    assert transmitting == [terminals[-1]]
@@ -0,0 +1,96 @@
+"""Tests for byte level broadcasting. The terminals here are stand-ins that
+borrow the methods of Terminal, so no X display is needed."""
+
+from gi.repository import GLib
+
+from terminatorlib.terminal import Terminal
+
+GROUPSEND_TYPE = {'all': 0, 'group': 1, 'off': 2}
+
+
+class FakeToplevel(object):
+    def get_property(self, name):
+        return(True)
+
+
+class FakeVte(object):
+    def get_toplevel(self):
+        return(FakeToplevel())
+
+    def is_focus(self):
+        return(True)
+
+
+class FakeLatency(object):
+    def reached(self, terminal, stage):
+        pass
+
+
+class FakeMacros(object):
+    recordings = {}
+
+
+class FakeTerminator(object):
+    groupsend_type = GROUPSEND_TYPE
+
+    def __init__(self, groupsend):
+        self.groupsend = groupsend
+        self.sent = []
+
+    def broadcast_bytes(self, terminal, data):
+        self.sent.append(data)
+
+
+class FakeTerminal(object):
+    feeding = False
+    typing = False
+
+    start_typing = Terminal.start_typing
+    stop_typing = Terminal.stop_typing
+    on_commit = Terminal.on_commit
+
+    def __init__(self, groupsend=GROUPSEND_TYPE['all'], mode='bytes'):
+        self.config = {'broadcast_mode': mode}
+        self.terminator = FakeTerminator(groupsend)
+        self.vte = FakeVte()
+        self.latency = FakeLatency()
+        self.macros = FakeMacros()
+
+
+def main_loop_turns():
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+
+def test_typed_input_is_broadcast():
+    terminal = FakeTerminal()
+    terminal.start_typing()
+    terminal.on_commit(None, 'ls\r', 3)
+    assert terminal.terminator.sent == [b'ls\r']
+
+
+def test_terminal_reply_is_not_broadcast():
+    terminal = FakeTerminal()
+    terminal.start_typing()
+    terminal.on_commit(None, 'x', 1)
+    main_loop_turns()
+    # A Device Attributes reply, committed once the key press is over
+    terminal.on_commit(None, '\x1b[?62;22c', 9)
+    assert terminal.typing is False
+    assert terminal.terminator.sent == [b'x']
+
+
+def test_fed_input_is_not_broadcast():
+    terminal = FakeTerminal()
+    terminal.start_typing()
+    terminal.feeding = True
+    terminal.on_commit(None, 'echo', 4)
+    assert terminal.terminator.sent == []
+
+
+def test_nothing_is_broadcast_in_key_mode():
+    terminal = FakeTerminal(mode='keys')
+    terminal.start_typing()
+    terminal.on_commit(None, 'ls', 2)
+    assert terminal.terminator.sent == []
@@ -0,0 +1,65 @@
+"""Tests for restyling titlebars as the focus moves. Like the benchmarks,
+these need an X display."""
+
+from test_benchmark_layout import build, grid_layout, terminator
+
+from terminatorlib.titlebar import INACTIVE, RECEIVE, TRANSMIT
+
+
+def count_states(terminator, monkeypatch):
+    """Count the titlebars that work out how they should look"""
+    counted = []
+    for terminal in terminator.terminals:
+        original = terminal.titlebar.get_state
+
+        def get_state(other, original=original, terminal=terminal):
+            counted.append(terminal)
+            return(original(other))
+
+        monkeypatch.setattr(terminal.titlebar, 'get_state', get_state)
+    return(counted)
+
+
+def titles(terminator):
+    return([term.titlebar.state[0] for term in terminator.terminals])
+
+
+def test_only_the_old_and_new_focus_are_restyled(terminator, monkeypatch):
+    build(terminator, 'focus', grid_layout(9))
+    terminals = terminator.terminals
+    terminator.focus_changed(terminals[0])
+    counted = count_states(terminator, monkeypatch)
+
+    terminator.focus_changed(terminals[4])
+    assert sorted(counted, key=terminals.index) == [terminals[0],
+                                                    terminals[4]]
+    assert titles(terminator) == [INACTIVE] * 4 + [TRANSMIT] + [INACTIVE] * 4
+
+
+def test_groups_of_the_old_and_new_focus_are_restyled(terminator,
+                                                      monkeypatch):
+    build(terminator, 'focus', grid_layout(9))
+    terminals = terminator.terminals
+    terminator.create_group('left')
+    for terminal in terminals[:3]:
+        terminal.set_group(None, 'left')
+    terminator.groupsend = terminator.groupsend_type['group']
+    terminator.focus_changed(terminals[5])
+    counted = count_states(terminator, monkeypatch)
+
+    terminator.focus_changed(terminals[0])
+    assert set(counted) == set(terminals[:3] + [terminals[5]])
+    assert titles(terminator) == [TRANSMIT, RECEIVE, RECEIVE] + \
+        [INACTIVE] * 6
+
+
+def test_everything_is_restyled_after_groupsend_changes(terminator,
+                                                         monkeypatch):
+    build(terminator, 'focus', grid_layout(9))
+    terminals = terminator.terminals
+    terminator.focus_changed(terminals[0])
+    counted = count_states(terminator, monkeypatch)
+
+    terminals[0].key_broadcast_all()
+    assert set(counted) == set(terminals)
+    assert titles(terminator) == [TRANSMIT] + [RECEIVE] * 8
@@ -0,0 +1,117 @@
+"""Tests for recording macros, keeping them and playing them back. The
+terminals here are stand-ins, so no X display is needed."""
+
+import json
+import time
+
+import pytest
+from gi.repository import GLib
+
+from terminatorlib.macros import Macro, Macros, PacedPlayer
+from test_broadcast import FakeTerminal
+from test_paste import FeedTerminal
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def macros(tmp_path):
+    macros = Macros()
+    macros.filename = str(tmp_path / 'macros')
+    macros.macros = {}
+    macros.recordings = {}
+    macros.players = []
+    macros.playing = {}
+    macros.last = None
+    return(macros)
+
+
+def run_until(predicate):
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+def test_steps_close_together_are_merged():
+    macro = Macro('m', [(0.0, 'a'), (0.01, 'b'), (0.5, 'c'), (0.02, 'd')])
+    assert macro.steps == [(0.0, 'ab'), (0.5, 'cd')]
+    assert macro.is_timed()
+    assert not Macro('m', [(0.0, 'a'), (0.01, 'b')]).is_timed()
+
+
+def test_json_round_trip():
+    macro = Macro('m', [(0.0, 'ls'), (1.25, '\r'), (0.3, '\udcff')])
+    data = json.loads(json.dumps(macro.to_json()))
+    again = Macro.from_json('m', data)
+    assert again.steps == macro.steps
+    assert again.get_data() == b'ls\r\xff'
+
+
+def test_saved_macros_load_again(macros):
+    macros.macros['one'] = Macro('one', [(0.0, 'echo 1\r')])
+    macros.save()
+    macros.macros = {}
+    macros.load()
+    assert macros.list_macros() == ['one']
+    assert macros.get_macro('one').steps == [(0.0, 'echo 1\r')]
+
+
+def test_only_typed_input_is_recorded(macros):
+    terminal = FakeTerminal(mode='keys')
+    terminal.macros = macros
+    macros.start_recording(terminal, False)
+    terminal.start_typing()
+    terminal.on_commit(None, 'ls', 2)
+    terminal.stop_typing()
+    # A mouse report, sent by VTE rather than typed
+    terminal.on_commit(None, '\x1b[<0;10;5M', 11)
+    macro = macros.stop_recording(terminal, 'typed')
+    assert macro.steps == [(0.0, 'ls')]
+
+
+def test_recording_does_not_replace_unless_asked(macros):
+    terminal = FeedTerminal()
+    macros.macros['taken'] = Macro('taken', [(0.0, 'old')])
+    macros.start_recording(terminal, False)
+    macros.record(terminal, 'new')
+    assert macros.stop_recording(terminal, 'taken') is None
+    assert macros.is_recording(terminal)
+    assert macros.stop_recording(terminal, 'taken', replace=True)
+    assert macros.get_macro('taken').steps == [(0.0, 'new')]
+
+
+def test_play_at_full_speed(macros):
+    terminals = [FeedTerminal(), FeedTerminal()]
+    macros.macros['m'] = Macro('m', [(0.0, 'ls'), (0.5, '\r')])
+    assert macros.play('m', terminals) == 2
+    run_until(lambda: not macros.players)
+    for terminal in terminals:
+        assert b''.join(terminal.fed) == b'ls\r'
+    assert macros.get_playing() == []
+
+
+def test_paced_playback_keeps_the_steps_apart():
+    terminal = FeedTerminal()
+    player = PacedPlayer(Macro('m', [(0.0, 'a'), (0.1, 'b')]), [terminal])
+    finished = []
+    player.connect('finished', lambda _player: finished.append(True))
+    player.start()
+    run_until(lambda: terminal.fed)
+    assert terminal.fed == [b'a']
+    run_until(lambda: finished)
+    assert terminal.fed == [b'a', b'b']
+
+
+def test_forget_stops_paced_playback(macros):
+    closing, staying = FeedTerminal(), FeedTerminal()
+    macros.macros['m'] = Macro('m', [(0.0, 'a'), (0.1, 'b')])
+    macros.play('m', [closing, staying], paced=True)
+    run_until(lambda: closing.fed and staying.fed)
+    macros.forget(closing)
+    assert macros.get_playing() == [staying]
+    run_until(lambda: not macros.players)
+    assert closing.fed == [b'a']
+    assert staying.fed == [b'a', b'b']
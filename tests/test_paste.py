@@ -0,0 +1,159 @@
+"""Tests for writing a paste out a chunk at a time. The terminals here are
+stand-ins whose PTY is the write end of a pipe, so no X display is needed
+and a child that stops reading can be faked by filling the pipe."""
+
+import os
+import time
+
+import pytest
+from gi.repository import GLib
+
+from terminatorlib.paste import Paste, prepare_paste
+
+TIMEOUT = 5
+
+
+class FakePty(object):
+    def __init__(self, fd):
+        self.fd = fd
+
+    def get_fd(self):
+        return(self.fd)
+
+
+class FakeVte(object):
+    def __init__(self, pty=None):
+        self.pty = pty
+
+    def get_pty(self):
+        return(self.pty)
+
+
+class FeedTerminal(object):
+    """Just enough of a Terminal to be pasted into"""
+    backend = None
+
+    def __init__(self, pty=None):
+        self.vte = FakeVte(pty)
+        self.fed = []
+
+    def feed(self, data):
+        self.fed.append(data)
+
+    def paste_text(self, text):
+        self.fed.append(text)
+
+
+@pytest.fixture
+def pipe():
+    readfd, writefd = os.pipe()
+    os.set_blocking(writefd, False)
+    yield readfd, writefd
+    os.close(readfd)
+    os.close(writefd)
+
+
+def run_until(predicate):
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+def fill(fd):
+    """Fill a pipe up, as a child that has stopped reading would"""
+    try:
+        while True:
+            os.write(fd, b'x' * 65536)
+    except BlockingIOError:
+        pass
+
+
+def drain(fd):
+    os.set_blocking(fd, False)
+    try:
+        while os.read(fd, 65536):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def test_prepare_paste_keeps_lines_whole():
+    assert prepare_paste('a\r\nb\r\n') == 'a\nb\n'
+
+
+def test_every_terminal_gets_every_chunk():
+    terminals = [FeedTerminal(), FeedTerminal()]
+    paste = Paste('abcdefghij', terminals, 4)
+    progress = []
+    finished = []
+    paste.connect('progress', lambda _paste, fraction: progress.append(fraction))
+    paste.connect('finished', lambda _paste: finished.append(True))
+    paste.start()
+    run_until(lambda: finished)
+    for terminal in terminals:
+        assert terminal.fed == ['abcd', 'efgh', 'ij']
+    assert progress[-1] == 1.0
+    assert progress == sorted(progress)
+
+
+def test_bytes_are_fed():
+    terminal = FeedTerminal()
+    paste = Paste(b'\x1b[A\r', [terminal], 2)
+    paste.start()
+    run_until(lambda: not paste.sources)
+    assert terminal.fed == [b'\x1b[', b'A\r']
+
+
+def test_chunks_are_paced(pipe):
+    terminal = FeedTerminal(FakePty(pipe[1]))
+    paste = Paste('abcdef', [terminal], 2, 50)
+    start = time.monotonic()
+    paste.start()
+    run_until(lambda: not paste.sources)
+    assert terminal.fed == ['ab', 'cd', 'ef']
+    assert time.monotonic() - start >= 0.15
+
+
+def test_waits_for_the_child_to_read(pipe):
+    readfd, writefd = pipe
+    terminal = FeedTerminal(FakePty(writefd))
+    fill(writefd)
+    paste = Paste('abcd', [terminal], 2, 1)
+    paste.start()
+    deadline = time.monotonic() + 0.1
+    run_until(lambda: time.monotonic() > deadline)
+    assert terminal.fed == []
+    drain(readfd)
+    run_until(lambda: not paste.sources)
+    assert terminal.fed == ['ab', 'cd']
+
+
+def test_closed_terminal_is_dropped():
+    staying, closing = FeedTerminal(), FeedTerminal()
+    closing.vte = None
+    paste = Paste('abcd', [staying, closing], 2)
+    gone = []
+    paste.connect('terminal-finished', lambda _paste, term: gone.append(term))
+    paste.start()
+    run_until(lambda: not paste.sources)
+    assert gone[0] is closing
+    assert staying.fed == ['ab', 'cd']
+
+
+def test_cancel_stops_every_terminal():
+    terminals = [FeedTerminal(), FeedTerminal()]
+    paste = Paste('abcdefgh', terminals, 2, 20)
+    finished = []
+    paste.connect('finished', lambda _paste: finished.append(True))
+    paste.start()
+    run_until(lambda: terminals[0].fed)
+    paste.cancel()
+    assert finished == [True]
+    assert not paste.sources
+    fed = [list(terminal.fed) for terminal in terminals]
+    deadline = time.monotonic() + 0.1
+    run_until(lambda: time.monotonic() > deadline)
+    assert [terminal.fed for terminal in terminals] == fed
@@ -300,3 +300,25 @@ def test_keybinding_successfully_reassigned_after_clearing(accel_params):
     )
 
     reset_config_keybindings()
+
+
+def test_closed_preferences_stop_listening_to_the_keymap():
+    """
+    Tests that closing the Preferences window disconnects its key bindings
+    from the keymap, which lives as long as the display.
+    """
+    from gi.repository import GObject
+    from terminatorlib import terminal
+    from terminatorlib import prefseditor
+
+    term = terminal.Terminal()
+    prefs_editor = prefseditor.PrefsEditor(term=term)
+    keybindings = prefs_editor.keybindings
+    handler_id = keybindings.keys_changed_id
+    assert GObject.signal_handler_is_connected(keybindings.keymap, handler_id)
+
+    prefs_editor.window.destroy()
+
+    assert keybindings.keys_changed_id is None
+    assert not GObject.signal_handler_is_connected(keybindings.keymap,
+                                                   handler_id)
@@ -0,0 +1,61 @@
+"""Tests for how PtyBackend finds where prompt marks land. The VTE here is
+a stand-in, so no X display or daemon is needed."""
+
+from terminatorlib import ptyd
+from terminatorlib.ptybackend import PtyBackend, STATUS_REQUEST, STATUS_REPLY
+
+
+class FakeVte(object):
+    def __init__(self):
+        self.fed = []
+
+    def feed(self, data):
+        self.fed.append(data)
+
+
+class FakeTerminal(object):
+    def __init__(self):
+        self.vte = FakeVte()
+        self.marks = []
+
+    def on_prompt_mark(self, kind, argument):
+        self.marks.append((kind, argument))
+
+
+def make_backend():
+    terminal = FakeTerminal()
+    backend = PtyBackend(terminal)
+    backend.sent = []
+    backend.send = backend.sent.append
+    return(terminal, backend)
+
+
+def test_marks_wait_for_vte_to_reach_them():
+    terminal, backend = make_backend()
+    backend.feed_output(b'out\r\n\x1b]133;D;0\x07$ ')
+    # Nothing is known until VTE has worked through the output up to the
+    # mark and answered the status request fed after it
+    assert terminal.marks == []
+    assert terminal.vte.fed == [b'out\r\n\x1b]133;D;0\x07' + STATUS_REQUEST,
+                                b'$ ']
+    backend.on_commit(terminal.vte, STATUS_REPLY, len(STATUS_REPLY))
+    assert terminal.marks == [('D', '0')]
+    # Our own status requests are never answered to the child
+    assert backend.sent == []
+
+
+def test_child_status_requests_are_answered():
+    terminal, backend = make_backend()
+    backend.feed_output(b'\x1b[5n\x1b]133;A\x07')
+    backend.on_commit(terminal.vte, STATUS_REPLY, len(STATUS_REPLY))
+    assert terminal.marks == []
+    assert backend.sent == [ptyd.pack_data(STATUS_REPLY.encode('ascii'))]
+    backend.on_commit(terminal.vte, STATUS_REPLY, len(STATUS_REPLY))
+    assert terminal.marks == [('A', '')]
+    assert len(backend.sent) == 1
+
+
+def test_typed_input_is_sent():
+    terminal, backend = make_backend()
+    backend.on_commit(terminal.vte, 'ls\r', 3)
+    assert backend.sent == [ptyd.pack_data(b'ls\r')]
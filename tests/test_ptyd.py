@@ -0,0 +1,148 @@
+"""Tests for the PTY backend daemon. These start a real daemon on a private
+socket and talk to it with the same framing as PtyBackend."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from terminatorlib import ptyd
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path / 'ptyd.sock')
+    proc = subprocess.Popen([sys.executable, ptyd.__file__, '--socket', path,
+                             '--idle-exit', '1'])
+    deadline = time.monotonic() + TIMEOUT
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            proc.kill()
+            pytest.fail('daemon did not start')
+        time.sleep(0.02)
+    yield path
+    proc.terminate()
+    proc.wait(TIMEOUT)
+
+
+class Client(object):
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(TIMEOUT)
+        self.sock.connect(path)
+        self.reader = ptyd.FrameReader()
+        self.frames = []
+        self.output = b''
+
+    def send(self, message):
+        self.sock.sendall(ptyd.pack_control(message))
+
+    def write(self, data):
+        self.sock.sendall(ptyd.pack_data(data))
+
+    def receive(self):
+        data = self.sock.recv(ptyd.READ_SIZE)
+        assert data, 'daemon closed the connection'
+        self.frames.extend(self.reader.feed(data))
+
+    def event(self):
+        """Return the next control message, collecting output before it"""
+        while True:
+            while self.frames:
+                kind, payload = self.frames.pop(0)
+                if kind == ptyd.DATA:
+                    self.output += payload
+                else:
+                    return(json.loads(payload.decode('utf-8')))
+            self.receive()
+
+    def wait_for(self, text):
+        while text not in self.output:
+            while self.frames and self.frames[0][0] == ptyd.DATA:
+                self.output += self.frames.pop(0)[1]
+            if text in self.output:
+                break
+            self.receive()
+
+    def open(self, uuid, buffer_size=ptyd.DEFAULT_BUFFER_SIZE):
+        self.send({'cmd': 'open', 'uuid': uuid, 'file': '/bin/sh',
+                   'argv': ['sh', '-c', 'echo ready; exec cat'],
+                   'cwd': '/', 'env': {'PATH': os.defpath},
+                   'cols': 80, 'rows': 24, 'buffer_size': buffer_size})
+        return(self.event())
+
+    def close(self):
+        self.sock.close()
+
+
+def test_spawn_and_echo(daemon):
+    client = Client(daemon)
+    reply = client.open('urn:uuid:one')
+    assert reply['event'] == 'spawned'
+    client.wait_for(b'ready')
+    client.write(b'hello\n')
+    client.wait_for(b'hello')
+    client.close()
+
+
+def test_reattach_replays_output(daemon):
+    first = Client(daemon)
+    spawned = first.open('urn:uuid:two')
+    first.wait_for(b'ready')
+    first.write(b'marker\n')
+    first.wait_for(b'marker')
+    first.close()
+
+    second = Client(daemon)
+    attached = second.open('urn:uuid:two')
+    assert attached == {'event': 'attached', 'pid': spawned['pid']}
+    second.wait_for(b'marker')
+    second.close()
+
+
+def test_detach_leaves_session_running(daemon):
+    first = Client(daemon)
+    spawned = first.open('urn:uuid:five')
+    first.wait_for(b'ready')
+    first.send({'cmd': 'detach'})
+    first.send({'cmd': 'list'})
+    sessions = first.event()['sessions']
+    assert [(item['pid'], item['attached']) for item in sessions] == \
+        [(spawned['pid'], False)]
+    first.close()
+
+    second = Client(daemon)
+    attached = second.open('urn:uuid:five')
+    assert attached == {'event': 'attached', 'pid': spawned['pid']}
+    second.write(b'again\n')
+    second.wait_for(b'again')
+    second.close()
+
+
+def test_buffer_is_bounded(daemon):
+    client = Client(daemon)
+    client.open('urn:uuid:three', buffer_size=64)
+    client.wait_for(b'ready')
+    client.write(b'x' * 200 + b'\n')
+    client.wait_for(b'x' * 200)
+    client.send({'cmd': 'list'})
+    sessions = client.event()['sessions']
+    assert [item['buffered'] for item in sessions] == [64]
+    client.close()
+
+
+def test_kill_reports_exit(daemon):
+    client = Client(daemon)
+    client.open('urn:uuid:four')
+    client.wait_for(b'ready')
+    client.send({'cmd': 'kill'})
+    assert client.event()['event'] == 'exited'
+    client.send({'cmd': 'list'})
+    assert client.event()['sessions'] == []
+    client.close()
@@ -0,0 +1,130 @@
+"""Tests for scaling the wheel and flinging the view. The terminals here are
+stand-ins that borrow the methods of Terminal, so no X display is needed."""
+
+from gi.repository import Gdk
+
+from terminatorlib.scroller import Scroller
+from terminatorlib.terminal import Terminal
+
+
+class FakeAdjustment(object):
+    def __init__(self, value=990.0):
+        self.value = value
+
+    def get_value(self):
+        return(self.value)
+
+    def get_upper(self):
+        return(1000.0)
+
+    def get_page_size(self):
+        return(24.0)
+
+    def get_page_increment(self):
+        return(24.0)
+
+
+class FakeVte(object):
+    def __init__(self):
+        self.adjustment = FakeAdjustment()
+        self.ticks = []
+
+    def get_vadjustment(self):
+        return(self.adjustment)
+
+    def add_tick_callback(self, callback):
+        self.ticks.append(callback)
+        return(len(self.ticks))
+
+    def remove_tick_callback(self, tick_id):
+        pass
+
+
+class FakeEvent(object):
+    """A GdkEventScroll, as our handler passes it on to VTE"""
+    state = 0
+
+    def __init__(self, direction, time, delta_y=0.0, stop=False):
+        self.direction = direction
+        self.time = time
+        self.delta_y = delta_y
+        self.stop = stop
+
+    def is_scroll_stop_event(self):
+        return(self.stop)
+
+
+class FakeTerminal(object):
+    on_mousewheel = Terminal.on_mousewheel
+
+    def __init__(self, speed=1, kinetic=True):
+        self.config = {'scroll_speed': speed, 'kinetic_scrolling': kinetic}
+        self.vte = FakeVte()
+        self.scroller = Scroller(self)
+
+
+def notch(terminal, time):
+    event = FakeEvent(Gdk.ScrollDirection.UP, time)
+    assert terminal.on_mousewheel(terminal.vte, event) is False
+    return(event)
+
+
+def test_single_wheel_steps_are_scaled():
+    terminal = FakeTerminal(speed=3)
+    # Notches far enough apart to never make a burst
+    for time in (0, 500, 1000):
+        event = notch(terminal, time)
+        assert event.direction == Gdk.ScrollDirection.SMOOTH
+        assert event.delta_y == -3
+
+
+def test_part_notches_are_scaled():
+    terminal = FakeTerminal(speed=0.5)
+    event = notch(terminal, 0)
+    assert event.direction == Gdk.ScrollDirection.SMOOTH
+    assert event.delta_y == -0.5
+
+
+def test_first_smooth_event_is_scaled():
+    terminal = FakeTerminal(speed=2)
+    event = FakeEvent(Gdk.ScrollDirection.SMOOTH, 0, delta_y=0.1)
+    terminal.on_mousewheel(terminal.vte, event)
+    assert event.delta_y == 0.2
+
+
+def test_normal_speed_leaves_the_event_alone():
+    terminal = FakeTerminal()
+    event = notch(terminal, 0)
+    assert event.direction == Gdk.ScrollDirection.UP
+
+
+def test_fling_after_the_view_moved():
+    terminal = FakeTerminal()
+    for num in range(10):
+        event = FakeEvent(Gdk.ScrollDirection.SMOOTH, num * 4, delta_y=-0.5)
+        terminal.on_mousewheel(terminal.vte, event)
+        terminal.vte.adjustment.value -= 1
+    event = FakeEvent(Gdk.ScrollDirection.SMOOTH, 40, stop=True)
+    terminal.on_mousewheel(terminal.vte, event)
+    assert terminal.scroller.velocity < 0
+    assert len(terminal.vte.ticks) == 1
+
+
+def test_no_fling_when_a_program_had_the_wheel():
+    terminal = FakeTerminal()
+    for num in range(10):
+        event = FakeEvent(Gdk.ScrollDirection.SMOOTH, num * 4, delta_y=-0.5)
+        terminal.on_mousewheel(terminal.vte, event)
+    event = FakeEvent(Gdk.ScrollDirection.SMOOTH, 40, stop=True)
+    terminal.on_mousewheel(terminal.vte, event)
+    assert terminal.scroller.velocity == 0
+    assert terminal.vte.ticks == []
+
+
+def test_wheel_stops_a_fling():
+    terminal = FakeTerminal()
+    terminal.scroller.velocity = -50.0
+    terminal.scroller.schedule()
+    notch(terminal, 100)
+    assert terminal.scroller.velocity == 0
+    assert terminal.scroller.tick_id is None
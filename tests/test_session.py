@@ -0,0 +1,126 @@
+"""Tests for saving the session on a timer and on exit. The terminals here
+are stand-ins, so no X display is needed."""
+
+import json
+import os
+import uuid
+
+import pytest
+
+from terminatorlib.session import SESSION_LAYOUT_NAME, SESSION_VERSION, \
+    SessionStore
+
+
+class FakeConfig(dict):
+    def __init__(self, save_session=True, interval=60):
+        dict.__init__(self, save_session=save_session,
+                      session_save_interval=interval)
+        self.layouts = {}
+
+    def layout_set_config(self, name, layout):
+        self.layouts[name] = layout
+
+
+class FakeTerminal(object):
+    vte = None
+    command = None
+
+    def __init__(self, directory):
+        self.uuid = uuid.uuid4()
+        self.directory = directory
+
+    def get_cwd(self):
+        return(self.directory)
+
+
+class FakeTerminator(object):
+    def __init__(self, terminals):
+        self.terminals = terminals
+
+    def describe_layout(self):
+        layout = {'window0': {'type': 'Window', 'parent': '', 'order': 0,
+                              'size': (800, 600)}}
+        for num, terminal in enumerate(self.terminals):
+            layout['terminal%d' % (num + 1)] = {
+                'type': 'Terminal', 'parent': 'window0', 'order': num,
+                'uuid': terminal.uuid, 'group': None}
+        return(layout)
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """A SessionStore saving into a temporary directory. Its shared state is
+    put back afterwards"""
+    store = SessionStore()
+    monkeypatch.setattr(store, 'config', FakeConfig())
+    monkeypatch.setattr(store, 'terminator',
+                        FakeTerminator([FakeTerminal('/tmp')]))
+    monkeypatch.setattr(store, 'filename', str(tmp_path / 'session'))
+    monkeypatch.setattr(store, 'timeout_id', None)
+    yield store
+    if store.timeout_id is not None:
+        from gi.repository import GObject
+        GObject.source_remove(store.timeout_id)
+
+
+def read(store):
+    with open(store.filename) as fileobj:
+        return(json.load(fileobj))
+
+
+def test_autosave_does_nothing_unless_configured(store):
+    store.config['save_session'] = False
+    assert store.autosave() is False
+    assert not os.path.exists(store.filename)
+
+
+def test_autosave_writes_the_snapshot(store):
+    assert store.autosave() is True
+    data = read(store)
+    assert data['version'] == SESSION_VERSION
+    terminal = data['layout']['terminal1']
+    assert terminal['directory'] == '/tmp'
+    assert terminal['uuid'] == str(store.terminator.terminals[0].uuid)
+    assert 'group' not in terminal
+    assert data['layout']['window0']['size'] == ['800', '600']
+
+
+def test_nothing_is_saved_without_terminals(store):
+    store.terminator.terminals = []
+    assert store.autosave() is False
+    assert not os.path.exists(store.filename)
+
+
+def test_failed_save_keeps_the_previous_session(store, tmp_path):
+    assert store.save() is True
+    previous = read(store)
+    os.chmod(str(tmp_path), 0o500)
+    try:
+        if os.access(str(tmp_path), os.W_OK):
+            pytest.skip('running as a user that ignores permissions')
+        store.terminator.terminals[0].directory = '/'
+        assert store.autosave() is False
+    finally:
+        os.chmod(str(tmp_path), 0o700)
+    assert read(store) == previous
+    assert os.listdir(str(tmp_path)) == ['session']
+
+
+def test_saved_session_loads_as_a_layout(store):
+    store.save()
+    assert store.load() == SESSION_LAYOUT_NAME
+    assert store.config.layouts[SESSION_LAYOUT_NAME] == read(store)['layout']
+
+
+def test_timer_only_runs_when_configured(store):
+    store.config['save_session'] = False
+    store.start()
+    assert store.timeout_id is None
+
+    store.config['save_session'] = True
+    store.start()
+    assert store.timeout_id is not None
+
+    store.config['session_save_interval'] = 0
+    store.start()
+    assert store.timeout_id is None
@@ -0,0 +1,73 @@
+"""Tests for the tree model each Window keeps of its containers and
+terminals. Like the benchmarks, these need an X display."""
+
+import uuid
+
+from conftest import flush_events
+from test_benchmark_layout import LayoutBuilder, build, terminator
+
+NAMES = 'ABCDE'
+
+
+def nested_layout():
+    """HPaned(VPaned(A, HPaned(B, C)), VPaned(D, E)), where the terminals
+    are at different depths so that depth first and breadth first differ"""
+    builder = LayoutBuilder()
+    window = builder.node('Window', None, 0, size=[1600, 1000])
+    root = builder.node('HPaned', window, 0)
+    left = builder.node('VPaned', root, 0)
+    right = builder.node('VPaned', root, 1)
+    inner = builder.node('HPaned', left, 1)
+    for name, parent, order in [('A', left, 0), ('B', inner, 0),
+                                ('C', inner, 1), ('D', right, 0),
+                                ('E', right, 1)]:
+        builder.node('Terminal', parent, order,
+                     uuid=str(uuid.uuid5(uuid.NAMESPACE_OID, name)))
+    return(builder.layout)
+
+
+def names(terminals):
+    lookup = dict([(uuid.uuid5(uuid.NAMESPACE_OID, name), name)
+                   for name in NAMES])
+    return(''.join([lookup.get(term.uuid, '?') for term in terminals]))
+
+
+def test_terminals_are_in_layout_order(terminator):
+    window = build(terminator, 'order', nested_layout())
+    assert names(window.get_tree_model()[1]) == 'ABCDE'
+
+    # Cycling goes through them in the same order, not breadth first
+    terminals = window.get_tree_model()[1]
+    terminals[0].grab_focus()
+    flush_events()
+    visited = []
+    for _ in NAMES:
+        window.get_focussed_terminal().key_go_next()
+        flush_events()
+        visited.append(window.get_focussed_terminal())
+    assert names(visited) == 'BCDEA'
+
+
+def test_model_is_updated_in_place(terminator):
+    from terminatorlib.util import walk_descendants
+
+    window = build(terminator, 'order', nested_layout())
+    containers, terminals, spans = window.get_tree_model()
+    terminals[2].key_split_vert()
+    flush_events()
+
+    # The same lists were spliced, rather than the model being rebuilt
+    model = window.get_tree_model()
+    assert model[0] is containers and model[1] is terminals
+    assert model == walk_descendants(window)
+    assert names(terminals[:3]) == 'ABC' and names(terminals[4:]) == 'DE'
+
+
+def test_terminal_numbers_are_in_layout_order(terminator):
+    window = build(terminator, 'order', nested_layout())
+    numbers = terminator.get_terminal_numbers()
+    # Numbered one after another, depth first rather than A, D, E, B, C
+    terminals = window.get_tree_model()[1]
+    first = numbers[terminals[0]]
+    assert names(terminals) == 'ABCDE'
+    assert [numbers[term] - first for term in terminals] == [0, 1, 2, 3, 4]